@@ -1,14 +1,56 @@
 import os
+import concurrency
+# Green-thread modes must patch the standard library before anything else is imported
+concurrency.monkey_patch()
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
+from flask_migrate import Migrate, upgrade
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from message_writer import MessageWriter
+from status_buffer import StatusBuffer
+from hashing import PasswordHasher
+from token_cache import CachingJWTManager
+from metrics import Metrics
+from sql_profiler import SQLProfiler
+from archive import MessageArchive
+from recent_messages import RecentMessages
+from compression import Compressor
+from json_provider import init_json
+from log_pipeline import get_logger, init_logging, parse_pairs
 from flask_socketio import SocketIO
 
 # Create the SQLAlchemy instance
 db = SQLAlchemy()
 # Create the SocketIO instance
 socketio = SocketIO()
+# Create the Migrate instance
+migrate = Migrate()
+# Create the group-commit message writer
+message_writer = MessageWriter()
+# Create the write-behind buffer for online status
+status_buffer = StatusBuffer()
+# Create the process-pool password hasher
+password_hasher = PasswordHasher()
+# Create the Prometheus metrics registry
+metrics = Metrics()
+# Create the opt-in SQL profiler
+sql_profiler = SQLProfiler()
+# Create the cold-history archive
+message_archive = MessageArchive()
+# Create the response compressor
+compressor = Compressor()
+# Create the in-memory buffers of recent channel history
+recent_messages = RecentMessages()
+
+def schema_is_current():
+    """True if the database has every migration applied (needs an app context)"""
+    script = ScriptDirectory.from_config(migrate.get_config())
+    with db.engine.connect() as connection:
+        return set(MigrationContext.configure(connection).get_current_heads()) == set(script.get_heads())
 
 def create_app():
     app = Flask(__name__)
@@ -19,12 +61,103 @@ def create_app():
     # Config
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///chat.db")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Upgrade the schema while creating the app. For single-process development only;
+    # deployments run `flask db upgrade` once as a release step instead
+    app.config["AUTO_MIGRATE"] = os.environ.get("AUTO_MIGRATE", "").lower() in ("1", "true", "yes")
     app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "supersecretkey")
+    # Verified tokens kept in memory (0 disables the cache)
+    app.config["JWT_CACHE_SIZE"] = int(os.environ.get("JWT_CACHE_SIZE", 10000))
+    # History pagination
+    app.config["MESSAGES_PAGE_SIZE"] = int(os.environ.get("MESSAGES_PAGE_SIZE", 50))
+    app.config["MESSAGES_MAX_PAGE_SIZE"] = int(os.environ.get("MESSAGES_MAX_PAGE_SIZE", 500))
+    # Recent history kept in memory per channel (0 disables), for the most recently read channels
+    app.config["RECENT_MESSAGES_PER_CHANNEL"] = int(os.environ.get("RECENT_MESSAGES_PER_CHANNEL", 200))
+    app.config["RECENT_MESSAGES_MAX_CHANNELS"] = int(os.environ.get("RECENT_MESSAGES_MAX_CHANNELS", 256))
+    app.config["RECENT_MESSAGES_MAX_BYTES"] = int(os.environ.get("RECENT_MESSAGES_MAX_BYTES", 32 * 1024 * 1024))
+    # JSON encoding: "auto" uses orjson when installed, else Flask's default provider
+    app.config["JSON_PROVIDER"] = os.environ.get("JSON_PROVIDER", "auto")
+    # Responses of at least COMPRESS_MIN_SIZE bytes are gzip/brotli-compressed (-1 disables)
+    app.config["COMPRESS_MIN_SIZE"] = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+    app.config["COMPRESS_GZIP_LEVEL"] = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+    app.config["COMPRESS_BROTLI_QUALITY"] = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 4))
+    # Channel export streams this many messages per chunk
+    app.config["EXPORT_CHUNK_SIZE"] = int(os.environ.get("EXPORT_CHUNK_SIZE", 1000))
+    # Typing indicators
+    app.config["TYPING_TIMEOUT"] = float(os.environ.get("TYPING_TIMEOUT", 5.0))
+    app.config["TYPING_BROADCAST_INTERVAL_MS"] = int(os.environ.get("TYPING_BROADCAST_INTERVAL_MS", 500))
+    # Group commit for new messages
+    app.config["MESSAGE_BATCH_MAX_SIZE"] = int(os.environ.get("MESSAGE_BATCH_MAX_SIZE", 100))
+    app.config["MESSAGE_BATCH_MAX_DELAY_MS"] = float(os.environ.get("MESSAGE_BATCH_MAX_DELAY_MS", 5))
+    # Write-behind for is_online / last_seen
+    app.config["STATUS_FLUSH_INTERVAL"] = float(os.environ.get("STATUS_FLUSH_INTERVAL", 2.0))
+    # Password hashing pool per server process (PASSWORD_HASH_WORKERS=0 hashes inline). Kept small:
+    # every gunicorn worker forks its own pool, so a per-CPU default would mean CPUs² processes
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+    app.config["PASSWORD_HASH_MAX_QUEUE"] = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", 64))
+    app.config["PASSWORD_HASH_QUEUE_TIMEOUT"] = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT", 5.0))
+    # Message search: "auto" uses the SQLite FTS5 index when present, else LIKE
+    app.config["SEARCH_BACKEND"] = os.environ.get("SEARCH_BACKEND", "auto")
+    app.config["SEARCH_PAGE_SIZE"] = int(os.environ.get("SEARCH_PAGE_SIZE", 20))
+    app.config["SEARCH_MAX_PAGE_SIZE"] = int(os.environ.get("SEARCH_MAX_PAGE_SIZE", 100))
+    # Channel deletion: purge in chunks, in the background above the threshold
+    app.config["CHANNEL_DELETE_CHUNK_SIZE"] = int(os.environ.get("CHANNEL_DELETE_CHUNK_SIZE", 1000))
+    app.config["CHANNEL_DELETE_PAUSE_MS"] = float(os.environ.get("CHANNEL_DELETE_PAUSE_MS", 10))
+    app.config["CHANNEL_DELETE_BACKGROUND_THRESHOLD"] = int(os.environ.get("CHANNEL_DELETE_BACKGROUND_THRESHOLD", 5000))
+
+    # Cold tier: `flask archive run` moves messages older than ARCHIVE_AFTER_DAYS into
+    # compressed per-channel segment files under ARCHIVE_DIR (default instance/archive)
+    app.config["ARCHIVE_DIR"] = os.environ.get("ARCHIVE_DIR")
+    app.config["ARCHIVE_AFTER_DAYS"] = float(os.environ.get("ARCHIVE_AFTER_DAYS", 90))
+    app.config["ARCHIVE_BLOCK_SIZE"] = int(os.environ.get("ARCHIVE_BLOCK_SIZE", 500))
+    # Per-request SQL profiling and N+1 detection (development only)
+    app.config["SQL_PROFILING"] = os.environ.get("SQL_PROFILING", "").lower() in ("1", "true", "yes")
+    app.config["SQL_PROFILE_HEADERS"] = os.environ.get("SQL_PROFILE_HEADERS", "").lower() in ("1", "true", "yes")
+    app.config["SQL_N_PLUS_ONE_THRESHOLD"] = int(os.environ.get("SQL_N_PLUS_ONE_THRESHOLD", 3))
+
+    # Logging: JSON lines written from a queue by a background thread. LOG_LEVELS sets
+    # levels per subsystem ("socket=DEBUG,presence=WARNING"), LOG_SAMPLE keeps a
+    # share of high-frequency records ("socket.typing=0.01")
+    development = os.environ.get("FLASK_ENV") == "development"
+    app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO").upper()
+    app.config["LOG_LEVELS"] = parse_pairs(os.environ.get("LOG_LEVELS"), str.upper)
+    app.config["LOG_SAMPLE"] = parse_pairs(os.environ.get("LOG_SAMPLE", "socket.typing=0.01"), float)
+    app.config["LOG_FORMAT"] = os.environ.get("LOG_FORMAT", "json")
+    # Per-packet Socket.IO / Engine.IO logging; very verbose, so only on by default in development
+    app.config["SOCKETIO_LOGGER"] = os.environ.get("SOCKETIO_LOGGER", str(development)).lower() in ("1", "true", "yes")
+    app.config["ENGINEIO_LOGGER"] = os.environ.get("ENGINEIO_LOGGER", str(development)).lower() in ("1", "true", "yes")
+
+    # Scale-out: a message queue (e.g. redis://) fans Socket.IO broadcasts out across
+    # workers and nodes, and a shared presence store keeps online lists consistent
+    app.config["SOCKETIO_MESSAGE_QUEUE"] = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+    app.config["PRESENCE_STORE_URL"] = os.environ.get("PRESENCE_STORE_URL")
+    if not app.config["PRESENCE_STORE_URL"] and (app.config["SOCKETIO_MESSAGE_QUEUE"] or "").startswith("redis"):
+        app.config["PRESENCE_STORE_URL"] = app.config["SOCKETIO_MESSAGE_QUEUE"]
+    # Seconds a socket's presence survives without being renewed by its worker
+    app.config["PRESENCE_TTL"] = float(os.environ.get("PRESENCE_TTL", 60))
+
+    init_logging(app)
 
     # Initialize extensions
     db.init_app(app)
-    JWTManager(app)
-    socketio.init_app(app, cors_allowed_origins="*", async_mode='threading', logger=True, engineio_logger=True)
+    migrate.init_app(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"), render_as_batch=True)
+    CachingJWTManager(app)
+    metrics.init_app(app, db)
+    sql_profiler.init_app(app, db)
+    # Registered after the metrics hooks so that compression time is part of request latency
+    compressor.init_app(app)
+    init_json(app)
+    metrics.gauge("jwt_cache_entries", "Verified tokens in the JWT cache", lambda: app.token_cache.stats()["size"])
+    metrics.gauge("jwt_cache_hits_total", "Token decodes served from the cache", lambda: app.token_cache.hits, "counter")
+    metrics.gauge("jwt_cache_misses_total", "Token decodes that were fully verified", lambda: app.token_cache.misses, "counter")
+    metrics.gauge("recent_messages_channels", "Channels with recent history in memory", lambda: recent_messages.stats()["channels"])
+    metrics.gauge("recent_messages_bytes", "Approximate memory held by recent history", lambda: recent_messages.stats()["bytes"])
+    metrics.gauge("recent_messages_hits_total", "History pages served from memory", lambda: recent_messages.hits, "counter")
+    metrics.gauge("recent_messages_misses_total", "History pages that went to the database", lambda: recent_messages.misses, "counter")
+    socketio.init_app(app, cors_allowed_origins="*", async_mode=concurrency.ASYNC_MODE,
+                      logger=app.config["SOCKETIO_LOGGER"] and get_logger("socketio"),
+                      engineio_logger=app.config["ENGINEIO_LOGGER"] and get_logger("engineio"),
+                      message_queue=app.config["SOCKETIO_MESSAGE_QUEUE"])
 
     # Add a simple test route
     @app.route('/')
@@ -57,15 +190,36 @@ def create_app():
         app.Message = Message
         app.Reaction = Reaction
         app.db = db
+        message_writer.init_app(app)
+        status_buffer.init_app(app)
+        password_hasher.init_app(app)
+        message_archive.init_app(app)
+        recent_messages.init_app(app)
+        
+        if app.config["AUTO_MIGRATE"]:
+            upgrade()  # create or migrate database tables
         
-        db.create_all()  # create database tables
+        # Full-text search over messages
+        from search import create_search_index, register_commands
+        app.search_index = create_search_index(app)
+        register_commands(app)
         
-        # Create default channel if none exist
-        if Channel.query.count() == 0:
-            default_channel = Channel(name="General")
-            db.session.add(default_channel)
-            db.session.commit()
-            print("Created default 'General' channel")
+        if schema_is_current():
+            # Finish deleting channels whose purge was interrupted by a restart
+            from channel_deletion import resume_pending_purges
+            resume_pending_purges(app)
+            
+            # Create default channel if none exist
+            if Channel.query.count() == 0:
+                try:
+                    db.session.add(Channel(name="General"))
+                    db.session.commit()
+                    get_logger("app").info("Created default 'General' channel")
+                except IntegrityError:
+                    # Another worker starting at the same time created it first
+                    db.session.rollback()
+        else:
+            get_logger("app").warning("Database schema is not up to date; run `flask db upgrade`")
 
     # Import and register blueprints AFTER models are initialized
     from routes import auth_bp, chat_bp
@@ -74,19 +228,25 @@ def create_app():
     
     # Import socket events to register them
     import socket_events
-    socket_events.init_socket_events(socketio, db)
+    socket_events.init_socket_events(socketio, db, app.config, metrics, sql_profiler)
 
     return app
 
 if __name__ == "__main__":
     try:
         print("Starting Flask app...")
+        # A single development process can migrate the database itself
+        os.environ.setdefault("AUTO_MIGRATE", "1")
         app = create_app()
         print("App created successfully")
         port = int(os.environ.get("PORT", 8000))
         debug = os.environ.get("FLASK_ENV") == "development"
         print(f"Starting server on port {port}, debug={debug}")
-        socketio.run(app, debug=True, port=port, host='0.0.0.0', allow_unsafe_werkzeug=True)
+        if concurrency.ASYNC_MODE == "threading":
+            socketio.run(app, debug=True, port=port, host='0.0.0.0', allow_unsafe_werkzeug=True)
+        else:
+            # gevent serves the app with its own cooperative WSGI server
+            socketio.run(app, debug=debug, use_reloader=False, port=port, host='0.0.0.0')
     except Exception as e:
         print(f"Error starting app: {e}")
         import traceback
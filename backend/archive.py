@@ -0,0 +1,408 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import delete, or_, and_
+
+from reactions import format_summary, insert_ignore, summary_complete
+from sync import bump_versions, channel_resource
+
+EPOCH = datetime(1970, 1, 1)
+
+# One entry per compressed block in a channel's segment file:
+# min id, max id, first timestamp, last timestamp (µs since epoch), offset, length, message count
+INDEX_ENTRY = struct.Struct("<qqqqQII")
+
+
+def to_micros(timestamp):
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class ArchiveConflict(Exception):
+    """Raised when archived messages can't be restored because their ids are taken"""
+
+
+class IndexEntry:
+    __slots__ = ("min_id", "max_id", "first_ts", "last_ts", "offset", "length", "count")
+
+    def __init__(self, min_id, max_id, first_ts, last_ts, offset, length, count):
+        self.min_id, self.max_id = min_id, max_id
+        self.first_ts, self.last_ts = first_ts, last_ts
+        self.offset, self.length, self.count = offset, length, count
+
+
+class ColdMessage:
+    """A message read outside the message table, shaped like the (message, username) rows history is built from
+
+    Used for archived messages and for the in-memory copies of recent history.
+    """
+
+    __slots__ = ("id", "channel_id", "user_id", "username", "content", "timestamp", "reaction_summary", "seq",
+                 "reactions")
+
+    def __init__(self, channel_id, record):
+        self.id = record["id"]
+        self.channel_id = channel_id
+        self.user_id = record["user_id"]
+        self.username = record["user"]
+        self.content = record["content"]
+        self.timestamp = from_micros(record["ts"])
+        self.reaction_summary = record.get("summary")
+        self.seq = record.get("seq")
+        self.reactions = record.get("reactions") or []  # [[emoji, user_id, username, timestamp µs]]
+
+    def to_dict(self, current_user_id):
+        if summary_complete(self.reaction_summary):
+            reactions = format_summary(self.reaction_summary, current_user_id)
+        else:
+            reactions = {}
+            for emoji, user_id, username, _ in self.reactions:
+                if emoji and emoji.strip() != "":
+                    reactions.setdefault(emoji, []).append("You" if user_id == current_user_id else username)
+        return {
+            "id": self.id,
+            "content": self.content,
+            "user": self.username,
+            "time": self.timestamp.isoformat(),
+            "reactions": reactions
+        }
+
+
+def message_record(message, username, reactions=()):
+    """The stored form of a message row (see `ColdMessage`)"""
+    return {
+        "id": message.id,
+        "user_id": message.user_id,
+        "user": username,
+        "content": message.content,
+        "ts": to_micros(message.timestamp),
+        "summary": message.reaction_summary,
+        "seq": message.seq,
+        "reactions": list(reactions)
+    }
+
+
+def reaction_records(db, User, Reaction, message_ids):
+    """Every reaction on the given messages, as {message_id: [[emoji, user_id, username, timestamp µs]]}"""
+    records = {}
+    for message_id, emoji, user_id, username, timestamp in db.session.query(
+            Reaction.message_id, Reaction.emoji, Reaction.user_id, User.username, Reaction.timestamp) \
+            .join(User, Reaction.user_id == User.id).filter(Reaction.message_id.in_(message_ids)).order_by(Reaction.id):
+        records.setdefault(message_id, []).append([emoji, user_id, username, to_micros(timestamp)])
+    return records
+
+
+def row_message(row):
+    """The message of a history row: a hot (message, username) tuple or a ColdMessage"""
+    return row if isinstance(row, ColdMessage) else row[0]
+
+
+def history_key(row):
+    message = row_message(row)
+    return (message.timestamp, message.id)
+
+
+def merge_history(hot, cold, limit=None, key=history_key, newest_first=False):
+    """Merge hot rows and cold messages (each already sorted by `key`) into one page
+
+    A message that is in both tiers (an archive run interrupted before its
+    delete) is taken from the hot table.
+    """
+    hot_ids = {row_message(row).id for row in hot}
+    rows = sorted(hot + [message for message in cold if message.id not in hot_ids], key=key, reverse=newest_first)
+    return rows if limit is None else rows[:limit]
+
+
+class MessageArchive:
+    """Cold tier of channel history: per-channel append-only segment files
+
+    `channel_<id>.seg` holds zlib-compressed JSON blocks of messages (with
+    their reactions) in (timestamp, id) order; `channel_<id>.idx` holds one
+    fixed-size `INDEX_ENTRY` per block. Segments are read through mmap and
+    recently decoded blocks are kept in a small LRU. Archived messages are
+    read-only.
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.block_size = 500
+        self._indexes = {}  # {channel_id: ((inode, index file size), [IndexEntry])}
+        self._maps = {}     # {channel_id: mmap}
+        self._blocks = OrderedDict()  # {(channel_id, offset): [ColdMessage]}
+        self._lock = threading.RLock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get("ARCHIVE_DIR") or os.path.join(app.instance_path, "archive")
+        self.block_size = app.config.get("ARCHIVE_BLOCK_SIZE", 500)
+        app.message_archive = self
+        register_commands(app)
+
+    def _path(self, channel_id, suffix):
+        return os.path.join(self.directory, f"channel_{channel_id}.{suffix}")
+
+    # Reading
+
+    def index(self, channel_id):
+        """The channel's block index (empty if nothing is archived)"""
+        try:
+            stat = os.stat(self._path(channel_id, "idx"))
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            cached = self._indexes.get(channel_id)
+            if cached is not None and cached[0] == (stat.st_ino, stat.st_size):
+                return cached[1]
+            if cached is not None and (cached[0][0] != stat.st_ino or cached[0][1] > stat.st_size):
+                # Restored and archived again by another process: cached blocks are stale
+                self._forget(channel_id)
+            with open(self._path(channel_id, "idx"), "rb") as f:
+                data = f.read(stat.st_size - stat.st_size % INDEX_ENTRY.size)
+            entries = [IndexEntry(*fields) for fields in INDEX_ENTRY.iter_unpack(data)]
+            self._indexes[channel_id] = ((stat.st_ino, stat.st_size), entries)
+            return entries
+
+    def _forget(self, channel_id):
+        segment = self._maps.pop(channel_id, None)
+        if segment is not None:
+            segment.close()
+        self._indexes.pop(channel_id, None)
+        for key in [key for key in self._blocks if key[0] == channel_id]:
+            del self._blocks[key]
+
+    def block(self, channel_id, entry):
+        """Decode one block (cached)"""
+        key = (channel_id, entry.offset)
+        with self._lock:
+            messages = self._blocks.get(key)
+            if messages is not None:
+                self._blocks.move_to_end(key)
+                return messages
+            segment = self._maps.get(channel_id)
+            if segment is None or len(segment) < entry.offset + entry.length:
+                if segment is not None:
+                    segment.close()
+                with open(self._path(channel_id, "seg"), "rb") as f:
+                    segment = self._maps[channel_id] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            records = json.loads(zlib.decompress(segment[entry.offset:entry.offset + entry.length]))
+            messages = [ColdMessage(channel_id, record) for record in records]
+            self._blocks[key] = messages
+            while len(self._blocks) > 64:
+                self._blocks.popitem(last=False)
+            return messages
+
+    def newest(self, channel_id):
+        """Timestamp of the newest archived message (None if nothing is archived)"""
+        index = self.index(channel_id)
+        return from_micros(index[-1].last_ts) if index else None
+
+    def get(self, channel_id, message_id):
+        for entry in self.index(channel_id):
+            if entry.min_id <= message_id <= entry.max_id:
+                for message in self.block(channel_id, entry):
+                    if message.id == message_id:
+                        return message
+        return None
+
+    def before(self, channel_id, cursor=None, limit=50):
+        """Up to `limit` messages older than `cursor` (a (timestamp, id) key), newest first"""
+        found = []
+        bound = cursor and (to_micros(cursor[0]), cursor[1])
+        for entry in reversed(self.index(channel_id)):
+            if bound is not None and entry.first_ts > bound[0]:
+                continue
+            for message in reversed(self.block(channel_id, entry)):
+                if bound is None or (to_micros(message.timestamp), message.id) < bound:
+                    found.append(message)
+                    if len(found) == limit:
+                        return found
+        return found
+
+    def after(self, channel_id, cursor, limit=50):
+        """Up to `limit` messages newer than `cursor` (a (timestamp, id) key), oldest first"""
+        found = []
+        bound = (to_micros(cursor[0]), cursor[1])
+        for entry in self.index(channel_id):
+            if entry.last_ts < bound[0]:
+                continue
+            for message in self.block(channel_id, entry):
+                if (to_micros(message.timestamp), message.id) > bound:
+                    found.append(message)
+                    if len(found) == limit:
+                        return found
+        return found
+
+    def since(self, channel_id, message_id, limit=50):
+        """Up to `limit` messages with an id above `message_id`, in id order"""
+        found = [message for entry in self.index(channel_id) if entry.max_id > message_id
+                 for message in self.block(channel_id, entry) if message.id > message_id]
+        found.sort(key=lambda message: message.id)
+        return found[:limit]
+
+    def all(self, channel_id):
+        """Every archived message of a channel, oldest first"""
+        for entry in self.index(channel_id):
+            yield from self.block(channel_id, entry)
+
+    # Writing
+
+    def append(self, channel_id, records):
+        """Append one block; the segment is synced before the index entry that points into it"""
+        os.makedirs(self.directory, exist_ok=True)
+        data = zlib.compress(json.dumps(records, separators=(",", ":")).encode(), 6)
+        with self._lock:
+            with open(self._path(channel_id, "seg"), "ab") as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            ids = [record["id"] for record in records]
+            entry = INDEX_ENTRY.pack(min(ids), max(ids), records[0]["ts"], records[-1]["ts"], offset, len(data), len(records))
+            with open(self._path(channel_id, "idx"), "ab") as f:
+                f.write(entry)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def remove(self, channel_id):
+        """Delete a channel's archive files"""
+        with self._lock:
+            self._forget(channel_id)
+            for suffix in ("idx", "seg"):
+                try:
+                    os.unlink(self._path(channel_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def channels(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[len("channel_"):-len(".idx")]) for name in os.listdir(self.directory)
+                      if name.startswith("channel_") and name.endswith(".idx"))
+
+
+def archive_channel(app, channel_id, cutoff):
+    """Move a channel's messages older than `cutoff` from the message table into its archive
+
+    Returns the number of messages archived.
+    """
+    archive, db = app.message_archive, app.db
+    User, Message, Reaction = app.User, app.Message, app.Reaction
+    index = archive.index(channel_id)
+    tail = None
+    if index:
+        last_block = archive.block(channel_id, index[-1])
+        tail = (last_block[-1].timestamp, last_block[-1].id)
+        # A run interrupted between writing a block and deleting its rows leaves them in both tiers
+        app.search_index.add_archived(channel_id, last_block)
+        delete_messages(db, Message, Reaction, [message.id for message in last_block])
+
+    # Message ids are never reused (AUTOINCREMENT), so an archived id can't reappear in the table
+    archived = 0
+    while True:
+        query = db.session.query(Message, User.username).join(User, Message.user_id == User.id) \
+            .filter(Message.channel_id == channel_id, Message.timestamp < cutoff)
+        if tail is not None:
+            # Blocks stay in key order; a stray older hot row is still read through the merge
+            query = query.filter(or_(Message.timestamp > tail[0],
+                                     and_(Message.timestamp == tail[0], Message.id > tail[1])))
+        rows = query.order_by(Message.timestamp, Message.id).limit(archive.block_size).all()
+        if not rows:
+            break
+        ids = [m.id for m, username in rows]
+        reactions = reaction_records(db, User, Reaction, ids)
+        records = [message_record(m, username, reactions.get(m.id, [])) for m, username in rows]
+        archive.append(channel_id, records)
+        # Search moves the messages to its archived index in the same commit as the delete
+        app.search_index.add_archived(channel_id, [ColdMessage(channel_id, record) for record in records])
+        delete_messages(db, Message, Reaction, ids)
+        archived += len(rows)
+        tail = (rows[-1][0].timestamp, rows[-1][0].id)
+    return archived
+
+
+def delete_messages(db, Message, Reaction, ids):
+    db.session.execute(delete(Reaction).where(Reaction.message_id.in_(ids)))
+    db.session.execute(delete(Message).where(Message.id.in_(ids)))
+    db.session.commit()
+
+
+def restore_channel(app, channel_id):
+    """Move a channel's archived messages back into the message table; returns the count"""
+    archive, db = app.message_archive, app.db
+    Message, Reaction = app.Message, app.Reaction
+    restored = 0
+    for entry in archive.index(channel_id):
+        messages = archive.block(channel_id, entry)
+        # Rows already in the table must be these messages (left by an interrupted
+        # restore); anything else would be silently dropped by the insert below
+        taken = db.session.query(Message.id, Message.channel_id, Message.timestamp) \
+            .filter(Message.id.in_([m.id for m in messages])).all()
+        by_id = {m.id: m for m in messages}
+        conflicts = [row.id for row in taken
+                     if row.channel_id != channel_id or row.timestamp != by_id[row.id].timestamp]
+        if conflicts:
+            db.session.rollback()
+            raise ArchiveConflict(f"Channel {channel_id}: archived message ids {conflicts[:10]} are used by "
+                                  f"other messages; nothing was removed from the archive")
+        # Re-inserting is idempotent, so a restore interrupted before removing the files can be rerun
+        db.session.execute(insert_ignore(db, Message.__table__), [{
+            "id": m.id, "content": m.content, "timestamp": m.timestamp, "user_id": m.user_id,
+            "channel_id": channel_id, "reaction_summary": m.reaction_summary, "seq": m.seq
+        } for m in messages])
+        rows = [{"emoji": emoji, "user_id": user_id, "message_id": m.id, "timestamp": from_micros(timestamp)}
+                for m in messages for emoji, user_id, username, timestamp in m.reactions]
+        if rows:
+            db.session.execute(insert_ignore(db, Reaction.__table__), rows)
+        # The re-inserted rows are indexed by the message table's triggers again
+        app.search_index.remove_archived(channel_id, [m.id for m in messages])
+        restored += len(messages)
+    bump_versions(db.session, channel_resource(channel_id))
+    db.session.commit()
+    archive.remove(channel_id)
+    return restored
+
+
+def register_commands(app):
+    @app.cli.group("archive")
+    def archive_cli():
+        """Cold message archive"""
+
+    @archive_cli.command("run")
+    @click.option("--older-than-days", type=float, default=None,
+                  help="Archive messages older than this (default: ARCHIVE_AFTER_DAYS)")
+    @click.option("--channel", "channel_id", type=int, default=None, help="Only this channel")
+    def run(older_than_days, channel_id):
+        """Move old messages into the per-channel archive"""
+        days = older_than_days if older_than_days is not None else app.config.get("ARCHIVE_AFTER_DAYS", 90)
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        Channel = app.Channel
+        channel_ids = [channel_id] if channel_id is not None else \
+            [c.id for c in Channel.query.filter(Channel.deleted_at.is_(None)).order_by(Channel.id)]
+        for cid in channel_ids:
+            count = archive_channel(app, cid, cutoff)
+            if count:
+                click.echo(f"Archived {count} messages from channel {cid}")
+        click.echo("Done")
+
+    @archive_cli.command("restore")
+    @click.option("--channel", "channel_id", type=int, default=None, help="Only this channel")
+    def restore(channel_id):
+        """Move archived messages back into the database"""
+        archive = app.message_archive
+        for cid in [channel_id] if channel_id is not None else archive.channels():
+            try:
+                count = restore_channel(app, cid)
+            except ArchiveConflict as e:
+                raise click.ClickException(str(e))
+            click.echo(f"Restored {count} messages to channel {cid}")
@@ -0,0 +1,94 @@
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, select
+
+from concurrency import run_blocking
+from log_pipeline import get_logger
+from sync import CHANNELS, bump_versions, channel_resource
+
+log = get_logger("channels")
+
+# Channels currently being purged by this process
+_running = set()
+_lock = threading.Lock()
+
+
+def hide_channel(db, channel):
+    """Hide a channel right away and free its name; the caller commits"""
+    channel.deleted_at = datetime.utcnow()
+    # Rename so a new channel with the same name can be created while the old one is purged
+    channel.name = f"{channel.name}~deleted~{channel.id}"
+    bump_versions(db.session, CHANNELS, channel_resource(channel.id))
+
+
+def purge_chunk(app, channel_id, chunk_size):
+    """Delete one chunk of a channel's messages (and their reactions) in its own transaction
+
+    Returns the number of messages deleted; 0 once the channel is empty.
+    """
+    db, Message, Reaction = app.db, app.Message, app.Reaction
+    with app.app_context():
+        try:
+            message_ids = select(Message.id).where(Message.channel_id == channel_id).limit(chunk_size)
+            ids = [row[0] for row in db.session.execute(message_ids)]
+            if not ids:
+                return 0
+            db.session.execute(delete(Reaction).where(Reaction.message_id.in_(ids)))
+            db.session.execute(delete(Message).where(Message.id.in_(ids)))
+            db.session.commit()
+            return len(ids)
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def finish_purge(app, channel_id):
+    """Delete the channel's archived history and the (now empty) channel row itself"""
+    db, Channel = app.db, app.Channel
+    app.message_archive.remove(channel_id)
+    app.recent_messages.forget(channel_id)
+    with app.app_context():
+        app.search_index.remove_archived(channel_id)
+        db.session.execute(delete(Channel).where(Channel.id == channel_id))
+        bump_versions(db.session, CHANNELS, channel_resource(channel_id))
+        db.session.commit()
+
+
+def purge_channel(app, channel_id):
+    """Delete all of a channel's data in bounded chunks so other writers can interleave"""
+    chunk_size = max(1, app.config.get("CHANNEL_DELETE_CHUNK_SIZE", 1000))
+    pause = app.config.get("CHANNEL_DELETE_PAUSE_MS", 10) / 1000.0
+    while run_blocking(purge_chunk, app, channel_id, chunk_size) == chunk_size:
+        # Give other writers a turn at the write lock between chunks
+        time.sleep(pause)
+    run_blocking(finish_purge, app, channel_id)
+
+
+def start_purge(app, channel_id):
+    """Purge a hidden channel on a background task (once per channel per process)"""
+    with _lock:
+        if channel_id in _running:
+            return
+        _running.add(channel_id)
+
+    def run():
+        try:
+            purge_channel(app, channel_id)
+            log.info("Purged channel %s", channel_id)
+        except Exception:
+            log.exception("Error purging channel %s", channel_id)
+        finally:
+            _running.discard(channel_id)
+
+    threading.Thread(target=run, name=f"channel-purge-{channel_id}", daemon=True).start()
+
+
+def resume_pending_purges(app):
+    """Restart purges for channels that were hidden but not fully deleted (e.g. after a restart)"""
+    Channel = app.Channel
+    with app.app_context():
+        pending = [c.id for c in Channel.query.filter(Channel.deleted_at.isnot(None)).all()]
+    for channel_id in pending:
+        start_purge(app, channel_id)
@@ -0,0 +1,75 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Only gzip is offered without it
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "text/")
+ENCODINGS = ("br", "gzip")
+
+
+def coded_etag(etag, encoding):
+    """The strong ETag of a body compressed with `encoding`; each coding is a different representation"""
+    return f"{etag}-{encoding}"
+
+
+def etag_variants(etag):
+    """Every ETag a client may hold for a resource version: identity and each compressed coding"""
+    return [etag] + [coded_etag(etag, encoding) for encoding in ENCODINGS]
+
+
+class Compressor:
+    """Negotiated gzip / brotli compression of response bodies
+
+    Buffered responses of at least `COMPRESS_MIN_SIZE` bytes with a
+    compressible type are compressed with the best encoding the client
+    accepts (brotli is preferred when installed), and a strong ETag gets the
+    coding appended so caches never mix up representations. Streamed and
+    already-encoded responses are left alone.
+    """
+
+    def __init__(self, app=None):
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+        self.encodings = ["gzip"]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get("COMPRESS_MIN_SIZE", 1024)
+        self.gzip_level = app.config.get("COMPRESS_GZIP_LEVEL", 6)
+        self.brotli_quality = app.config.get("COMPRESS_BROTLI_QUALITY", 4)
+        self.encodings = (["br"] if brotli is not None else []) + ["gzip"]
+        app.compressor = self
+        if self.min_size >= 0:
+            app.after_request(self._after_request)
+
+    def compress(self, data, encoding):
+        if encoding == "br":
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, self.gzip_level, mtime=0)
+
+    def _after_request(self, response):
+        if response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers \
+                or not response.mimetype.startswith(COMPRESSIBLE_MIMETYPES) or response.status_code < 200 \
+                or response.status_code in (204, 304):
+            return response
+        response.vary.add("Accept-Encoding")
+        if response.content_length is not None and response.content_length < self.min_size:
+            return response
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        response.set_data(self.compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(coded_etag(etag, encoding))
+        return response
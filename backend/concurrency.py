@@ -0,0 +1,73 @@
+import contextvars
+import functools
+import os
+
+# Socket.IO server concurrency model: 'threading' (one OS thread per connection),
+# or 'gevent' (cooperative green threads for high connection counts)
+ASYNC_MODE = os.environ.get("SOCKETIO_ASYNC_MODE", "threading")
+
+if ASYNC_MODE not in ("threading", "gevent"):
+    raise RuntimeError(f"Unsupported SOCKETIO_ASYNC_MODE '{ASYNC_MODE}' (use threading or gevent)")
+
+_patched = False
+
+
+def monkey_patch():
+    """Make the standard library cooperative for gevent mode; must run before other imports"""
+    global _patched
+    if _patched or ASYNC_MODE == "threading":
+        return
+    _patched = True
+
+    from gevent import monkey
+    monkey.patch_all()
+
+    # Make psycopg2 (PostgreSQL) yield to the event loop while waiting on the server
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Run blocking work (e.g. SQLite calls) on gevent's native thread pool so it can't stall the hub
+
+    Runs inline in threading mode. Only for self-contained work: gevent's
+    patched queues and events can't be fed or waited on from a pool thread.
+    """
+    if ASYNC_MODE == "gevent":
+        from gevent import get_hub
+        return get_hub().threadpool.apply(fn, args, kwargs)
+    return fn(*args, **kwargs)
+
+
+def blocking(fn):
+    """Decorator: run `fn` through run_blocking in the caller's context (Flask's request and app contexts included)
+
+    For request handlers, or the parts of them, that only talk to the database.
+    Anything that waits on the message writer or the password hasher must stay on
+    the hub. A no-op in threading mode.
+    """
+    if ASYNC_MODE != "gevent":
+        return fn
+
+    @functools.wraps(fn)
+    def offloaded(*args, **kwargs):
+        return run_blocking(contextvars.copy_context().run, fn, *args, **kwargs)
+    return offloaded
+
+
+def iterate_blocking(iterable):
+    """Iterate through run_blocking one item at a time, e.g. a streamed response that queries per chunk"""
+    if ASYNC_MODE != "gevent":
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    end = object()
+    while True:
+        # The end is signalled with a sentinel; StopIteration can't cross the thread pool
+        item = run_blocking(contextvars.copy_context().run, next, iterator, end)
+        if item is end:
+            return
+        yield item
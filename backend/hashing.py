@@ -0,0 +1,91 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full; the caller should ask the client to retry"""
+
+
+def _verify_and_rehash(stored_hash, password, method, rehash):
+    """Check a password and, if `rehash`, hash it again with the current method (runs in the pool)"""
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    return True, generate_password_hash(password, method) if rehash else None
+
+
+class PasswordHasher:
+    """Password hashing in a process pool, off the threads that serve requests and sockets
+
+    Hashing is deliberately CPU-heavy; done inline it holds the GIL (or, in
+    gevent mode, the whole event loop) and stalls chat traffic during
+    a login storm. At most `PASSWORD_HASH_MAX_QUEUE` hashes are queued or
+    running at once; beyond that `HasherBusy` is raised after waiting
+    `PASSWORD_HASH_QUEUE_TIMEOUT` seconds. `PASSWORD_HASH_WORKERS=0` hashes
+    inline. Hashes made with other parameters than `PASSWORD_HASH_METHOD` are
+    upgraded on the next successful login.
+    """
+
+    def __init__(self, app=None):
+        self.method = "scrypt"
+        self.workers = 1
+        self.queue_timeout = 5.0
+        self._prefix = None
+        self._slots = None
+        self._pool = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get("PASSWORD_HASH_METHOD", "scrypt")
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS", 2)
+        self.queue_timeout = app.config.get("PASSWORD_HASH_QUEUE_TIMEOUT", 5.0)
+        self._slots = threading.BoundedSemaphore(max(1, app.config.get("PASSWORD_HASH_MAX_QUEUE", 64)))
+        # Werkzeug expands the method with its default parameters, e.g. "scrypt:32768:8:1"
+        self._prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        app.password_hasher = self
+        if self.workers > 0:
+            # Fork the workers now, while the process is still small and single-threaded
+            self._get_pool().submit(int).result()
+        # Stop the workers before multiprocessing waits for them at exit
+        atexit.register(self.shutdown)
+
+    def hash(self, password):
+        """Hash a new password with the current method"""
+        return self._call(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        """Check a password; returns (ok, new_hash) where new_hash is set if the stored hash should be upgraded"""
+        return self._call(_verify_and_rehash, stored_hash, password, self.method, self.needs_rehash(stored_hash))
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split("$", 1)[0] != self._prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def _call(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HasherBusy()
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            # The executor's locks and pipes are monkey-patched under gevent,
+            # so waiting here yields to other greenlets instead of blocking the hub
+            return self._get_pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("fork"))
+            return self._pool
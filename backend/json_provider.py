@@ -0,0 +1,54 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Falls back to Flask's stdlib-json provider
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson
+
+    Produces documents equivalent to the default provider's (keys sorted
+    unless `sort_keys` is turned off), except that non-ASCII text is written
+    as UTF-8 instead of being escaped. Calls with extra
+    `json.dumps` arguments, and values orjson can't encode, fall back to the
+    default provider.
+    """
+
+    def _options(self):
+        # Datetimes go through `default`, so they render as HTTP dates like Flask's
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        return options | (orjson.OPT_SORT_KEYS if self.sort_keys else 0)
+
+    def _encode(self, obj):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options())
+        except TypeError:  # e.g. integers beyond 64 bits
+            return super().dumps(obj).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Pretty-printing in debug mode goes through the default provider
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(obj)
+        return self._app.response_class(self._encode(obj), mimetype=self.mimetype)
+
+
+def init_json(app):
+    """Install the JSON provider selected by `JSON_PROVIDER`: "orjson", "default", or "auto" (orjson if installed)"""
+    choice = app.config.get("JSON_PROVIDER", "auto")
+    if choice == "orjson" and orjson is None:
+        raise RuntimeError("JSON_PROVIDER=orjson needs the orjson package (pip install orjson)")
+    if choice == "orjson" or (choice == "auto" and orjson is not None):
+        app.json = OrjsonProvider(app)
@@ -0,0 +1,115 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def get_logger(subsystem):
+    """Logger for one part of the backend, e.g. "socket" or "presence" (configured as teamchat.<subsystem>)"""
+    return logging.getLogger(f"teamchat.{subsystem}")
+
+
+def parse_pairs(value, convert):
+    """Parse "socket=DEBUG,presence=WARNING" into {"socket": "DEBUG", ...}"""
+    pairs = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            pairs[name.strip()] = convert(setting.strip())
+    return pairs
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with any `extra=` fields as top-level keys"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Resolve the message and traceback now (the objects may change later), but
+        # leave the formatting to the listener thread and keep the traceback separate
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """Keep only a fraction of the records from high-frequency subsystems
+
+    `rates` maps a subsystem to the share of its records kept, e.g.
+    {"socket.typing": 0.01}; warnings and errors are never dropped.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {f"teamchat.{name}": rate for name, rate in rates.items()}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        while name:
+            if name in self.rates:
+                return random.random() < self.rates[name]
+            name = name.rpartition(".")[0]
+        return True
+
+
+def init_logging(app):
+    """Send every teamchat.* record through a queue to a background writer thread
+
+    Handlers on the request and socket paths only enqueue the record; the
+    formatting and the stdout write happen on the listener thread. Configured
+    once per process, from `LOG_LEVEL`, `LOG_LEVELS`, `LOG_SAMPLE` and `LOG_FORMAT`.
+    """
+    global _listener
+    root = logging.getLogger("teamchat")
+    root.setLevel(app.config.get("LOG_LEVEL", "INFO"))
+    for subsystem, level in app.config.get("LOG_LEVELS", {}).items():
+        get_logger(subsystem).setLevel(level)
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if app.config.get("LOG_FORMAT", "json") == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(SampleFilter(app.config.get("LOG_SAMPLE", {})))
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    # Write out whatever is still queued when the process exits
+    atexit.register(_listener.stop)
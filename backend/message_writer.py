@@ -0,0 +1,215 @@
+import atexit
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import select
+from concurrency import run_blocking
+from log_pipeline import get_logger
+from recent_messages import pending_message
+from sync import advance_sequence, bump_versions, channel_resource, channel_sequence, get_version
+
+log = get_logger('messages')
+
+
+class ChannelNotFound(Exception):
+    """A message was sent to a channel that doesn't exist or is being deleted"""
+
+
+class PendingMessage:
+    """A message waiting to be written; filled in with its id, timestamp and channel seq once durable"""
+
+    def __init__(self, user_id, channel_id, content, callback=None, username=None):
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.content = content
+        self.username = username
+        self.callback = callback
+        self.id = None
+        self.timestamp = None
+        self.seq = None
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        """True once the message is committed or has failed"""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the message is committed (or failed); returns True if it was written"""
+        self._done.wait(timeout)
+        return self.id is not None
+
+    def _finish(self, error=None):
+        self.error = error
+        self._done.set()
+        if self.callback:
+            try:
+                self.callback(self)
+            except Exception:
+                log.exception('Error in message callback')
+
+
+class MessageWriter:
+    """Group-commit writer for chat messages
+
+    Messages from every channel are queued and committed by a single background
+    thread in micro-batches of up to `MESSAGE_BATCH_MAX_SIZE` rows, waiting at most
+    `MESSAGE_BATCH_MAX_DELAY_MS` for a batch to fill. Callbacks run only after the
+    batch is committed, so listeners always see the real message id.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_batch_size = 100
+        self.max_delay = 0.005
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_batch_size = max(1, app.config.get("MESSAGE_BATCH_MAX_SIZE", 100))
+        self.max_delay = app.config.get("MESSAGE_BATCH_MAX_DELAY_MS", 5) / 1000.0
+        app.message_writer = self
+        # Drain anything still queued when the process exits
+        atexit.register(self.flush, 5)
+
+    def submit(self, user_id, channel_id, content, callback=None, username=None):
+        """Queue a message for writing; `callback(pending)` runs once it is durable or has failed
+
+        Pass the author's `username` so the message can go straight into the
+        channel's recent-history buffer.
+        """
+        self._ensure_started()
+        pending = PendingMessage(user_id, channel_id, content, callback, username)
+        self._queue.put(pending)
+        return pending
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been written"""
+        if self._thread is None:
+            return
+        marker = self.submit(None, None, None)
+        marker.wait(timeout)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            markers = [pending for pending in batch if pending.content is None]
+            messages = [pending for pending in batch if pending.content is not None]
+            try:
+                with self.app.app_context():
+                    self._write(messages)
+            except Exception as e:
+                log.exception('Error writing message batch')
+                for pending in messages:
+                    if not pending._done.is_set():
+                        pending._finish(e)
+            for marker in markers:
+                marker._finish()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        # Only the insert and commit are retried; once committed, rows must never be written again
+        try:
+            ids, versions = run_blocking(self._commit, batch)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0]._finish(e)
+                return
+            # Isolate the bad row so one failure doesn't drop the whole batch
+            for pending in batch:
+                self._write([pending])
+            return
+        for pending, (message_id, timestamp, seq) in zip(batch, ids):
+            pending.id = message_id
+            pending.timestamp = timestamp
+            pending.seq = seq
+        # Before the callbacks run, so a history read prompted by the broadcast sees the message
+        for channel_id, version in versions.items():
+            self._remember(channel_id, version, [pending for pending in batch if int(pending.channel_id) == channel_id])
+        for pending in batch:
+            pending._finish()
+
+    def _remember(self, channel_id, version, messages):
+        recent_messages = self.app.recent_messages
+        try:
+            if any(pending.username is None for pending in messages):
+                recent_messages.forget(channel_id)
+            else:
+                recent_messages.append(channel_id, version, [pending_message(p) for p in messages])
+        except Exception:
+            # The buffer is only a cache; drop it so reads go back to the database
+            log.exception('Error updating recent messages for channel %s', channel_id)
+            recent_messages.forget(channel_id)
+
+    def _commit(self, batch):
+        with self.app.app_context():
+            return self._commit_rows(batch)
+
+    def _commit_rows(self, batch):
+        """Insert and commit the batch; returns each row's (id, timestamp, seq) and the channels' new versions"""
+        Message = self.app.Message
+        session = self.app.db.session
+        try:
+            # Number each channel's messages in commit order, for the seq of live events
+            counts = Counter(int(pending.channel_id) for pending in batch)
+            last_seq = {channel_id: advance_sequence(session, channel_sequence(channel_id), count) - count
+                        for channel_id, count in counts.items()}
+            # Checked after the sequence writes hold the write lock (and under a share lock
+            # elsewhere), so a channel can't be hidden between this check and the commit
+            Channel = self.app.Channel
+            live = set(session.scalars(
+                select(Channel.id).where(Channel.id.in_(counts), Channel.deleted_at.is_(None))
+                .with_for_update(read=True)
+            ))
+            if live != set(counts):
+                # The batch is retried row by row, so only messages to the dead channels fail
+                raise ChannelNotFound(sorted(set(counts) - live))
+            rows = []
+            for pending in batch:
+                last_seq[int(pending.channel_id)] += 1
+                rows.append(Message(
+                    content=pending.content,
+                    user_id=pending.user_id,
+                    channel_id=pending.channel_id,
+                    timestamp=datetime.utcnow(),
+                    seq=last_seq[int(pending.channel_id)]
+                ))
+            session.add_all(rows)
+            # One version bump per channel per batch, for history ETags
+            bump_versions(session, *(channel_resource(pending.channel_id) for pending in batch))
+            session.flush()
+            ids = [(row.id, row.timestamp, row.seq) for row in rows]
+            # The versions this commit moves each channel to, for the recent-history buffers
+            versions = {}
+            if self.app.recent_messages.enabled:
+                versions = {channel_id: get_version(session, channel_resource(channel_id))
+                            for channel_id in {int(pending.channel_id) for pending in batch}}
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.remove()
+        return ids, versions
@@ -0,0 +1,204 @@
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import Response, g, request
+from sqlalchemy import event
+
+# Seconds; covers sub-millisecond cache hits up to slow password hashes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# [statements, seconds] of the request or socket event being handled; a context
+# variable rather than `g`, so statements run under a nested app context count too
+_db_scope = ContextVar("metrics_db", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._values = {}  # {label values: [per-bucket counts, sum, count]}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """A value read at scrape time from `fn`"""
+
+    def __init__(self, name, help, fn, type="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.type = type
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", f"{self.name} {_number(self.fn())}"]
+
+
+class Metrics:
+    """In-process metrics served at `/metrics` in the Prometheus text format
+
+    Records HTTP request latency per route, Socket.IO handler latency per
+    event, room fan-out sizes and SQL statements (count and time, overall and
+    per request/event). Each worker process exposes its own numbers; scrape
+    every worker.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route",
+                                      ("method", "route", "status"))
+        self.socket_latency = Histogram("socketio_event_duration_seconds", "Socket.IO handler latency by event",
+                                        ("event",))
+        self.fanout = Histogram("socketio_fanout_recipients", "Local sockets in the room per broadcast",
+                                ("event",), COUNT_BUCKETS)
+        self.db_queries = Counter("db_queries_total", "SQL statements executed")
+        self.db_query_latency = Histogram("db_query_duration_seconds", "SQL statement latency")
+        self.db_queries_per_handler = Histogram("db_queries_per_handler", "SQL statements per request or socket event",
+                                                ("handler",), COUNT_BUCKETS)
+        self.db_time_per_handler = Histogram("db_time_per_handler_seconds", "SQL time per request or socket event",
+                                             ("handler",))
+        self._metrics = [self.http_latency, self.socket_latency, self.fanout, self.db_queries,
+                         self.db_query_latency, self.db_queries_per_handler, self.db_time_per_handler]
+        self._gauges = {}  # {name: Gauge}
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.metrics = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule("/metrics", "metrics", self.render)
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def gauge(self, name, help, fn, type="gauge"):
+        """Expose a value that is read when `/metrics` is scraped (`type="counter"` for running totals)
+
+        Registering a name again replaces the earlier gauge, so a re-created app
+        doesn't duplicate the series or keep the old one alive.
+        """
+        self._gauges[name] = Gauge(name, help, fn, type)
+
+    def socket_handler(self, name, handler):
+        """Wrap a Socket.IO handler so its latency and SQL usage are recorded"""
+        def timed(*args):
+            token = _db_scope.set([0, 0.0])
+            began = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                self.socket_latency.observe(time.perf_counter() - began, event=name)
+                self._observe_db(f"socket:{name}")
+                _db_scope.reset(token)
+        timed.__name__ = handler.__name__
+        return timed
+
+    def observe_fanout(self, socketio, event, room):
+        """Record how many sockets on this worker a broadcast to `room` reaches"""
+        participants = socketio.server.manager.rooms.get("/", {}).get(room)
+        self.fanout.observe(len(participants) if participants else 0, event=event)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics + list(self._gauges.values()):
+            lines.extend(metric.render())
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        _db_scope.set([0, 0.0])
+
+    def _after_request(self, response):
+        began = g.pop("metrics_started", None)
+        if began is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            self.http_latency.observe(time.perf_counter() - began, method=request.method, route=route,
+                                      status=response.status_code)
+            self._observe_db(f"{request.method} {route}")
+            _db_scope.set(None)
+        return response
+
+    def _observe_db(self, handler):
+        queries, seconds = _db_scope.get() or (0, 0.0)
+        self.db_queries_per_handler.observe(queries, handler=handler)
+        self.db_time_per_handler.observe(seconds, handler=handler)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+        self.db_queries.inc()
+        self.db_query_latency.observe(elapsed)
+        # Statements run by background threads (writer, flushes) only count towards the totals
+        scope = _db_scope.get()
+        if scope is not None:
+            scope[0] += 1
+            scope[1] += elapsed
@@ -0,0 +1,77 @@
+"""initial schema
+
+Revision ID: 0001_initial_schema
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_initial_schema'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created before migrations existed (via db.create_all())
+    # already have these tables, so only create what is missing
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'user' not in existing_tables:
+        op.create_table('user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=80), nullable=False),
+            sa.Column('password', sa.String(length=120), nullable=False),
+            sa.Column('display_name', sa.String(length=100), nullable=True),
+            sa.Column('avatar_url', sa.String(length=500), nullable=True),
+            sa.Column('status_message', sa.String(length=200), nullable=True),
+            sa.Column('is_online', sa.Boolean(), nullable=True),
+            sa.Column('last_seen', sa.DateTime(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('username')
+        )
+
+    if 'channel' not in existing_tables:
+        op.create_table('channel',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=80), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name')
+        )
+
+    if 'message' not in existing_tables:
+        op.create_table('message',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=True),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('channel_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['channel_id'], ['channel.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'reaction' not in existing_tables:
+        op.create_table('reaction',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('emoji', sa.String(length=10), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('message_id', sa.Integer(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['message_id'], ['message.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'message_id', 'emoji', name='unique_user_message_emoji')
+        )
+
+
+def downgrade():
+    op.drop_table('reaction')
+    op.drop_table('message')
+    op.drop_table('channel')
+    op.drop_table('user')
@@ -0,0 +1,49 @@
+"""hot path indexes for history and reactions
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-17 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_hot_path_indexes'
+down_revision = '0001_initial_schema'
+branch_labels = None
+depends_on = None
+
+# (table, index name, columns)
+INDEXES = [
+    ('message', 'ix_message_channel_timestamp_id', ['channel_id', 'timestamp', 'id']),
+    ('message', 'ix_message_user_id', ['user_id']),
+    ('reaction', 'ix_reaction_message_emoji', ['message_id', 'emoji']),
+]
+
+
+def upgrade():
+    # Plain CREATE INDEX (no batch mode) so existing large tables are indexed
+    # in place instead of being copied and rebuilt
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table, name, columns in INDEXES:
+        existing = {index['name'] for index in inspector.get_indexes(table)}
+        if name in existing:
+            continue
+        if bind.dialect.name == 'postgresql':
+            # Build without blocking writers on a live database
+            with op.get_context().autocommit_block():
+                op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+        else:
+            op.create_index(name, table, columns, unique=False)
+
+    if bind.dialect.name == 'sqlite':
+        # Refresh planner statistics so the new indexes are picked up
+        op.execute('ANALYZE')
+
+
+def downgrade():
+    for table, name, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,70 @@
+"""full-text search index over message content
+
+Revision ID: 0003_message_search_index
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_message_search_index'
+down_revision = '0002_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+def fts5_available(bind):
+    try:
+        bind.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        bind.exec_driver_sql("DROP TABLE temp.fts5_probe")
+        return True
+    except sa.exc.OperationalError:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Other databases (or SQLite builds without FTS5) fall back to the LIKE search backend
+    if bind.dialect.name != 'sqlite' or not fts5_available(bind):
+        return
+
+    # External-content index: the text lives in `message`, FTS5 only stores the index
+    op.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+            content, content='message', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+
+    # Keep the index current as messages are inserted, edited or deleted
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message BEGIN
+            INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message BEGIN
+            INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content ON message BEGIN
+            INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+
+    # Index the existing history
+    op.execute("INSERT INTO message_fts(message_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS message_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS message_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS message_fts_ai")
+    op.execute("DROP TABLE IF EXISTS message_fts")
@@ -0,0 +1,28 @@
+"""change versions for ETags and delta sync
+
+Revision ID: 0004_change_versions
+Revises: 0003_message_search_index
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_change_versions'
+down_revision = '0003_message_search_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_version',
+        sa.Column('resource', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('resource')
+    )
+
+
+def downgrade():
+    op.drop_table('change_version')
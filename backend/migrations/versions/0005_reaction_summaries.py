@@ -0,0 +1,55 @@
+"""denormalized reaction summaries on messages
+
+Revision ID: 0005_reaction_summaries
+Revises: 0004_change_versions
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_reaction_summaries'
+down_revision = '0004_change_versions'
+branch_labels = None
+depends_on = None
+
+# Keep in sync with reactions.SUMMARY_MAX_USERS
+SUMMARY_MAX_USERS = 50
+
+
+def upgrade():
+    op.add_column('message', sa.Column('reaction_summary', sa.JSON(), nullable=True))
+
+    # Backfill from the reaction table, walking reacted-to messages in id order
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        message_ids = [row[0] for row in bind.execute(sa.text(
+            "SELECT DISTINCT message_id FROM reaction WHERE message_id > :last_id ORDER BY message_id LIMIT 1000"
+        ), {"last_id": last_id})]
+        if not message_ids:
+            break
+        rows = bind.execute(sa.text(
+            "SELECT r.message_id, r.emoji, r.user_id, u.username FROM reaction r JOIN \"user\" u ON u.id = r.user_id "
+            "WHERE r.message_id BETWEEN :first AND :last ORDER BY r.id"
+        ), {"first": message_ids[0], "last": message_ids[-1]})
+        summaries = {}
+        for message_id, emoji, user_id, username in rows:
+            entry = summaries.setdefault(message_id, {}).setdefault(emoji, {"count": 0, "users": []})
+            entry["count"] += 1
+            if len(entry["users"]) < SUMMARY_MAX_USERS:
+                entry["users"].append([user_id, username])
+        bind.execute(
+            sa.text("UPDATE message SET reaction_summary = :summary WHERE id = :id"),
+            [{"id": message_id, "summary": json.dumps(summary)} for message_id, summary in summaries.items()]
+        )
+        last_id = message_ids[-1]
+
+
+def downgrade():
+    with op.batch_alter_table('message') as batch_op:
+        batch_op.drop_column('reaction_summary')
@@ -0,0 +1,25 @@
+"""channel deleted_at for background deletion
+
+Revision ID: 0006_channel_soft_delete
+Revises: 0005_reaction_summaries
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_channel_soft_delete'
+down_revision = '0005_reaction_summaries'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('channel', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('channel') as batch_op:
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,26 @@
+"""per-channel message sequence numbers
+
+Revision ID: 0007_message_sequence
+Revises: 0006_channel_soft_delete
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_message_sequence'
+down_revision = '0006_channel_soft_delete'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing messages keep a NULL sequence; each channel's numbering starts with its next message
+    op.add_column('message', sa.Column('seq', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('message') as batch_op:
+        batch_op.drop_column('seq')
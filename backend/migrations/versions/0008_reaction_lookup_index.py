@@ -0,0 +1,35 @@
+"""reaction lookup index leading with message_id
+
+Revision ID: 0008_reaction_lookup_index
+Revises: 0007_message_sequence
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_reaction_lookup_index'
+down_revision = '0007_message_sequence'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The (user_id, message_id, emoji) unique constraint covers every column of the
+    # per-page reaction lookup, so SQLite preferred scanning it whole over searching
+    # ix_reaction_message_emoji. A covering index that leads with message_id is
+    # searched instead. Plain CREATE INDEX (no batch mode) so the table isn't rebuilt.
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # Build without blocking writers on a live database
+        with op.get_context().autocommit_block():
+            op.create_index('ix_reaction_message_user_emoji', 'reaction', ['message_id', 'user_id', 'emoji'],
+                            unique=True, postgresql_concurrently=True)
+    else:
+        op.create_index('ix_reaction_message_user_emoji', 'reaction', ['message_id', 'user_id', 'emoji'], unique=True)
+        op.execute('ANALYZE')
+
+
+def downgrade():
+    op.drop_index('ix_reaction_message_user_emoji', table_name='reaction')
@@ -0,0 +1,65 @@
+"""never reuse message ids
+
+Revision ID: 0009_message_autoincrement
+Revises: 0008_reaction_lookup_index
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_message_autoincrement'
+down_revision = '0008_reaction_lookup_index'
+branch_labels = None
+depends_on = None
+
+# The search index triggers of 0003; rebuilding the table drops them
+FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message BEGIN
+        INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+
+def has_search_index(bind):
+    return bind.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'"
+    ).first() is not None
+
+
+def rebuild_message_table(autoincrement):
+    bind = op.get_bind()
+    with op.batch_alter_table('message', recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+    if has_search_index(bind):
+        for trigger in FTS_TRIGGERS:
+            op.execute(trigger)
+
+
+def upgrade():
+    # Without AUTOINCREMENT SQLite hands out max(id) + 1, so deleting the newest rows
+    # (e.g. purging a channel) lets new messages take ids of archived ones.
+    # PostgreSQL sequences never go back, so only SQLite needs the rebuild
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    rebuild_message_table(True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    rebuild_message_table(False)
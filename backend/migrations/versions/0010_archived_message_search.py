@@ -0,0 +1,39 @@
+"""full-text search index over archived messages
+
+Revision ID: 0010_archived_message_search
+Revises: 0009_message_autoincrement
+Create Date: 2026-10-17 16:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_archived_message_search'
+down_revision = '0009_message_autoincrement'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Only alongside the message index of 0003 (SQLite builds with FTS5)
+    if bind.dialect.name != 'sqlite' or bind.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'").first() is None:
+        return
+
+    # Archived messages leave the message table (and with it message_fts), so they get
+    # an index that stores its own text, filled by `flask archive run`. Messages archived
+    # before this revision are indexed by `flask search rebuild`
+    op.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS archived_message_fts USING fts5(
+            content, channel_id UNINDEXED, username UNINDEXED, timestamp UNINDEXED,
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS archived_message_fts")
@@ -5,10 +5,11 @@ User = None
 Channel = None
 Message = None
 Reaction = None
+ChangeVersion = None
 
 def init_models(db_instance):
     """Initialize models with the db instance"""
-    global User, Channel, Message, Reaction
+    global User, Channel, Message, Reaction, ChangeVersion
     
     # Only initialize if not already done
     if User is not None:
@@ -34,6 +35,8 @@ def init_models(db_instance):
         
         id = db_instance.Column(db_instance.Integer, primary_key=True)
         name = db_instance.Column(db_instance.String(80), unique=True, nullable=False)
+        # Set when the channel is deleted; it stays hidden until its messages are purged
+        deleted_at = db_instance.Column(db_instance.DateTime, nullable=True)
         messages = db_instance.relationship("MessageModel", backref="channel", lazy=True)
 
     class MessageModel(db_instance.Model):
@@ -44,7 +47,20 @@ def init_models(db_instance):
         timestamp = db_instance.Column(db_instance.DateTime, default=datetime.utcnow)
         user_id = db_instance.Column(db_instance.Integer, db_instance.ForeignKey("user.id"), nullable=False)
         channel_id = db_instance.Column(db_instance.Integer, db_instance.ForeignKey("channel.id"), nullable=False)
+        # Denormalized {emoji: {"count": n, "users": [[user_id, username], ...]}}, kept in
+        # step with the reaction table so history reads one row per message
+        reaction_summary = db_instance.Column(db_instance.JSON, nullable=True)
+        # Position in the channel's live message stream (NULL for messages from before numbering)
+        seq = db_instance.Column(db_instance.Integer, nullable=True)
         reactions = db_instance.relationship("ReactionModel", backref="message", lazy=True, cascade="all, delete-orphan")
+        
+        # History pages are keyset-paginated on (timestamp, id) within a channel.
+        # Ids are never reused, so an archived message's id can't be handed out again
+        __table_args__ = (
+            db_instance.Index('ix_message_channel_timestamp_id', 'channel_id', 'timestamp', 'id'),
+            db_instance.Index('ix_message_user_id', 'user_id'),
+            {'sqlite_autoincrement': True},
+        )
 
     class ReactionModel(db_instance.Model):
         __tablename__ = 'reaction'
@@ -58,10 +74,24 @@ def init_models(db_instance):
         # Add relationship to User
         user = db_instance.relationship("UserModel", backref="reactions", lazy=True)
         
-        # Ensure one reaction per user per emoji per message
-        __table_args__ = (db_instance.UniqueConstraint('user_id', 'message_id', 'emoji', name='unique_user_message_emoji'),)
+        # Ensure one reaction per user per emoji per message; a page's reactions
+        # are looked up through the indexes that lead with message_id
+        __table_args__ = (
+            db_instance.UniqueConstraint('user_id', 'message_id', 'emoji', name='unique_user_message_emoji'),
+            db_instance.Index('ix_reaction_message_emoji', 'message_id', 'emoji'),
+            db_instance.Index('ix_reaction_message_user_emoji', 'message_id', 'user_id', 'emoji', unique=True),
+        )
+    
+    class ChangeVersionModel(db_instance.Model):
+        __tablename__ = 'change_version'
+        
+        # Bumped in the same transaction as every write to a synced resource
+        # ("channels", "users", "channel:<id>"), used for ETags
+        resource = db_instance.Column(db_instance.String(64), primary_key=True)
+        version = db_instance.Column(db_instance.Integer, nullable=False, default=0)
     
     # Set the global variables
+    ChangeVersion = ChangeVersionModel
     User = UserModel
     Channel = ChannelModel
     Message = MessageModel
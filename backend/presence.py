@@ -0,0 +1,192 @@
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # Only needed for the shared (multi-worker) presence store
+    redis = None
+
+
+class MemoryPresenceStore:
+    """Per-process presence: who is online in each channel
+
+    A user can be in the same channel from several sockets (tabs, devices), so
+    each membership is tracked per socket and only the first join / last leave
+    count as the user coming online / going offline. Every socket entry is a
+    lease that expires unless renewed with `touch`. Each online/offline change
+    bumps the channel's sequence number, which is returned to the caller.
+    """
+
+    def __init__(self):
+        self._channels = {}  # {channel_id: {user_id: [username, {sid: expires_at}]}}
+        self._seq = {}  # {channel_id: last sequence number}
+        self._lock = threading.Lock()
+
+    def _bump(self, channel_id):
+        self._seq[channel_id] = self._seq.get(channel_id, 0) + 1
+        return self._seq[channel_id]
+
+    def add(self, channel_id, user_id, username, sid, ttl):
+        """Record one socket of a user in a channel; the new sequence number if the user just came online"""
+        with self._lock:
+            members = self._channels.setdefault(str(channel_id), {})
+            entry = members.setdefault(str(user_id), [username, {}])
+            entry[0] = username
+            came_online = not entry[1]
+            entry[1][sid] = time.time() + ttl
+            # Re-adding a socket only renews its lease
+            return self._bump(str(channel_id)) if came_online else None
+
+    def remove(self, channel_id, user_id, sid):
+        """Drop one socket of a user from a channel; the new sequence number if the user went offline"""
+        with self._lock:
+            members = self._channels.get(str(channel_id), {})
+            entry = members.get(str(user_id))
+            if entry is None or entry[1].pop(sid, None) is None or entry[1]:
+                return None
+            del members[str(user_id)]
+            if not members:
+                del self._channels[str(channel_id)]
+            return self._bump(str(channel_id))
+
+    def touch(self, channel_id, user_id, sid, ttl):
+        """Renew a socket's lease in a channel"""
+        with self._lock:
+            entry = self._channels.get(str(channel_id), {}).get(str(user_id))
+            if entry is not None and sid in entry[1]:
+                entry[1][sid] = time.time() + ttl
+
+    def expire(self):
+        """Drop every expired lease; returns [(channel_id, user_id, username, seq)] for users who went offline"""
+        now = time.time()
+        with self._lock:
+            stale = [
+                (channel_id, user_id, entry[0], sid)
+                for channel_id, members in self._channels.items()
+                for user_id, entry in members.items()
+                for sid, expires_at in entry[1].items()
+                if expires_at <= now
+            ]
+        offline = []
+        for channel_id, user_id, username, sid in stale:
+            seq = self.remove(channel_id, user_id, sid)
+            if seq is not None:
+                offline.append((channel_id, user_id, username, seq))
+        return offline
+
+    def snapshot(self, channel_id):
+        """Return ({user_id: username}, seq) for everyone online in a channel"""
+        with self._lock:
+            members = self._channels.get(str(channel_id), {})
+            return {user_id: entry[0] for user_id, entry in members.items()}, self._seq.get(str(channel_id), 0)
+
+
+class RedisPresenceStore:
+    """Presence shared by every worker and node through a Redis-compatible server
+
+    Each channel uses `<prefix>:<channel>:names` (user_id -> username),
+    `<prefix>:<channel>:refs` (user_id -> open socket count), the sorted set
+    `<prefix>:<channel>:leases` ("user_id:sid" scored by expiry time) and the
+    counter `<prefix>:<channel>:seq`. `<prefix>:channels` lists channels with
+    anyone online so leases left behind by a crashed worker can be expired by
+    the others.
+    """
+
+    def __init__(self, client, prefix="teamchat:presence"):
+        self.client = client
+        self.prefix = prefix
+
+    def _keys(self, channel_id):
+        base = f"{self.prefix}:{channel_id}"
+        return f"{base}:names", f"{base}:refs", f"{base}:leases", f"{base}:seq"
+
+    def add(self, channel_id, user_id, username, sid, ttl):
+        names, refs, leases, seq = self._keys(channel_id)
+        user_id = str(user_id)
+        came_online = []
+
+        lease = f"{user_id}:{sid}"
+
+        def increment(pipe):
+            came_online.clear()
+            first = not pipe.hget(refs, user_id)
+            known = pipe.zscore(leases, lease) is not None
+            pipe.multi()
+            pipe.hset(names, user_id, username)
+            if not known:
+                # Re-adding a socket only renews its lease
+                pipe.hincrby(refs, user_id, 1)
+            pipe.zadd(leases, {lease: time.time() + ttl})
+            pipe.sadd(f"{self.prefix}:channels", str(channel_id))
+            if first:
+                pipe.incr(seq)
+                came_online.append(True)
+
+        # WATCH the refcount and leases so concurrent joins/leaves on other workers can't be lost
+        results = self.client.transaction(increment, refs, leases)
+        return int(results[-1]) if came_online else None
+
+    def remove(self, channel_id, user_id, sid):
+        names, refs, leases, seq = self._keys(channel_id)
+        user_id = str(user_id)
+        lease = f"{user_id}:{sid}"
+        went_offline = []
+
+        def decrement(pipe):
+            went_offline.clear()
+            if pipe.zscore(leases, lease) is None:
+                pipe.multi()
+                return
+            count = int(pipe.hget(refs, user_id) or 0)
+            pipe.multi()
+            pipe.zrem(leases, lease)
+            if count <= 1:
+                pipe.hdel(refs, user_id)
+                pipe.hdel(names, user_id)
+                pipe.incr(seq)
+                went_offline.append(True)
+            else:
+                pipe.hincrby(refs, user_id, -1)
+
+        # The lease check makes removal idempotent, so every worker can expire leases safely
+        results = self.client.transaction(decrement, refs, leases)
+        return int(results[-1]) if went_offline else None
+
+    def touch(self, channel_id, user_id, sid, ttl):
+        names, refs, leases, seq = self._keys(channel_id)
+        pipe = self.client.pipeline()
+        pipe.zadd(leases, {f"{user_id}:{sid}": time.time() + ttl}, xx=True)
+        pipe.sadd(f"{self.prefix}:channels", str(channel_id))
+        pipe.execute()
+
+    def expire(self):
+        offline = []
+        now = time.time()
+        for channel_id in self.client.smembers(f"{self.prefix}:channels"):
+            names, refs, leases, seq = self._keys(channel_id)
+            for lease in self.client.zrangebyscore(leases, "-inf", now):
+                user_id, sid = lease.split(":", 1)
+                username = self.client.hget(names, user_id)
+                new_seq = self.remove(channel_id, user_id, sid)
+                if new_seq is not None:
+                    offline.append((channel_id, user_id, username, new_seq))
+            if not self.client.exists(refs):
+                self.client.srem(f"{self.prefix}:channels", channel_id)
+        return offline
+
+    def snapshot(self, channel_id):
+        names, refs, leases, seq = self._keys(channel_id)
+        pipe = self.client.pipeline()
+        pipe.hgetall(names)
+        pipe.get(seq)
+        members, current = pipe.execute()
+        return dict(members), int(current or 0)
+
+
+def create_presence_store(url=None):
+    """Build the presence store: shared through Redis if a URL is configured, else in-process"""
+    if not url:
+        return MemoryPresenceStore()
+    if redis is None:
+        raise RuntimeError("PRESENCE_STORE_URL is set but the 'redis' package is not installed")
+    return RedisPresenceStore(redis.Redis.from_url(url, decode_responses=True))
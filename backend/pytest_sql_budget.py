@@ -0,0 +1,74 @@
+"""Pytest plugin: fail tests that run more SQL than they declare
+
+Enable it with `pytest -p pytest_sql_budget` (from the backend directory) or
+`pytest_plugins = ["pytest_sql_budget"]` in a conftest.py. Then either mark a
+whole test:
+
+    @pytest.mark.query_budget(3)
+    def test_history(client): ...
+
+or budget a block inside it:
+
+    def test_history(client, query_budget):
+        with query_budget(3, max_repeats=2):
+            client.get("/chat/channels/1/messages", headers=headers)
+
+`max_repeats` also fails the test when one statement fingerprint runs more
+often than that (an N+1 pattern), whatever the total.
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from sql_profiler import QueryLog, listen
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def count_queries(name="block"):
+    """Record every statement run by any engine inside the block"""
+    log = QueryLog(name)
+    before, after = listen(Engine, log.add)
+    try:
+        yield log
+    finally:
+        event.remove(Engine, "before_cursor_execute", before)
+        event.remove(Engine, "after_cursor_execute", after)
+
+
+def check_budget(log, max_queries=None, max_repeats=None):
+    if max_queries is not None and len(log.queries) > max_queries:
+        raise QueryBudgetExceeded(f"Query budget of {max_queries} exceeded: {log.describe()}")
+    if max_repeats is not None and log.repeated(max_repeats + 1):
+        raise QueryBudgetExceeded(f"Statement repeated more than {max_repeats} times (N+1?): {log.describe(max_repeats + 1)}")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "query_budget(max_queries, max_repeats=None): fail the test if it runs more SQL")
+
+
+@pytest.fixture
+def query_budget(request):
+    """Context manager factory: `with query_budget(max_queries, max_repeats=None): ...`"""
+    @contextmanager
+    def budget(max_queries=None, max_repeats=None):
+        with count_queries(request.node.name) as log:
+            yield log
+        check_budget(log, max_queries, max_repeats)
+    return budget
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("query_budget")
+    if marker is None:
+        return (yield)
+    with count_queries(item.name) as log:
+        result = yield
+    check_budget(log, *marker.args, **marker.kwargs)
+    return result
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Reactors kept per emoji in message.reaction_summary; beyond this only the count
+# is exact and history falls back to the reaction table for that message
+SUMMARY_MAX_USERS = 50
+
+
+def insert_ignore(db, table):
+    """INSERT ... ON CONFLICT DO NOTHING for the current database"""
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(table)
+
+
+def summary_add(summary, emoji, user_id, username):
+    """Return a copy of a reaction summary with one more reactor for `emoji`"""
+    summary = {key: {"count": value["count"], "users": list(value["users"])} for key, value in (summary or {}).items()}
+    entry = summary.setdefault(emoji, {"count": 0, "users": []})
+    entry["count"] += 1
+    if len(entry["users"]) < SUMMARY_MAX_USERS:
+        entry["users"].append([user_id, username])
+    return summary
+
+
+def summary_remove(summary, emoji, user_id):
+    """Return a copy of a reaction summary without `user_id`'s `emoji` reaction"""
+    summary = {key: {"count": value["count"], "users": list(value["users"])} for key, value in (summary or {}).items()}
+    entry = summary.get(emoji)
+    if entry is None:
+        return summary
+    entry["count"] -= 1
+    entry["users"] = [user for user in entry["users"] if user[0] != user_id]
+    if entry["count"] <= 0:
+        del summary[emoji]
+    return summary
+
+
+def summary_complete(summary):
+    """True if the summary lists every reactor (no emoji went over SUMMARY_MAX_USERS)"""
+    return all(entry["count"] == len(entry["users"]) for entry in (summary or {}).values())
+
+
+def format_summary(summary, current_user_id):
+    """Render a summary as {emoji: [usernames]} with the current user shown as "You" """
+    return {
+        emoji: ["You" if user_id == current_user_id else username for user_id, username in entry["users"]]
+        for emoji, entry in (summary or {}).items()
+        # Skip reactions with empty emojis
+        if emoji and emoji.strip() != ""
+    }
+
+
+def add_reaction(db, Message, Reaction, message_id, user_id, username, emoji):
+    """Idempotently add a reaction and update the message's summary in the same transaction
+
+    Returns "added", "exists" or "missing" (no such message). The caller commits.
+    """
+    # The insert comes first so that on SQLite the write lock is held before the
+    # summary is read, and concurrent reactions can't overwrite each other
+    try:
+        result = db.session.execute(
+            insert_ignore(db, Reaction.__table__)
+            .values(emoji=emoji, user_id=user_id, message_id=message_id, timestamp=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=["user_id", "message_id", "emoji"])
+        )
+    except IntegrityError:
+        # Databases that enforce foreign keys reject a reaction to a missing message here
+        db.session.rollback()
+        return "missing", None
+    message = db.session.query(Message).filter_by(id=message_id).with_for_update().first()
+    if not message:
+        db.session.rollback()
+        return "missing", None
+    if result.rowcount == 0:
+        return "exists", message
+    message.reaction_summary = summary_add(message.reaction_summary, emoji, user_id, username)
+    return "added", message
+
+
+def remove_reaction(db, Message, Reaction, message_id, user_id, emoji):
+    """Remove a reaction (if present) and update the message's summary; the caller commits
+
+    Returns the message, or None if there was no such reaction.
+    """
+    result = db.session.execute(
+        delete(Reaction).where(
+            Reaction.user_id == user_id,
+            Reaction.message_id == message_id,
+            Reaction.emoji == emoji
+        )
+    )
+    if result.rowcount == 0:
+        return None
+    message = db.session.query(Message).filter_by(id=message_id).with_for_update().first()
+    if message:
+        message.reaction_summary = summary_remove(message.reaction_summary, emoji, user_id)
+    return message
+
@@ -0,0 +1,194 @@
+import sys
+import threading
+from bisect import insort
+from collections import OrderedDict
+
+from archive import ColdMessage, history_key, to_micros
+from reactions import summary_complete
+
+# Rough per-message cost beyond its text: the object, its timestamp, ids and list slot
+MESSAGE_OVERHEAD = 300
+REACTION_OVERHEAD = 120
+
+
+def message_size(message):
+    """Approximate memory held by one buffered message, in bytes"""
+    reactors = sum(len(entry["users"]) for entry in (message.reaction_summary or {}).values())
+    return MESSAGE_OVERHEAD + sys.getsizeof(message.content) + sys.getsizeof(message.username) \
+        + REACTION_OVERHEAD * (reactors + len(message.reactions))
+
+
+def pending_message(pending):
+    """A buffered copy of a message the writer has just committed"""
+    return ColdMessage(int(pending.channel_id), {
+        "id": pending.id,
+        "user_id": pending.user_id,
+        "user": pending.username,
+        "content": pending.content,
+        "ts": to_micros(pending.timestamp),
+        "seq": pending.seq,
+    })
+
+
+class ChannelBuffer:
+    __slots__ = ("messages", "version", "complete", "size")
+
+    def __init__(self, messages, version, complete):
+        self.messages = messages  # [ColdMessage] in (timestamp, id) order
+        self.version = version    # the channel's change version these messages match
+        self.complete = complete  # True if this is the channel's whole history
+        self.size = sum(message_size(message) for message in messages)
+
+
+class RecentMessages:
+    """Per-channel ring buffers of the most recent messages, for history reads without SQL
+
+    Each buffer holds a channel's latest `RECENT_MESSAGES_PER_CHANNEL` messages
+    and the channel's change version they match. Reads pass the version they
+    got from the database (it is needed for the ETag anyway) and miss when it
+    differs, so writes from other workers are never served stale. Writes from
+    this process update the buffer in place: the message writer appends each
+    committed batch and reaction changes replace the message's summary.
+
+    At most `RECENT_MESSAGES_MAX_CHANNELS` channels and
+    `RECENT_MESSAGES_MAX_BYTES` (approximate) are kept; the least recently read
+    channels are dropped first.
+    """
+
+    def __init__(self, app=None):
+        self.capacity = 200
+        self.max_channels = 256
+        self.max_bytes = 32 * 1024 * 1024
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._channels = OrderedDict()  # {channel_id: ChannelBuffer}, least recently read first
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.capacity = app.config.get("RECENT_MESSAGES_PER_CHANNEL", 200)
+        self.max_channels = app.config.get("RECENT_MESSAGES_MAX_CHANNELS", 256)
+        self.max_bytes = app.config.get("RECENT_MESSAGES_MAX_BYTES", 32 * 1024 * 1024)
+        app.recent_messages = self
+
+    @property
+    def enabled(self):
+        return self.capacity > 0 and self.max_channels > 0
+
+    def page(self, channel_id, version, before, limit):
+        """The latest `limit` messages (older than message `before`, if given) as (messages, has_more)
+
+        Returns None when the buffer can't answer: no buffer for the channel, a
+        different version, or a page that reaches past the buffered messages.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            buffer = self._channels.get(channel_id)
+            if buffer is None or buffer.version != version:
+                self.misses += 1
+                return None
+            messages = buffer.messages
+            end = len(messages)
+            if before is not None:
+                end = next((i for i in range(len(messages) - 1, -1, -1) if messages[i].id == before), None)
+                if end is None:
+                    self.misses += 1
+                    return None
+            start = end - limit
+            if start < 0 and not buffer.complete:
+                self.misses += 1
+                return None
+            self._channels.move_to_end(channel_id)
+            self.hits += 1
+            start = max(start, 0)
+            return messages[start:end], start > 0 or not buffer.complete
+
+    def fill(self, channel_id, version, messages, complete):
+        """Buffer a channel's latest messages (oldest first), read at `version`"""
+        if not self.enabled:
+            return
+        with self._lock:
+            current = self._channels.get(channel_id)
+            if current is not None and current.version >= version:
+                return
+            self._drop(channel_id)
+            self._store(channel_id, ChannelBuffer(messages[-self.capacity:], version,
+                                                  complete and len(messages) <= self.capacity))
+
+    def append(self, channel_id, version, messages):
+        """Add newly committed messages; `version` is the channel's version after their commit"""
+        with self._lock:
+            buffer = self._current(channel_id, version)
+            if buffer is None:
+                return
+            known = {message.id for message in buffer.messages}
+            for message in messages:
+                if message.id not in known:
+                    insort(buffer.messages, message, key=history_key)
+            if len(buffer.messages) > self.capacity:
+                del buffer.messages[:-self.capacity]
+                buffer.complete = False
+            buffer.version = version
+            self._resize(buffer, sum(message_size(message) for message in buffer.messages))
+
+    def update_reactions(self, channel_id, version, message_id, summary):
+        """Replace a message's reaction summary after a reaction change committed at `version`"""
+        with self._lock:
+            buffer = self._current(channel_id, version)
+            if buffer is None:
+                return
+            for i, message in enumerate(buffer.messages):
+                if message.id == message_id:
+                    if not summary_complete(summary):
+                        # Past the summary's reactor limit; the full list is only in the database
+                        self._drop(channel_id)
+                        return
+                    updated = ColdMessage(channel_id, {
+                        "id": message.id, "user_id": message.user_id, "user": message.username,
+                        "content": message.content, "ts": to_micros(message.timestamp), "summary": summary,
+                        "seq": message.seq
+                    })
+                    buffer.messages[i] = updated
+                    self._resize(buffer, buffer.size + message_size(updated) - message_size(message))
+                    break
+            buffer.version = version
+
+    def forget(self, channel_id):
+        with self._lock:
+            self._drop(channel_id)
+
+    def stats(self):
+        with self._lock:
+            return {"channels": len(self._channels), "bytes": self.size}
+
+    def _current(self, channel_id, version):
+        # A change can only be applied on top of the version just before it (or
+        # again, on a buffer filled after it); anything else means missed changes
+        buffer = self._channels.get(channel_id)
+        if buffer is not None and buffer.version not in (version - 1, version):
+            self._drop(channel_id)
+            return None
+        return buffer
+
+    def _resize(self, buffer, size):
+        self.size += size - buffer.size
+        buffer.size = size
+        self._evict()
+
+    def _store(self, channel_id, buffer):
+        self._channels[channel_id] = buffer
+        self.size += buffer.size
+        self._evict()
+
+    def _drop(self, channel_id):
+        buffer = self._channels.pop(channel_id, None)
+        if buffer is not None:
+            self.size -= buffer.size
+
+    def _evict(self):
+        while self._channels and (len(self._channels) > self.max_channels or self.size > self.max_bytes):
+            channel_id, buffer = self._channels.popitem(last=False)
+            self.size -= buffer.size
@@ -1,10 +1,25 @@
-from flask import Blueprint, request, jsonify, current_app
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+import zlib
+from itertools import islice
+
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context, url_for
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
+from sqlalchemy import and_, or_
+from concurrency import blocking, iterate_blocking
+from hashing import HasherBusy
+from log_pipeline import get_logger
+from message_writer import ChannelNotFound
+import reactions
+from archive import ColdMessage, history_key, merge_history, message_record, reaction_records, row_message
+from channel_deletion import hide_channel, purge_channel, start_purge
+from reactions import format_summary, summary_complete
+from sync import CHANNELS, USERS, bump_versions, channel_resource, conditional_response, get_version, \
+    live_channel_version
 
 auth_bp = Blueprint("auth", __name__)
 chat_bp = Blueprint("chat", __name__)
 
+log = get_logger("routes")
+
 def get_models():
     """Get models from current app context"""
     return current_app.User, current_app.Channel, current_app.Message, current_app.Reaction
@@ -13,6 +28,20 @@ def get_db():
     """Get db from current app context"""
     return current_app.db
 
+def current_username(User, user_id):
+    """The signed-in user's name, from the token (older tokens without the claim fall back to the database)"""
+    username = get_jwt().get("username")
+    if username is None:
+        username = get_db().session.query(User.username).filter_by(id=user_id).scalar()
+    return username
+
+def status_fields(user):
+    """A user's is_online / last_seen as last flushed by the write-behind status buffer"""
+    return {
+        "is_online": user.is_online,
+        "last_seen": user.last_seen.isoformat() if user.last_seen else None
+    }
+
 @auth_bp.route("/register", methods=["POST"])
 def register():
     User, Channel, Message, Reaction = get_models()
@@ -39,19 +68,38 @@ def register():
     if len(password) < 8:
         return jsonify({"error": "Password must be at least 8 characters of any combination."}), 400
     
-    existing_user = User.query.filter_by(username=username).first()
-    if existing_user:
+    # Database work runs off the event loop; hashing waits on its own process pool
+    @blocking
+    def username_taken():
+        try:
+            return db.session.query(User.id).filter_by(username=username).first() is not None
+        finally:
+            # Don't hold a pooled connection while the password is hashed
+            db.session.close()
+
+    @blocking
+    def create_user(hashed_pw):
+        try:
+            new_user = User(username=username, password=hashed_pw)
+            db.session.add(new_user)
+            bump_versions(db.session, USERS)
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            return False
+
+    if username_taken():
         return jsonify({"error": "This username is already taken. Please choose a different one."}), 400
 
     try:
-        hashed_pw = generate_password_hash(password)
-        new_user = User(username=username, password=hashed_pw)
-        db.session.add(new_user)
-        db.session.commit()
-        return jsonify({"message": "Account created successfully! You can now log in."}), 201
-    except Exception as e:
-        db.session.rollback()
+        hashed_pw = current_app.password_hasher.hash(password)
+    except HasherBusy:
+        return jsonify({"error": "The server is busy. Please try again in a moment."}), 503
+
+    if not create_user(hashed_pw):
         return jsonify({"error": "Failed to create account. Please try again."}), 500
+    return jsonify({"message": "Account created successfully! You can now log in."}), 201
 
 @auth_bp.route("/login", methods=["POST"])
 def login():
@@ -72,15 +120,42 @@ def login():
     if not password:
         return jsonify({"error": "Please enter your password."}), 400
     
-    user = User.query.filter_by(username=username).first()
+    # Database work runs off the event loop; verifying waits on the hashing process pool
+    @blocking
+    def find_user():
+        try:
+            return get_db().session.query(User.id, User.username, User.password).filter_by(username=username).first()
+        finally:
+            # Don't hold a pooled connection while the password is verified
+            get_db().session.close()
+
+    @blocking
+    def upgrade_hash(new_hash):
+        try:
+            get_db().session.query(User).filter_by(id=user.id).update({"password": new_hash})
+            get_db().session.commit()
+        except Exception:
+            get_db().session.rollback()
+            log.exception("Error upgrading password hash")
+
+    user = find_user()
     if not user:
         return jsonify({"error": "Invalid username or password. Please check your credentials and try again."}), 401
     
-    if not check_password_hash(user.password, password):
+    try:
+        ok, new_hash = current_app.password_hasher.verify(user.password, password)
+    except HasherBusy:
+        return jsonify({"error": "The server is busy. Please try again in a moment."}), 503
+    if not ok:
         return jsonify({"error": "Invalid username or password. Please check your credentials and try again."}), 401
+    
+    # Upgrade hashes made with older parameters while we have the plain password
+    if new_hash:
+        upgrade_hash(new_hash)
 
     try:
-        token = create_access_token(identity=str(user.id))
+        # The username rides along so hot paths can attribute writes without a lookup
+        token = create_access_token(identity=str(user.id), additional_claims={"username": user.username})
         return jsonify({
             "token": token,
             "message": "Login successful! Welcome back."
@@ -91,6 +166,7 @@ def login():
 # Create channel
 @chat_bp.route("/channels", methods=["POST"])
 @jwt_required()
+@blocking
 def create_channel():
     User, Channel, Message, Reaction = get_models()
     db = get_db()
@@ -124,6 +200,7 @@ def create_channel():
     try:
         new_channel = Channel(name=channel_name)
         db.session.add(new_channel)
+        bump_versions(db.session, CHANNELS)
         db.session.commit()
         return jsonify({
             "message": f"Channel '{channel_name}' created successfully!",
@@ -139,10 +216,14 @@ def create_channel():
 # Get channels
 @chat_bp.route("/channels", methods=["GET"])
 @jwt_required()
+@blocking
 def get_channels():
     User, Channel, Message, Reaction = get_models()
-    channels = Channel.query.all()
-    return jsonify([{"id": c.id, "name": c.name} for c in channels])
+    
+    def build():
+        channels = Channel.query.filter(Channel.deleted_at.is_(None)).all()
+        return jsonify([{"id": c.id, "name": c.name} for c in channels])
+    return conditional_response(get_db().session, CHANNELS, build)
 
 # Delete channel
 @chat_bp.route("/channels/<int:channel_id>", methods=["DELETE"])
@@ -153,33 +234,70 @@ def delete_channel(channel_id):
         db = get_db()
         user_id = int(get_jwt_identity())
         
-        # Check if channel exists
-        channel = Channel.query.get(channel_id)
-        if not channel:
-            return jsonify({"error": "Channel not found"}), 404
-        
         # For now, allow any authenticated user to delete any channel
         # In a production app, you might want to add ownership checks
         
-        # Get all messages in the channel first
-        messages_in_channel = Message.query.filter_by(channel_id=channel_id).all()
-        
-        # Delete all messages in the channel (cascade will handle reactions)
-        for message in messages_in_channel:
-            db.session.delete(message)
-        
-        # Delete the channel
-        db.session.delete(channel)
-        db.session.commit()
+        # Hide the channel straight away (off the event loop); its messages are purged
+        # in chunks afterwards, and the purge offloads each chunk itself
+        @blocking
+        def hide():
+            channel = Channel.query.get(channel_id)
+            if not channel or channel.deleted_at:
+                return None
+            message_count = Message.query.filter_by(channel_id=channel_id).count()
+            hide_channel(db, channel)
+            db.session.commit()
+            return message_count
+        
+        message_count = hide()
+        if message_count is None:
+            return jsonify({"error": "Channel not found"}), 404
         
-        return jsonify({"message": "Channel deleted successfully"}), 200
+        # Large channels are purged in the background so the request doesn't pin a worker
+        app = current_app._get_current_object()
+        if message_count <= current_app.config["CHANNEL_DELETE_BACKGROUND_THRESHOLD"]:
+            try:
+                purge_channel(app, channel_id)
+                return jsonify({"message": "Channel deleted successfully"}), 200
+            except Exception:
+                # The channel is already hidden; finish the purge in the background
+                log.exception("Error purging channel %s, retrying in the background", channel_id)
+        
+        start_purge(app, channel_id)
+        return jsonify({
+            "message": "Channel is being deleted",
+            "status_url": url_for("chat.channel_deletion_status", channel_id=channel_id)
+        }), 202
         
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    except Exception:
+        log.exception("Error deleting channel %s", channel_id)
+        return jsonify({"error": "Failed to delete channel"}), 500
+
+# Channel deletion status
+@chat_bp.route("/channels/<int:channel_id>/deletion", methods=["GET"])
+@jwt_required()
+@blocking
+def channel_deletion_status(channel_id):
+    User, Channel, Message, Reaction = get_models()
+    
+    # Read from the database so any worker can answer for a purge running on another
+    channel = Channel.query.get(channel_id)
+    if not channel:
+        # Deleting a channel bumps its version, so a missing channel still at 0 never existed
+        if get_version(get_db().session, channel_resource(channel_id)) == 0:
+            return jsonify({"error": "Channel not found"}), 404
+        return jsonify({"status": "deleted"}), 200
+    if not channel.deleted_at:
+        return jsonify({"error": "Channel is not being deleted"}), 404
+    return jsonify({
+        "status": "deleting",
+        "remaining_messages": Message.query.filter_by(channel_id=channel_id).count()
+    }), 200
 
 # Get user profile
 @auth_bp.route("/profile", methods=["GET"])
 @jwt_required()
+@blocking
 def get_profile():
     try:
         User, Channel, Message, Reaction = get_models()
@@ -195,8 +313,7 @@ def get_profile():
             "display_name": user.display_name or user.username,
             "avatar_url": user.avatar_url,
             "status_message": user.status_message,
-            "is_online": user.is_online,
-            "last_seen": user.last_seen.isoformat() if user.last_seen else None,
+            **status_fields(user),
             "created_at": user.created_at.isoformat() if user.created_at else None
         })
     except Exception as e:
@@ -205,6 +322,7 @@ def get_profile():
 # Update user profile
 @auth_bp.route("/profile", methods=["PUT"])
 @jwt_required()
+@blocking
 def update_profile():
     try:
         User, Channel, Message, Reaction = get_models()
@@ -227,6 +345,7 @@ def update_profile():
         if "avatar_url" in data:
             user.avatar_url = data["avatar_url"]
         
+        bump_versions(db.session, USERS)
         db.session.commit()
         
         return jsonify({
@@ -235,8 +354,7 @@ def update_profile():
             "display_name": user.display_name or user.username,
             "avatar_url": user.avatar_url,
             "status_message": user.status_message,
-            "is_online": user.is_online,
-            "last_seen": user.last_seen.isoformat() if user.last_seen else None,
+            **status_fields(user),
             "created_at": user.created_at.isoformat() if user.created_at else None
         })
     except Exception as e:
@@ -245,19 +363,22 @@ def update_profile():
 # Get all users (for mentions)
 @auth_bp.route("/users", methods=["GET"])
 @jwt_required()
+@blocking
 def get_users():
     try:
         User, Channel, Message, Reaction = get_models()
-        users = User.query.all()
         
-        return jsonify([{
-            "id": user.id,
-            "username": user.username,
-            "display_name": user.display_name or user.username,
-            "avatar_url": user.avatar_url,
-            "is_online": user.is_online,
-            "last_seen": user.last_seen.isoformat() if user.last_seen else None
-        } for user in users])
+        def build():
+            users = User.query.all()
+            return jsonify([{
+                "id": user.id,
+                "username": user.username,
+                "display_name": user.display_name or user.username,
+                "avatar_url": user.avatar_url,
+                **status_fields(user)
+            } for user in users])
+        # Status flushes bump the users version, so the ETag is the same on every worker
+        return conditional_response(get_db().session, USERS, build)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -267,21 +388,19 @@ def get_users():
 def update_online_status():
     try:
         User, Channel, Message, Reaction = get_models()
-        db = get_db()
         user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
         
-        if not user:
+        @blocking
+        def user_exists():
+            return get_db().session.query(User.id).filter_by(id=user_id).first() is not None
+        
+        if not user_exists():
             return jsonify({"error": "User not found"}), 404
         
+        # Coalesced with other status changes and written in bulk by the status buffer
         data = request.get_json()
         if data and "is_online" in data:
-            user.is_online = data["is_online"]
-            if not data["is_online"]:
-                from datetime import datetime
-                user.last_seen = datetime.utcnow()
-        
-        db.session.commit()
+            current_app.status_buffer.record(user_id, bool(data["is_online"]))
         
         return jsonify({"message": "Status updated"}), 200
     except Exception as e:
@@ -297,7 +416,6 @@ def handle_jwt_error(e):
 @jwt_required()
 def post_message():
     User, Channel, Message, Reaction = get_models()
-    db = get_db()
     user_id = int(get_jwt_identity())
     
     data = request.get_json()
@@ -316,62 +434,367 @@ def post_message():
     if len(content) > 1000:
         return jsonify({"error": "Message is too long. Please keep it under 1000 characters."}), 400
     
-    # Check if channel exists
-    channel = Channel.query.get(channel_id)
-    if not channel:
+    # Read off the event loop; submitting to and waiting on the writer stay on the hub
+    @blocking
+    def lookup():
+        try:
+            channel = Channel.query.get(channel_id)
+            if not channel or channel.deleted_at:
+                return False, None
+            return True, current_username(User, user_id)
+        finally:
+            # Hand the connection back first: the writer needs one to commit what we wait for
+            get_db().session.close()
+    
+    # Check if channel exists (and get the author's name, which lets the message
+    # go straight into the channel's recent history)
+    live, username = lookup()
+    if not live:
         return jsonify({"error": "Channel not found. It may have been deleted."}), 404
     
-    try:
-        new_msg = Message(content=content, user_id=user_id, channel_id=channel_id)
-        db.session.add(new_msg)
-        db.session.commit()
+    # Committed together with other pending messages by the group-commit writer
+    pending = current_app.message_writer.submit(user_id, channel_id, content, username=username)
+    if not pending.wait(timeout=10) and not pending.done:
+        # Still queued behind a slow batch; it will be committed (and broadcast) without us,
+        # so answering with an error would only get it posted twice
         return jsonify({
-            "message": "Message sent successfully!",
-            "message_id": new_msg.id
-        }), 201
-    except Exception as e:
-        db.session.rollback()
+            "message": "Message accepted and is being sent.",
+            "status": "pending"
+        }), 202
+    if isinstance(pending.error, ChannelNotFound):
+        return jsonify({"error": "Channel not found. It may have been deleted."}), 404
+    if pending.error is not None:
         return jsonify({"error": "Failed to send message. Please try again."}), 500
+    return jsonify({
+        "message": "Message sent successfully!",
+        "message_id": pending.id
+    }), 201
+
+def load_reactions(message_ids, current_user_id):
+    """Load reactions for a set of messages, grouped as {message_id: {emoji: [usernames]}}"""
+    User, Channel, Message, Reaction = get_models()
+    db = get_db()
+    
+    grouped = {}
+    message_ids = list(message_ids)
+    # One query per chunk keeps us under SQLite's bound-parameter limit
+    for start in range(0, len(message_ids), 500):
+        rows = db.session.query(Reaction.message_id, Reaction.emoji, Reaction.user_id, User.username) \
+            .join(User, Reaction.user_id == User.id) \
+            .filter(Reaction.message_id.in_(message_ids[start:start + 500])) \
+            .order_by(Reaction.id) \
+            .all()
+        for message_id, emoji, user_id, username in rows:
+            # Skip reactions with empty emojis
+            if not emoji or emoji.strip() == "":
+                continue
+            # Replace current user's username with "You" for frontend display
+            reactions = grouped.setdefault(message_id, {})
+            reactions.setdefault(emoji, []).append("You" if user_id == current_user_id else username)
+    return grouped
+
+def format_messages(rows, current_user_id):
+    """Serialize (message, username) rows with their reactions grouped by emoji"""
+    # Reactions come from each message's summary; only messages with more reactors
+    # than the summary keeps need the reaction table
+    overflow = load_reactions(
+        [m.id for m, username in rows if not summary_complete(m.reaction_summary)], current_user_id
+    )
+    return [{
+        "id": m.id,
+        "content": m.content,
+        "user": username,
+        "time": m.timestamp.isoformat(),
+        "reactions": overflow.get(m.id, {}) if m.id in overflow else format_summary(m.reaction_summary, current_user_id)
+    } for m, username in rows]
+
+def format_history(rows, current_user_id):
+    """Serialize history rows that mix hot (message, username) rows and archived messages, in order"""
+    hot = iter(format_messages([row for row in rows if not isinstance(row, ColdMessage)], current_user_id))
+    return [row.to_dict(current_user_id) if isinstance(row, ColdMessage) else next(hot) for row in rows]
+
+def history_before(query, channel_id, cursor, limit):
+    """Up to `limit + 1` history rows older than `cursor` (or the latest ones), newest first"""
+    User, Channel, Message, Reaction = get_models()
+    archive = current_app.message_archive
+    if cursor is not None:
+        query = query.filter(or_(
+            Message.timestamp < cursor.timestamp,
+            and_(Message.timestamp == cursor.timestamp, Message.id < cursor.id)
+        ))
+    rows = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    # Hot rows are newer than the archive unless the page reaches back into it
+    if archive.index(channel_id) and (len(rows) <= limit or rows[-1][0].timestamp <= archive.newest(channel_id)):
+        older = archive.before(channel_id, (cursor.timestamp, cursor.id) if cursor is not None else None, limit + 1)
+        rows = merge_history(rows, older, limit + 1, newest_first=True)
+    return rows
+
+def fill_recent(query, channel_id, version):
+    """Load a channel's latest messages into its recent-history buffer"""
+    User, Channel, Message, Reaction = get_models()
+    recent = current_app.recent_messages
+    rows = history_before(query, channel_id, None, recent.capacity)
+    # Reactions past the summary's reactor limit are kept in full
+    overflow_ids = [row[0].id for row in rows
+                    if not isinstance(row, ColdMessage) and not summary_complete(row[0].reaction_summary)]
+    overflow = reaction_records(get_db(), User, Reaction, overflow_ids) if overflow_ids else {}
+    messages = [row if isinstance(row, ColdMessage) else
+                ColdMessage(channel_id, message_record(row[0], row[1], overflow.get(row[0].id, [])))
+                for row in reversed(rows[:recent.capacity])]
+    recent.fill(channel_id, version, messages, len(rows) <= recent.capacity)
+
+def history_query(channel_id):
+    """History rows of a channel: messages loaded together with their author in a single query"""
+    User, Channel, Message, Reaction = get_models()
+    return get_db().session.query(Message, User.username) \
+        .join(User, Message.user_id == User.id) \
+        .filter(Message.channel_id == channel_id)
+
+def latest_history(channel_id, version, limit):
+    """The latest `limit` history rows of a channel, oldest first, and whether older ones exist
+
+    Served from the recent-history buffer while it matches the channel's `version`.
+    """
+    query = history_query(channel_id)
+    recent = current_app.recent_messages
+    page = recent.page(channel_id, version, None, limit)
+    if page is None and limit <= recent.capacity:
+        fill_recent(query, channel_id, version)
+        page = recent.page(channel_id, version, None, limit)
+    if page is not None:
+        return page
+    rows = history_before(query, channel_id, None, limit)
+    return list(reversed(rows[:limit])), len(rows) > limit
+
+def sequence_cursor(rows):
+    """The channel seq of the newest message in a history page (0 if none is numbered)"""
+    return max((row_message(row).seq or 0 for row in rows), default=0)
 
 # Get messages for a channel
 @chat_bp.route("/channels/<int:channel_id>/messages", methods=["GET"])
 @jwt_required()
+@blocking
 def get_messages(channel_id):
     User, Channel, Message, Reaction = get_models()
+    db = get_db()
     current_user_id = int(get_jwt_identity())
-    current_user = User.query.get(current_user_id)
     
-    messages = Message.query.filter_by(channel_id=channel_id).order_by(Message.timestamp).all()
+    version = live_channel_version(db.session, channel_id)
+    if version is None:
+        return jsonify({"error": "Channel not found"}), 404
     
-    # Format messages with reactions
-    formatted_messages = []
-    for m in messages:
-        # Group reactions by emoji
-        reactions = {}
-        for reaction in m.reactions:
-            # Skip reactions with empty emojis
-            if not reaction.emoji or reaction.emoji.strip() == "":
-                continue
-                
-            if reaction.emoji not in reactions:
-                reactions[reaction.emoji] = []
-            # Replace current user's username with "You" for frontend display
-            username = "You" if reaction.user_id == current_user_id else reaction.user.username
-            reactions[reaction.emoji].append(username)
-        
-        formatted_messages.append({
-            "id": m.id,
-            "content": m.content,
-            "user": m.user.username,
-            "time": m.timestamp.isoformat(),
-            "reactions": reactions
+    query = history_query(channel_id)
+    # Old history may have moved to the cold archive; pages merge both tiers
+    archive = current_app.message_archive
+    cold = bool(archive.index(channel_id))
+    
+    # Full unbounded history is only returned on explicit opt-in
+    if request.args.get("all", "").lower() in ("1", "true", "yes"):
+        def build_all():
+            rows = query.order_by(Message.timestamp, Message.id).all()
+            if cold:
+                rows = merge_history(rows, list(archive.all(channel_id)))
+            return jsonify(format_history(rows, current_user_id))
+        return conditional_response(db.session, channel_resource(channel_id), build_all,
+                                    current_user_id, request.query_string.decode(), version=version)
+    
+    before = request.args.get("before", type=int)
+    after = request.args.get("after", type=int)
+    since = request.args.get("since", type=int)
+    limit = request.args.get("limit", type=int)
+    
+    if any(name in request.args and value is None for name, value in (("before", before), ("after", after), ("since", since))):
+        return jsonify({"error": "Message cursor must be a message ID."}), 400
+    if sum(value is not None for value in (before, after, since)) > 1:
+        return jsonify({"error": "Please provide only one of 'before', 'after' or 'since'."}), 400
+    if "limit" in request.args and (limit is None or limit < 1):
+        return jsonify({"error": "Limit must be a positive number."}), 400
+    limit = min(limit or current_app.config["MESSAGES_PAGE_SIZE"], current_app.config["MESSAGES_MAX_PAGE_SIZE"])
+    
+    def build():
+        nonlocal query
+        if since is None and after is None:
+            # Recent pages are served from memory while it matches the channel's version
+            recent = latest_history(channel_id, version, limit) if before is None else \
+                current_app.recent_messages.page(channel_id, version, before, limit)
+            if recent is not None:
+                page, has_more = recent
+                return jsonify({
+                    "messages": format_history(page, current_user_id),
+                    "next_cursor": row_message(page[0]).id if has_more else None
+                })
+        
+        if since is not None:
+            # Delta sync: everything a reconnecting client missed after its last seen message id
+            rows = query.filter(Message.id > since).order_by(Message.id).limit(limit + 1).all()
+            if cold:
+                rows = merge_history(rows, archive.since(channel_id, since, limit + 1), limit + 1,
+                                     key=lambda row: row_message(row).id)
+            page = rows[:limit]
+            has_more = len(rows) > limit
+            next_cursor = row_message(page[-1]).id if has_more else None
+            return jsonify({
+                "messages": format_history(page, current_user_id),
+                "next_cursor": next_cursor
+            })
+        
+        # Keyset pagination on (timestamp, id) so deep pages cost the same as the first one
+        cursor_id = after if after is not None else before
+        if cursor_id is not None:
+            cursor = Message.query.filter_by(id=cursor_id, channel_id=channel_id).first()
+            if not cursor and cold:
+                cursor = archive.get(channel_id, cursor_id)
+            if not cursor:
+                return jsonify({"error": "Message cursor not found in this channel."}), 400
+        
+        if after is not None:
+            # Page forwards: messages newer than the cursor, oldest first
+            query = query.filter(or_(
+                Message.timestamp > cursor.timestamp,
+                and_(Message.timestamp == cursor.timestamp, Message.id > cursor.id)
+            ))
+            rows = query.order_by(Message.timestamp, Message.id).limit(limit + 1).all()
+            if cold and cursor.timestamp <= archive.newest(channel_id):
+                rows = merge_history(rows, archive.after(channel_id, (cursor.timestamp, cursor.id), limit + 1), limit + 1)
+            page = rows[:limit]
+            has_more = len(rows) > limit
+            next_cursor = row_message(page[-1]).id if has_more else None
+        else:
+            # Page backwards: messages older than the cursor
+            rows = history_before(query, channel_id, cursor, limit)
+            page = list(reversed(rows[:limit]))
+            has_more = len(rows) > limit
+            next_cursor = row_message(page[0]).id if has_more else None
+        
+        return jsonify({
+            "messages": format_history(page, current_user_id),
+            "next_cursor": next_cursor
         })
     
-    return jsonify(formatted_messages)
+    # Unchanged history (no new messages or reaction changes) is answered with 304
+    return conditional_response(db.session, channel_resource(channel_id), build,
+                                current_user_id, request.query_string.decode(), version=version)
+
+def export_lines(channel_id, cursor):
+    """Yield a channel's history as NDJSON lines, oldest first, one chunk of messages at a time
+
+    Each chunk is a keyset query after the last exported message (merged with
+    the archive), so no read transaction or ORM object outlives its chunk.
+    """
+    User, Channel, Message, Reaction = get_models()
+    db = get_db()
+    archive = current_app.message_archive
+    chunk_size = current_app.config["EXPORT_CHUNK_SIZE"]
+    while True:
+        query = db.session.query(Message, User.username) \
+            .join(User, Message.user_id == User.id) \
+            .filter(Message.channel_id == channel_id)
+        if cursor is not None:
+            query = query.filter(or_(
+                Message.timestamp > cursor[0],
+                and_(Message.timestamp == cursor[0], Message.id > cursor[1])
+            ))
+        rows = query.order_by(Message.timestamp, Message.id).limit(chunk_size).all()
+        newest_cold = archive.newest(channel_id)
+        if newest_cold is not None and (cursor is None or cursor[0] <= newest_cold):
+            cold = archive.after(channel_id, cursor, chunk_size) if cursor is not None else \
+                list(islice(archive.all(channel_id), chunk_size))
+            rows = merge_history(rows, cold, chunk_size)
+        if not rows:
+            return
+        # Exports show real usernames, never "You"; reactions are loaded once per chunk
+        messages = format_history(rows, None)
+        cursor = history_key(rows[-1])
+        db.session.close()
+        yield "".join(current_app.json.dumps(message) + "\n" for message in messages)
+
+def gzip_stream(chunks):
+    """Compress a stream of text chunks on the fly, flushing after each so the client receives it as it goes"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+# Export a channel's full history
+@chat_bp.route("/channels/<int:channel_id>/export", methods=["GET"])
+@jwt_required()
+def export_channel(channel_id):
+    User, Channel, Message, Reaction = get_models()
+    db = get_db()
+    
+    # Resume after the last message id a previous (interrupted) export delivered
+    after = request.args.get("after", type=int)
+    if "after" in request.args and after is None:
+        return jsonify({"error": "Message cursor must be a message ID."}), 400
+    
+    # Off the event loop, like every chunk of the export; the response itself
+    # is streamed from the hub, which owns the request context
+    @blocking
+    def start():
+        """Where the export starts, as (error response or None, cursor)"""
+        try:
+            channel = db.session.get(Channel, channel_id)
+            if not channel or channel.deleted_at:
+                return (jsonify({"error": "Channel not found"}), 404), None
+            if after is None:
+                return None, None
+            message = Message.query.filter_by(id=after, channel_id=channel_id).first() or \
+                current_app.message_archive.get(channel_id, after)
+            if not message:
+                return (jsonify({"error": "Message cursor not found in this channel."}), 400), None
+            return None, (message.timestamp, message.id)
+        finally:
+            db.session.close()
+    
+    error, cursor = start()
+    if error is not None:
+        return error
+    
+    lines = stream_with_context(iterate_blocking(export_lines(channel_id, cursor)))
+    headers = {"Content-Disposition": f'attachment; filename="channel-{channel_id}.ndjson"'}
+    if "gzip" in request.accept_encodings:
+        headers["Content-Encoding"] = "gzip"
+        return Response(stream_with_context(gzip_stream(lines)), mimetype="application/x-ndjson", headers=headers)
+    return Response(lines, mimetype="application/x-ndjson", headers=headers)
+
+def search_response(channel_id=None):
+    """Run a paginated, ranked message search, optionally limited to one channel"""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Please enter something to search for."}), 400
+    if len(query) > 200:
+        return jsonify({"error": "Search is too long. Please keep it under 200 characters."}), 400
+    
+    offset = request.args.get("cursor", 0, type=int)
+    limit = request.args.get("limit", type=int)
+    if offset < 0 or ("limit" in request.args and (limit is None or limit < 1)):
+        return jsonify({"error": "Invalid search page."}), 400
+    limit = min(limit or current_app.config["SEARCH_PAGE_SIZE"], current_app.config["SEARCH_MAX_PAGE_SIZE"])
+    
+    results = current_app.search_index.search(query, channel_id=channel_id, limit=limit + 1, offset=offset)
+    return jsonify({
+        "results": results[:limit],
+        "next_cursor": offset + limit if len(results) > limit else None
+    })
+
+# Search messages in a channel
+@chat_bp.route("/channels/<int:channel_id>/search", methods=["GET"])
+@jwt_required()
+@blocking
+def search_channel_messages(channel_id):
+    return search_response(channel_id)
+
+# Search messages in all channels
+@chat_bp.route("/search", methods=["GET"])
+@jwt_required()
+@blocking
+def search_messages():
+    return search_response()
 
 # Add reaction to message
 @chat_bp.route("/messages/<int:message_id>/reactions", methods=["POST"])
 @jwt_required()
+@blocking
 def add_reaction(message_id):
     try:
         User, Channel, Message, Reaction = get_models()
@@ -390,38 +813,33 @@ def add_reaction(message_id):
         if len(emoji) > 10:
             return jsonify({"error": "Invalid emoji selected."}), 400
         
-        # Check if message exists
-        message = Message.query.get(message_id)
-        if not message:
+        # Idempotent insert; the message's reaction summary is updated in the same transaction
+        username = current_username(User, user_id)
+        status, message = reactions.add_reaction(db, Message, Reaction, message_id, user_id, username, emoji)
+        if status == "missing":
             return jsonify({"error": "Message not found. It may have been deleted."}), 404
+        if status == "exists":
+            db.session.rollback()
+            return jsonify({"message": f"Reaction {emoji} already added."}), 200
         
-        # Check if user already reacted with this emoji
-        existing_reaction = Reaction.query.filter_by(
-            user_id=user_id, 
-            message_id=message_id, 
-            emoji=emoji
-        ).first()
-        
-        if existing_reaction:
-            return jsonify({"error": "You've already reacted with this emoji. Click it again to remove your reaction."}), 400
-        
-        # Add new reaction
-        new_reaction = Reaction(
-            emoji=emoji,
-            user_id=user_id,
-            message_id=message_id
-        )
-        db.session.add(new_reaction)
+        channel_id, summary = message.channel_id, message.reaction_summary
+        bump_versions(db.session, channel_resource(channel_id))
+        version = get_version(db.session, channel_resource(channel_id))
         db.session.commit()
+        # Keep the channel's in-memory recent history in step with the new summary
+        current_app.recent_messages.update_reactions(channel_id, version, message_id, summary)
         
         return jsonify({"message": f"Reaction {emoji} added successfully!"}), 201
         
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    except Exception:
+        get_db().session.rollback()
+        log.exception("Error adding reaction")
+        return jsonify({"error": "Failed to add reaction. Please try again."}), 500
 
 # Remove reaction from message
 @chat_bp.route("/messages/<int:message_id>/reactions", methods=["DELETE"])
 @jwt_required()
+@blocking
 def remove_reaction(message_id):
     try:
         User, Channel, Message, Reaction = get_models()
@@ -437,21 +855,21 @@ def remove_reaction(message_id):
         if not emoji or len(emoji) == 0:
             return jsonify({"error": "Emoji cannot be empty"}), 400
         
-        # Find and remove the reaction
-        reaction = Reaction.query.filter_by(
-            user_id=user_id,
-            message_id=message_id,
-            emoji=emoji
-        ).first()
-        
-        if not reaction:
+        # Delete directly; the message's reaction summary is updated in the same transaction
+        message = reactions.remove_reaction(db, Message, Reaction, message_id, user_id, emoji)
+        if not message:
+            db.session.rollback()
             return jsonify({"error": "Reaction not found"}), 404
         
-        db.session.delete(reaction)
+        channel_id, summary = message.channel_id, message.reaction_summary
+        bump_versions(db.session, channel_resource(channel_id))
+        version = get_version(db.session, channel_resource(channel_id))
         db.session.commit()
+        # Keep the channel's in-memory recent history in step with the new summary
+        current_app.recent_messages.update_reactions(channel_id, version, message_id, summary)
         
         return jsonify({"message": "Reaction removed"}), 200
         
     except Exception as e:
-        print(f"Error removing reaction: {e}")
+        log.exception("Error removing reaction")
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,157 @@
+"""Benchmark: connection scaling per Socket.IO async mode
+
+Starts the backend in a subprocess with the requested SOCKETIO_ASYNC_MODE against a
+temporary SQLite database, opens N idle Socket.IO clients that all join one channel,
+then reports server memory per idle connection and the latency for one message
+to reach every client.
+
+Requires python-socketio's asyncio client (`pip install aiohttp`).
+
+Usage (from the backend directory):
+    python scripts/bench_connections.py --mode gevent --clients 1000 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import socketio
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SERVER = (
+    "import wsgi; from app import socketio; "
+    "socketio.run(wsgi.app, host='127.0.0.1', port={port}, allow_unsafe_werkzeug=True, use_reloader=False, log_output=False)"
+)
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def start_server(mode, port):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.unlink(path)
+    env = dict(os.environ, AUTO_MIGRATE="1", SOCKETIO_ASYNC_MODE=mode, DATABASE_URL="sqlite:///" + path)
+    server = subprocess.Popen([sys.executable, "-c", SERVER.format(port=port)], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + "/")
+            break
+        except OSError:
+            time.sleep(0.2)
+    else:
+        server.kill()
+        raise RuntimeError("Backend did not start")
+    post(base + "/auth/register", {"username": "bench", "password": "benchmark"})
+    token = post(base + "/auth/login", {"username": "bench", "password": "benchmark"})["token"]
+    return server, base, token, path
+
+
+async def run(base, token, server_pid, count, rounds):
+    clients = []
+    failed = 0
+    received = []
+    sent_at = {}
+    last_event = [time.perf_counter()]
+
+    baseline = rss_kb(server_pid)
+    for batch_start in range(0, count, 200):
+        batch = []
+        for _ in range(min(200, count - batch_start)):
+            client = socketio.AsyncClient(reconnection=False)
+
+            @client.on("new_message")
+            async def on_message(data):
+                received.append(time.perf_counter() - sent_at[data["content"]])
+
+            @client.on("*")
+            async def on_other(event, data=None):
+                last_event[0] = time.perf_counter()
+
+            batch.append(client)
+        results = await asyncio.gather(
+            *(c.connect(base, auth={"token": token}, transports=["websocket"], wait_timeout=30) for c in batch),
+            return_exceptions=True
+        )
+        connected = [c for c, result in zip(batch, results) if not isinstance(result, Exception)]
+        failed += len(batch) - len(connected)
+        await asyncio.gather(*(c.emit("join_channel", {"channel_id": 1}) for c in connected))
+        clients.extend(connected)
+
+    # Wait for the join/presence traffic to drain before measuring
+    while time.perf_counter() - last_event[0] < 2:
+        await asyncio.sleep(0.5)
+    idle = rss_kb(server_pid)
+    count = len(clients)
+
+    latencies = []
+    for i in range(rounds):
+        received.clear()
+        content = f"bench {i}"
+        sent_at[content] = time.perf_counter()
+        await clients[0].emit("send_message", {"channel_id": 1, "content": content})
+        deadline = time.perf_counter() + 30
+        while len(received) < count and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        latencies.append(sorted(received))
+
+    await asyncio.gather(*(c.disconnect() for c in clients), return_exceptions=True)
+    return baseline, idle, latencies, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", default="threading", choices=["threading", "gevent"])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1000])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    for count in args.clients:
+        server, base, token, path = start_server(args.mode, args.port)
+        try:
+            baseline, idle, rounds, failed = asyncio.run(run(base, token, server.pid, count, args.rounds))
+        finally:
+            server.kill()
+            server.wait()
+            os.unlink(path)
+
+        delivered = [len(r) for r in rounds]
+        last = [r[-1] for r in rounds if r]
+        p50 = [statistics.median(r) for r in rounds if r]
+        print(f"{args.mode} / {count} clients:")
+        print(f"  server RSS: {baseline / 1024:.1f} MB idle-empty, {idle / 1024:.1f} MB with clients "
+              f"({(idle - baseline) / max(count, 1):.1f} KB per connection)")
+        print(f"  connections: {count - failed} of {count} connected")
+        print(f"  delivered: {min(delivered)}-{max(delivered)} of {count - failed} per broadcast")
+        if last:
+            print(f"  broadcast latency p50: {statistics.median(p50) * 1000:.1f} ms, "
+                  f"all clients reached: {statistics.median(last) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark: JSON serialization time and bytes on the wire for history and user-list payloads
+
+Builds the app against a temporary database seeded with users (with profiles
+and statuses), a channel history with mentions, emoji and reactions, then
+fetches the real `get_messages` (one page and `all=true`) and `get_users`
+payloads. Each payload is serialized with Flask's default provider and with
+the orjson provider, and the body the app would send is compressed with gzip
+(and brotli, when installed) at the configured levels.
+
+Usage (from the backend directory):
+    python scripts/bench_json.py --users 500 --messages 5000 --repeat 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+PHRASES = ("deploy is done", "can someone review my PR?", "lunch in 10 🍕", "standup moved to 10:30",
+           "the migration timed out again", "👍 works for me", "rolling back, one sec",
+           "where's the runbook for the gateway?", "ça marche", "redis latency is spiking")
+EMOJI = ("👍", "🎉", "😂", "🔥", "✅")
+
+
+def seed(app, db, rng, users, messages):
+    from reactions import summary_add
+
+    with app.app_context():
+        db.session.add_all([app.User(username=f"user{i:04d}", password="x", display_name=f"User {i}",
+                                     avatar_url=f"https://avatars.example.com/{i}.png",
+                                     status_message=rng.choice(("", "on call", "heads down", "🌴 away")))
+                            for i in range(users)])
+        db.session.flush()
+        start = datetime.utcnow() - timedelta(days=30)
+        history = [app.Message(content=f"@user{rng.randrange(users):04d} {rng.choice(PHRASES)}",
+                               user_id=rng.randint(1, users), channel_id=1,
+                               timestamp=start + timedelta(seconds=30 * i)) for i in range(messages)]
+        db.session.add_all(history)
+        db.session.flush()
+        reactions = set()
+        for message in rng.sample(history, messages // 4):
+            for _ in range(rng.randint(1, 4)):
+                reactions.add((message, rng.randint(1, users), rng.choice(EMOJI)))
+        for message, user_id, emoji in reactions:
+            db.session.add(app.Reaction(message_id=message.id, user_id=user_id, emoji=emoji))
+            message.reaction_summary = summary_add(message.reaction_summary, emoji, user_id, f"user{user_id - 1:04d}")
+        db.session.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL="sqlite:///" + os.path.join(workdir, "chat.db"), AUTO_MIGRATE="1",
+                      ARCHIVE_DIR=os.path.join(workdir, "archive"), PASSWORD_HASH_WORKERS="0",
+                      JSON_PROVIDER="default", COMPRESS_MIN_SIZE="-1", LOG_LEVEL="WARNING")
+    from flask.json.provider import DefaultJSONProvider
+
+    from app import create_app, db
+    from compression import Compressor, brotli
+    from json_provider import OrjsonProvider, orjson
+
+    app = create_app()
+    seed(app, db, random.Random(args.seed), args.users, args.messages)
+    client = app.test_client()
+    client.post("/auth/register", json={"username": "bencher", "password": "password1"})
+    token = client.post("/auth/login", json={"username": "bencher", "password": "password1"}).get_json()["token"]
+    headers = {"Authorization": "Bearer " + token}
+    payloads = {
+        "get_messages (page)": client.get("/chat/channels/1/messages", headers=headers).get_json(),
+        "get_messages (all)": client.get("/chat/channels/1/messages?all=true", headers=headers).get_json(),
+        "get_users": client.get("/auth/users", headers=headers).get_json(),
+    }
+
+    providers = {"default": DefaultJSONProvider(app)}
+    if orjson is not None:
+        providers["orjson"] = OrjsonProvider(app)
+    else:
+        print("orjson is not installed; only the default provider is measured")
+    compressor = Compressor()
+    compressor.init_app(app)
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    if brotli is None:
+        print("brotli is not installed; only gzip is measured")
+
+    print(f"{args.users} users, {args.messages} messages, median of {args.repeat} runs\n")
+    for name, payload in payloads.items():
+        print(name)
+        for provider_name, provider in providers.items():
+            encoded, ms = timed(lambda: provider.response(payload).get_data(), args.repeat)
+            print(f"  {provider_name:<8} serialize {ms:8.2f} ms  {len(encoded):>10,} bytes")
+        # Compress what the app would send: the orjson body when it's available
+        body = encoded
+        for encoding in encodings:
+            compressed, ms = timed(lambda: compressor.compress(body, encoding), max(1, args.repeat // 5))
+            print(f"  {encoding:<8} compress  {ms:8.2f} ms  {len(compressed):>10,} bytes "
+                  f"({len(compressed) / len(body):.1%} of raw)")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Benchmark: message broadcast latency during a login storm, with and without the hashing pool
+
+Starts the backend in a subprocess against a temporary SQLite database, joins a
+few Socket.IO listeners to one channel and sends a steady stream of messages,
+first on a quiet server and then while many clients log in at once. Each run is
+repeated per PASSWORD_HASH_WORKERS value (0 hashes inline, as before the pool).
+
+Requires python-socketio's asyncio client (`pip install aiohttp`).
+
+Usage (from the backend directory):
+    python scripts/bench_login_storm.py --workers 0 4 --logins 32 --mode threading
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SERVER = (
+    "import wsgi; from app import socketio; "
+    "socketio.run(wsgi.app, host='127.0.0.1', port={port}, allow_unsafe_werkzeug=True, use_reloader=False, log_output=False)"
+)
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def start_server(mode, workers, port):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.unlink(path)
+    env = dict(os.environ, AUTO_MIGRATE="1", SOCKETIO_ASYNC_MODE=mode, PASSWORD_HASH_WORKERS=str(workers), DATABASE_URL="sqlite:///" + path)
+    # Own process group, so the hashing workers are stopped together with the server
+    server = subprocess.Popen([sys.executable, "-c", SERVER.format(port=port)], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + "/")
+            break
+        except OSError:
+            time.sleep(0.2)
+    else:
+        stop_server(server)
+        raise RuntimeError("Backend did not start")
+    post(base + "/auth/register", {"username": "bench", "password": "benchmark"})
+    token = post(base + "/auth/login", {"username": "bench", "password": "benchmark"})["token"]
+    return server, base, token, path
+
+
+def stop_server(server):
+    os.killpg(server.pid, signal.SIGKILL)
+    server.wait()
+
+
+def login_loop(base, stop, counts):
+    """Log in repeatedly until `stop` is set (runs in a thread)"""
+    while not stop[0]:
+        try:
+            post(base + "/auth/login", {"username": "bench", "password": "benchmark"})
+            counts["ok"] += 1
+        except urllib.error.HTTPError as e:
+            counts["busy" if e.code == 503 else "failed"] += 1
+        except OSError:
+            counts["failed"] += 1
+
+
+async def measure(sender, received, sent_at, duration, interval):
+    """Send a message every `interval` seconds for `duration`; return every delivery latency"""
+    received.clear()
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        content = f"bench {time.perf_counter()} {i}"
+        sent_at[content] = time.perf_counter()
+        await sender.emit("send_message", {"channel_id": 1, "content": content})
+        i += 1
+        await asyncio.sleep(interval)
+    # Wait for stragglers until deliveries stop for two seconds
+    count = -1
+    while count != len(received):
+        count = len(received)
+        await asyncio.sleep(2)
+    return list(received)
+
+
+async def run(base, token, listeners, logins, duration, interval):
+    received = []
+    sent_at = {}
+    clients = []
+    for _ in range(listeners + 1):
+        client = socketio.AsyncClient(reconnection=False)
+
+        @client.on("new_message")
+        async def on_message(data):
+            if data["content"] in sent_at:
+                received.append(time.perf_counter() - sent_at[data["content"]])
+
+        await client.connect(base, auth={"token": token}, transports=["websocket"], wait_timeout=30)
+        await client.emit("join_channel", {"channel_id": 1})
+        clients.append(client)
+    sender = clients[0]
+    await asyncio.sleep(1)
+
+    quiet = await measure(sender, received, sent_at, duration, interval)
+
+    stop = [False]
+    counts = {"ok": 0, "busy": 0, "failed": 0}
+    loop = asyncio.get_running_loop()
+    threads = ThreadPoolExecutor(max_workers=logins)
+    storm = [loop.run_in_executor(threads, login_loop, base, stop, counts) for _ in range(logins)]
+    began = time.perf_counter()
+    stormy = await measure(sender, received, sent_at, duration, interval)
+    stop[0] = True
+    await asyncio.gather(*storm)
+    logins_per_second = counts["ok"] / (time.perf_counter() - began)
+
+    await asyncio.gather(*(c.disconnect() for c in clients), return_exceptions=True)
+    return quiet, stormy, counts, logins_per_second
+
+
+def percentiles(latencies):
+    if len(latencies) < 2:
+        return "no deliveries"
+    cuts = statistics.quantiles(latencies, n=100)
+    return f"p50 {cuts[49] * 1000:.1f} ms, p95 {cuts[94] * 1000:.1f} ms, p99 {cuts[98] * 1000:.1f} ms ({len(latencies)} deliveries)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", default="threading", choices=["threading", "gevent"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count() or 1],
+                        help="PASSWORD_HASH_WORKERS values to compare (0 = inline hashing)")
+    parser.add_argument("--listeners", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=32, help="concurrent login loops during the storm")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        server, base, token, path = start_server(args.mode, workers, args.port)
+        try:
+            quiet, stormy, counts, rate = asyncio.run(
+                run(base, token, args.listeners, args.logins, args.duration, args.interval))
+        finally:
+            stop_server(server)
+            os.unlink(path)
+
+        label = "inline hashing" if workers == 0 else f"hashing pool, {workers} workers"
+        print(f"{args.mode} / {label}:")
+        print(f"  broadcast latency, quiet:       {percentiles(quiet)}")
+        print(f"  broadcast latency, login storm: {percentiles(stormy)}")
+        print(f"  logins: {rate:.1f}/s ok, {counts['busy']} busy (503), {counts['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark: per-message commit vs. group-commit message writer
+
+Sends messages from several concurrent senders across several channels against a
+temporary SQLite database and reports throughput and send-to-broadcast latency
+(time from submission until the message is durable and would be emitted).
+
+Usage (from the backend directory):
+    python scripts/bench_message_writer.py --messages 5000 --senders 16 --channels 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def setup_app(channels):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.unlink(path)
+    os.environ.update(DATABASE_URL="sqlite:///" + path, AUTO_MIGRATE="1")
+
+    from app import create_app, db
+    app = create_app()
+    with app.app_context():
+        user = app.User(username="bench", password="x")
+        db.session.add(user)
+        for i in range(channels - 1):
+            db.session.add(app.Channel(name=f"bench-{i}"))
+        db.session.commit()
+        channel_ids = [c.id for c in app.Channel.query.all()]
+        user_id = user.id
+    return app, user_id, channel_ids, path
+
+
+def run_senders(total, senders, send_one):
+    per_sender = total // senders
+    threads = [threading.Thread(target=lambda i=i: [send_one(i, n) for n in range(per_sender)]) for i in range(senders)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return per_sender * senders, start
+
+
+def bench_per_message(app, user_id, channel_ids, total, senders):
+    latencies = []
+    lock = threading.Lock()
+
+    def send_one(sender, n):
+        began = time.perf_counter()
+        with app.app_context():
+            msg = app.Message(content=f"message {n}", user_id=user_id, channel_id=channel_ids[(sender + n) % len(channel_ids)])
+            app.db.session.add(msg)
+            app.db.session.commit()
+            _ = msg.id
+        with lock:
+            latencies.append(time.perf_counter() - began)
+
+    sent, start = run_senders(total, senders, send_one)
+    return sent, time.perf_counter() - start, latencies
+
+
+def bench_group_commit(app, user_id, channel_ids, total, senders):
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Semaphore(0)
+
+    def send_one(sender, n):
+        began = time.perf_counter()
+
+        def broadcast(pending):
+            with lock:
+                latencies.append(time.perf_counter() - began)
+            done.release()
+
+        app.message_writer.submit(user_id, channel_ids[(sender + n) % len(channel_ids)], f"message {n}", callback=broadcast)
+
+    sent, start = run_senders(total, senders, send_one)
+    for _ in range(sent):
+        done.acquire()
+    return sent, time.perf_counter() - start, latencies
+
+
+def report(name, sent, elapsed, latencies):
+    print(f"{name}:")
+    print(f"  throughput: {sent / elapsed:,.0f} messages/s ({sent} messages in {elapsed:.2f}s)")
+    print(f"  latency p50: {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"  latency p99: {percentile(latencies, 99) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--senders", type=int, default=16)
+    parser.add_argument("--channels", type=int, default=8)
+    args = parser.parse_args()
+
+    app, user_id, channel_ids, path = setup_app(args.channels)
+    try:
+        report("per-message commit", *bench_per_message(app, user_id, channel_ids, args.messages, args.senders))
+        report("group commit", *bench_group_commit(app, user_id, channel_ids, args.messages, args.senders))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
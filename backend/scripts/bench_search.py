@@ -0,0 +1,123 @@
+"""Benchmark: FTS5 message search vs. LIKE scan on a large corpus
+
+Seeds a temporary SQLite database (migrated with the app's migrations, so the FTS5
+index and its triggers are live) with a synthetic multi-million-message history,
+then times ranked searches through both search backends.
+
+Usage (from the backend directory):
+    python scripts/bench_search.py --messages 2000000 --channels 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WORDS = ("deploy build release hotfix review merge branch ticket meeting lunch coffee standup "
+         "database index query latency timeout error crash rollback migration backup server client "
+         "socket channel message reaction emoji profile login password token cache memory disk "
+         "network proxy gateway cluster node worker queue redis postgres sqlite python react").split()
+SYLLABLES = "ka lo mi re tu sa ne po vi da ho ru be fi go".split()
+QUERIES = ["deploy", "rollback migration", "redis timeout", "lunch", "memo", "socket error crash", "karu", "mipotu"]
+
+
+def vocabulary(rng, size=20000):
+    """Real chat words first (most frequent), then a long tail of made-up words"""
+    words = list(WORDS)
+    while len(words) < size:
+        words.append("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return words
+
+
+def pick(rng, words):
+    # Zipf-like: a few words are very common, most are rare
+    return words[min(len(words) - 1, int(rng.paretovariate(0.8)) - 1)]
+
+
+def seed(app, messages, channels):
+    from sqlalchemy import text
+    db = app.db
+    rng = random.Random(42)
+    words = vocabulary(rng)
+    with app.app_context():
+        db.session.execute(text("INSERT INTO user (username, password) VALUES ('bench', 'x')"))
+        for i in range(channels):
+            db.session.execute(text("INSERT OR IGNORE INTO channel (name) VALUES (:name)"), {"name": f"bench-{i}"})
+        channel_ids = [row[0] for row in db.session.execute(text("SELECT id FROM channel"))]
+        start = datetime(2024, 1, 1)
+        batch = []
+        for n in range(messages):
+            batch.append({
+                "content": " ".join(pick(rng, words) for _ in range(rng.randint(4, 20))),
+                "timestamp": start + timedelta(seconds=n),
+                "channel_id": rng.choice(channel_ids),
+            })
+            if len(batch) == 10000:
+                db.session.execute(text(
+                    "INSERT INTO message (content, timestamp, user_id, channel_id) VALUES (:content, :timestamp, 1, :channel_id)"
+                ), batch)
+                db.session.commit()
+                batch = []
+        if batch:
+            db.session.execute(text(
+                "INSERT INTO message (content, timestamp, user_id, channel_id) VALUES (:content, :timestamp, 1, :channel_id)"
+            ), batch)
+            db.session.commit()
+        return channel_ids
+
+
+def time_queries(app, index, channel_id, repeat):
+    timings = []
+    with app.app_context():
+        for _ in range(repeat):
+            for query in QUERIES:
+                began = time.perf_counter()
+                index.search(query, channel_id=channel_id, limit=20)
+                timings.append(time.perf_counter() - began)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.unlink(path)
+    os.environ.update(DATABASE_URL="sqlite:///" + path, AUTO_MIGRATE="1")
+    try:
+        from app import create_app
+        from search import FTS5SearchIndex, LikeSearchIndex
+        app = create_app()
+
+        began = time.perf_counter()
+        channel_ids = seed(app, args.messages, args.channels)
+        print(f"seeded {args.messages:,} messages (with incremental indexing) in {time.perf_counter() - began:.1f}s")
+
+        with app.app_context():
+            began = time.perf_counter()
+            FTS5SearchIndex(app.db, app.message_archive).rebuild()
+            print(f"full index rebuild: {time.perf_counter() - began:.1f}s")
+
+        backends = [("fts5", FTS5SearchIndex(app.db, app.message_archive)),
+                    ("like", LikeSearchIndex(app.db, app.Message, app.User, app.Channel, app.message_archive))]
+        for scope, channel_id in (("global", None), ("channel", channel_ids[0])):
+            for name, index in backends:
+                repeat = args.repeat if name == "fts5" else 1
+                timings = time_queries(app, index, channel_id, repeat)
+                print(f"{name} {scope} search: p50 {statistics.median(timings) * 1000:.1f} ms, "
+                      f"max {max(timings) * 1000:.1f} ms over {len(timings)} queries")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
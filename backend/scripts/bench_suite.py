@@ -0,0 +1,334 @@
+"""Benchmark suite: REST and Socket.IO load against a seeded backend
+
+Starts the backend (`create_app()` via wsgi) in a subprocess against a temporary
+SQLite database, seeds it with users, channels and message history of the
+requested size, then runs:
+
+  rest_history  GET /chat/channels/<id>/messages (latest page and `before=` pages)
+  rest_login    POST /auth/login
+  socket_fanout N python-socketio clients joining channels, typing and sending
+                messages; latency is send -> delivery at every member
+  reactions     POST /chat/messages/<id>/reactions from the same clients
+
+and reports throughput, p50/p95/p99 latency and the server's peak RSS. Results
+can be saved as JSON and compared with an earlier run.
+
+Requires python-socketio's asyncio client (`pip install aiohttp`).
+
+Usage (from the backend directory):
+    python scripts/bench_suite.py --messages 200000 --clients 200 --output before.json
+    python scripts/bench_suite.py --messages 200000 --clients 200 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+import aiohttp
+import socketio
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SERVER = (
+    "import wsgi; from app import socketio; "
+    "socketio.run(wsgi.app, host='127.0.0.1', port={port}, allow_unsafe_werkzeug=True, use_reloader=False, log_output=False)"
+)
+
+PASSWORD = "benchmark"
+EMOJIS = ["👍", "🎉", "❤️", "😂", "🚀"]
+
+
+def start_server(mode, port):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.unlink(path)
+    env = dict(os.environ, AUTO_MIGRATE="1", SOCKETIO_ASYNC_MODE=mode, DATABASE_URL="sqlite:///" + path)
+    # Own process group, so helper processes (e.g. hashing workers) are stopped with it
+    server = subprocess.Popen([sys.executable, "-c", SERVER.format(port=port)], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(150):
+        try:
+            urllib.request.urlopen(base + "/")
+            return server, base, path
+        except OSError:
+            time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError("Backend did not start")
+
+
+def stop_server(server):
+    os.killpg(server.pid, signal.SIGKILL)
+    server.wait()
+
+
+def peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def seed(base, path, users, channels, messages):
+    """Create users and channels through the API, then bulk-insert history straight into SQLite"""
+    async with aiohttp.ClientSession() as http:
+        for i in range(users):
+            async with http.post(base + "/auth/register", json={"username": f"bench{i}", "password": PASSWORD}) as r:
+                await r.read()
+        async with http.post(base + "/auth/login", json={"username": "bench0", "password": PASSWORD}) as r:
+            token = (await r.json())["token"]
+        headers = {"Authorization": "Bearer " + token}
+        for i in range(channels - 1):
+            async with http.post(base + "/chat/channels", json={"name": f"bench-{i}"}, headers=headers) as r:
+                await r.read()
+
+    db = sqlite3.connect(path, timeout=30)
+    channel_ids = [row[0] for row in db.execute("SELECT id FROM channel")]
+    user_ids = [row[0] for row in db.execute("SELECT id FROM user")]
+    rng = random.Random(42)
+    start = datetime.utcnow() - timedelta(seconds=messages)
+    rows = []
+    for n in range(messages):
+        rows.append((f"seeded message {n} " + " ".join(rng.choice(EMOJIS) for _ in range(3)),
+                     (start + timedelta(seconds=n)).isoformat(sep=" "), rng.choice(user_ids), rng.choice(channel_ids)))
+        if len(rows) == 10000:
+            db.executemany("INSERT INTO message (content, timestamp, user_id, channel_id) VALUES (?, ?, ?, ?)", rows)
+            db.commit()
+            rows = []
+    if rows:
+        db.executemany("INSERT INTO message (content, timestamp, user_id, channel_id) VALUES (?, ?, ?, ?)", rows)
+    # Seeded rows bypass the app, so invalidate cached history versions
+    db.execute("UPDATE change_version SET version = version + 1")
+    db.execute("ANALYZE")
+    db.commit()
+    # Message ids per channel, for `before=` cursors
+    history = {channel_id: [] for channel_id in channel_ids}
+    for message_id, channel_id in db.execute("SELECT id, channel_id FROM message"):
+        history[channel_id].append(message_id)
+    db.close()
+    return channel_ids, history
+
+
+def summarize(latencies, errors, elapsed):
+    result = {"count": len(latencies), "errors": errors, "seconds": round(elapsed, 3),
+              "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0}
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100)
+        result.update(p50_ms=round(cuts[49] * 1000, 2), p95_ms=round(cuts[94] * 1000, 2),
+                      p99_ms=round(cuts[98] * 1000, 2))
+    return result
+
+
+async def run_requests(make_request, total, concurrency):
+    """Issue `total` requests from `concurrency` workers; returns (latencies, errors, elapsed)"""
+    latencies = []
+    errors = [0]
+    remaining = [total]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            began = time.perf_counter()
+            try:
+                ok = await make_request()
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - began)
+            else:
+                errors[0] += 1
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors[0], time.perf_counter() - began
+
+
+async def bench_history(base, token, history, total, concurrency):
+    rng = random.Random(1)
+    headers = {"Authorization": "Bearer " + token}
+    async with aiohttp.ClientSession(headers=headers) as http:
+        async def request():
+            channel_id = rng.choice(list(history))
+            ids = history[channel_id]
+            params = {"before": rng.choice(ids)} if ids and rng.random() < 0.5 else {}
+            async with http.get(f"{base}/chat/channels/{channel_id}/messages", params=params) as r:
+                await r.read()
+                return r.status == 200
+        return summarize(*await run_requests(request, total, concurrency))
+
+
+async def bench_login(base, users, total, concurrency):
+    rng = random.Random(2)
+    async with aiohttp.ClientSession() as http:
+        async def request():
+            payload = {"username": f"bench{rng.randrange(users)}", "password": PASSWORD}
+            async with http.post(base + "/auth/login", json=payload) as r:
+                await r.read()
+                return r.status == 200
+        return summarize(*await run_requests(request, total, concurrency))
+
+
+async def bench_sockets(base, users, channel_ids, clients, per_client, interval):
+    """Clients spread over the channels type, send messages and react; returns (fan-out, reactions) summaries"""
+    async with aiohttp.ClientSession() as http:
+        tokens = []
+        for i in range(min(users, clients)):
+            async with http.post(base + "/auth/login", json={"username": f"bench{i}", "password": PASSWORD}) as r:
+                tokens.append((await r.json())["token"])
+
+        sent_at = {}
+        deliveries = []
+        message_ids = []
+        connected = []
+        failed = 0
+        for i in range(clients):
+            client = socketio.AsyncClient(reconnection=False)
+            channel_id = channel_ids[i % len(channel_ids)]
+
+            @client.on("new_message")
+            async def on_message(data):
+                began = sent_at.get(data["content"])
+                if began is not None:
+                    deliveries.append(time.perf_counter() - began)
+                    message_ids.append(data["id"])
+
+            try:
+                await client.connect(base, auth={"token": tokens[i % len(tokens)]}, transports=["websocket"], wait_timeout=30)
+                await client.emit("join_channel", {"channel_id": channel_id})
+                connected.append((client, channel_id, tokens[i % len(tokens)]))
+            except Exception:
+                failed += 1
+        await asyncio.sleep(1)
+
+        reaction_latencies = []
+        reaction_errors = [0]
+
+        async def chat(index, client, channel_id, token):
+            rng = random.Random(index)
+            await asyncio.sleep(rng.random() * interval)
+            for n in range(per_client):
+                await client.emit("typing", {"channel_id": channel_id, "is_typing": True})
+                content = f"bench {index} {n}"
+                sent_at[content] = time.perf_counter()
+                await client.emit("send_message", {"channel_id": channel_id, "content": content})
+                if message_ids:
+                    began = time.perf_counter()
+                    async with http.post(f"{base}/chat/messages/{rng.choice(message_ids)}/reactions",
+                                         json={"emoji": rng.choice(EMOJIS)},
+                                         headers={"Authorization": "Bearer " + token}) as r:
+                        await r.read()
+                        if r.status in (200, 201):
+                            reaction_latencies.append(time.perf_counter() - began)
+                        else:
+                            reaction_errors[0] += 1
+                await asyncio.sleep(interval)
+
+        began = time.perf_counter()
+        await asyncio.gather(*(chat(i, *entry) for i, entry in enumerate(connected)))
+        # Wait for stragglers until deliveries stop for two seconds
+        count = -1
+        while count != len(deliveries):
+            count = len(deliveries)
+            await asyncio.sleep(2)
+        elapsed = time.perf_counter() - began
+
+        await asyncio.gather(*(c.disconnect() for c, _, _ in connected), return_exceptions=True)
+
+    fanout = summarize(deliveries, failed, elapsed)
+    fanout["messages_sent"] = len(sent_at)
+    return fanout, summarize(reaction_latencies, reaction_errors[0], elapsed)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    for name, result in results["scenarios"].items():
+        line = f"{name:14} {result['throughput']:>9.1f}/s"
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in result:
+                line += f"  {key[:3]} {result[key]:>8.2f} ms"
+        line += f"  ({result['count']} ok, {result['errors']} errors)"
+        previous = (baseline or {}).get("scenarios", {}).get(name)
+        if previous and previous.get("p99_ms") and result.get("p99_ms"):
+            line += f"  p99 {(result['p99_ms'] / previous['p99_ms'] - 1) * 100:+.0f}%"
+            line += f", throughput {(result['throughput'] / previous['throughput'] - 1) * 100:+.0f}% vs {baseline.get('commit')}"
+        print(line)
+    print(f"server peak RSS: {results['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", default="threading", choices=["threading", "gevent"])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=100000, help="seeded history size")
+    parser.add_argument("--clients", type=int, default=100, help="simulated Socket.IO clients")
+    parser.add_argument("--messages-per-client", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.2, help="seconds between a client's messages")
+    parser.add_argument("--history-requests", type=int, default=2000)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    server, base, path = start_server(args.mode, args.port)
+    try:
+        began = time.perf_counter()
+        channel_ids, history = asyncio.run(seed(base, path, args.users, args.channels, args.messages))
+        print(f"seeded {args.users} users, {len(channel_ids)} channels, {args.messages:,} messages "
+              f"in {time.perf_counter() - began:.1f}s")
+
+        async def scenarios():
+            async with aiohttp.ClientSession() as http:
+                async with http.post(base + "/auth/login", json={"username": "bench0", "password": PASSWORD}) as r:
+                    token = (await r.json())["token"]
+            results = {}
+            results["rest_history"] = await bench_history(base, token, history, args.history_requests,
+                                                          args.concurrency)
+            results["rest_login"] = await bench_login(base, args.users, args.logins, args.concurrency)
+            results["socket_fanout"], results["reactions"] = await bench_sockets(
+                base, args.users, channel_ids, args.clients, args.messages_per_client, args.interval)
+            return results
+
+        results = {
+            "commit": git_commit(),
+            "date": datetime.utcnow().isoformat(),
+            "config": vars(args),
+            "scenarios": asyncio.run(scenarios()),
+            "peak_rss_mb": round(peak_rss_mb(server.pid), 1),
+        }
+    finally:
+        stop_server(server)
+        os.unlink(path)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
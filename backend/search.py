@@ -0,0 +1,204 @@
+import html
+
+import click
+from sqlalchemy import DateTime, bindparam, text
+
+from archive import history_key, row_message
+
+# Private-use characters mark snippet matches so the content can be HTML-escaped
+# before the markers are turned into <mark> tags
+MARK_START = "\ue000"
+MARK_END = "\ue001"
+
+
+def format_snippet(raw):
+    """HTML-escape a snippet and highlight its matches with <mark>"""
+    return html.escape(raw).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def fts_query(query):
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix"""
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class FTS5SearchIndex:
+    """Ranked full-text search over the `message_fts` and `archived_message_fts` SQLite FTS5 indexes
+
+    Hot messages are indexed by triggers on the message table; archived ones
+    are added and removed by the archive as they move between the tiers. Both
+    indexes are queried together and ranked by bm25, which is computed per
+    index, so the ordering across tiers is approximate.
+    """
+
+    name = "fts5"
+
+    def __init__(self, db, archive):
+        self.db = db
+        self.archive = archive
+
+    def search(self, query, channel_id=None, limit=20, offset=0):
+        hot_filter = archived_filter = ""
+        params = {"query": fts_query(query), "mark_start": MARK_START, "mark_end": MARK_END,
+                  "limit": limit, "offset": offset}
+        if channel_id is not None:
+            hot_filter = " AND m.channel_id = :channel_id"
+            archived_filter = " AND archived_message_fts.channel_id = :channel_id"
+            params["channel_id"] = channel_id
+        sql = f"""
+            SELECT m.id AS id, m.channel_id AS channel_id, m.content AS content, m.timestamp AS timestamp,
+                   u.username AS username,
+                   snippet(message_fts, 0, :mark_start, :mark_end, '…', 16) AS snippet,
+                   message_fts.rank AS rank
+            FROM message_fts
+            JOIN message m ON m.id = message_fts.rowid
+            JOIN user u ON u.id = m.user_id
+            JOIN channel c ON c.id = m.channel_id AND c.deleted_at IS NULL
+            WHERE message_fts MATCH :query{hot_filter}
+            UNION ALL
+            SELECT archived_message_fts.rowid, archived_message_fts.channel_id, archived_message_fts.content,
+                   archived_message_fts.timestamp, archived_message_fts.username,
+                   snippet(archived_message_fts, 0, :mark_start, :mark_end, '…', 16),
+                   archived_message_fts.rank
+            FROM archived_message_fts
+            JOIN channel c ON c.id = archived_message_fts.channel_id AND c.deleted_at IS NULL
+            WHERE archived_message_fts MATCH :query{archived_filter}
+            ORDER BY rank, id DESC LIMIT :limit OFFSET :offset
+        """
+
+        return [{
+            "id": row.id,
+            "channel_id": row.channel_id,
+            "content": row.content,
+            "user": row.username,
+            "time": row.timestamp.isoformat(),
+            "snippet": format_snippet(row.snippet)
+        } for row in self.db.session.execute(text(sql).columns(timestamp=DateTime), params)]
+
+    def add_archived(self, channel_id, messages):
+        """Index messages as they move to the archive (replacing earlier entries); the caller commits"""
+        if not messages:
+            return
+        self.remove_archived(channel_id, [message.id for message in messages])
+        self.db.session.execute(
+            text("INSERT INTO archived_message_fts (rowid, content, channel_id, username, timestamp) "
+                 "VALUES (:id, :content, :channel_id, :username, :timestamp)")
+            .bindparams(bindparam("timestamp", type_=DateTime)),
+            [{"id": message.id, "content": message.content, "channel_id": channel_id,
+              "username": message.username, "timestamp": message.timestamp} for message in messages]
+        )
+
+    def remove_archived(self, channel_id, message_ids=None):
+        """Drop archived messages (all of a channel's if `message_ids` is None); the caller commits"""
+        if message_ids is None:
+            self.db.session.execute(text("DELETE FROM archived_message_fts WHERE channel_id = :channel_id"),
+                                    {"channel_id": channel_id})
+            return
+        self.db.session.execute(text("DELETE FROM archived_message_fts WHERE rowid = :id"),
+                                [{"id": message_id} for message_id in message_ids])
+
+    def rebuild(self):
+        self.db.session.execute(text("INSERT INTO message_fts(message_fts) VALUES ('rebuild')"))
+        self.db.session.execute(text("INSERT INTO message_fts(message_fts) VALUES ('optimize')"))
+        self.db.session.execute(text("DELETE FROM archived_message_fts"))
+        for channel_id in self.archive.channels():
+            for entry in self.archive.index(channel_id):
+                self.add_archived(channel_id, self.archive.block(channel_id, entry))
+        self.db.session.execute(text("INSERT INTO archived_message_fts(archived_message_fts) VALUES ('optimize')"))
+        self.db.session.commit()
+
+
+class LikeSearchIndex:
+    """Fallback substring search for databases without FTS5; newest matches first
+
+    Archived messages are matched by reading the channels' archive segments.
+    Channels being deleted are left out of both tiers.
+    """
+
+    name = "like"
+
+    def __init__(self, db, Message, User, Channel, archive):
+        self.db = db
+        self.Message = Message
+        self.User = User
+        self.Channel = Channel
+        self.archive = archive
+
+    def search(self, query, channel_id=None, limit=20, offset=0):
+        Message, User, Channel = self.Message, self.User, self.Channel
+        terms = query.split()
+        q = self.db.session.query(Message, User.username).join(User, Message.user_id == User.id) \
+            .join(Channel, Message.channel_id == Channel.id).filter(Channel.deleted_at.is_(None))
+        for term in terms:
+            escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            q = q.filter(Message.content.ilike(f"%{escaped}%", escape="\\"))
+        if channel_id is not None:
+            q = q.filter(Message.channel_id == channel_id)
+        rows = q.order_by(Message.timestamp.desc(), Message.id.desc()).limit(offset + limit).all()
+        rows += self.search_archive(terms, channel_id, offset + limit)
+        rows.sort(key=history_key, reverse=True)
+        results = []
+        for row in rows[offset:offset + limit]:
+            m = row_message(row)
+            results.append({
+                "id": m.id,
+                "channel_id": m.channel_id,
+                "content": m.content,
+                # Hot rows carry the author's username beside the message, archived messages on it
+                "user": row.username,
+                "time": m.timestamp.isoformat(),
+                "snippet": html.escape(m.content)
+            })
+        return results
+
+    def search_archive(self, terms, channel_id, limit):
+        """The newest `limit` archived messages containing every term"""
+        terms = [term.casefold() for term in terms]
+        Channel = self.Channel
+        live = self.db.session.query(Channel.id).filter(Channel.deleted_at.is_(None))
+        if channel_id is not None:
+            live = live.filter(Channel.id == channel_id)
+        channel_ids = {row[0] for row in live}
+        found = [message
+                 for cid in self.archive.channels() if cid in channel_ids
+                 for message in self.archive.all(cid)
+                 if all(term in message.content.casefold() for term in terms)]
+        found.sort(key=history_key, reverse=True)
+        return found[:limit]
+
+    def add_archived(self, channel_id, messages):
+        pass
+
+    def remove_archived(self, channel_id, message_ids=None):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+def create_search_index(app):
+    """Pick the search backend: SEARCH_BACKEND=fts5|like, or auto-detect the FTS5 index"""
+    db = app.db
+    backend = app.config.get("SEARCH_BACKEND", "auto")
+    if backend == "auto":
+        has_fts = db.engine.dialect.name == "sqlite" and db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'")
+        ).first() is not None
+        backend = "fts5" if has_fts else "like"
+    if backend == "fts5":
+        return FTS5SearchIndex(db, app.message_archive)
+    return LikeSearchIndex(db, app.Message, app.User, app.Channel, app.message_archive)
+
+
+def register_commands(app):
+    @app.cli.group("search")
+    def search_cli():
+        """Full-text message search index"""
+
+    @search_cli.command("rebuild")
+    def rebuild():
+        """Rebuild the search index from the message table and the archive"""
+        app.search_index.rebuild()
+        click.echo(f"Rebuilt '{app.search_index.name}' search index")
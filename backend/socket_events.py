@@ -1,214 +1,442 @@
-from flask_socketio import emit, join_room, leave_room
+import threading
+import time
+from flask import request
+from flask_socketio import disconnect, emit, join_room, leave_room
 from flask_jwt_extended import decode_token
-from models import init_models
+from typing_state import TypingTracker
+from presence import create_presence_store
+from concurrency import run_blocking
+from metrics import Metrics
+from archive import row_message
+from routes import format_history, latest_history, sequence_cursor
+from message_writer import ChannelNotFound
+from sync import live_channel_version
+from log_pipeline import get_logger
+
+log = get_logger('socket')
+presence_log = get_logger('presence')
+typing_log = get_logger('socket.typing')
 
 # Global variable to store the socketio instance
 _socketio = None
 _db = None
+_metrics = None
+
+# Track online users per channel (in-process, or shared across workers through Redis)
+_presence = None
+
+# Authenticated socket sessions, filled once at connect (or on the first event carrying a token)
+_sessions = {}  # {sid: {'user_id', 'username', 'rooms': set(channel_ids), 'token', 'expires': exp or None}}
+_lock = threading.Lock()
+
+# Coalesced typing indicators
+_typing = None
 
-# Track online users per channel
-_online_users = {}  # {channel_id: {user_id: username}}
+# Presence entries are leases: renewed for this worker's live sockets every third of
+# the TTL and expired by any worker once stale (e.g. left behind by a crashed node)
+_presence_ttl = 60.0
+_presence_started = False
 
-def init_socket_events(socketio_instance, db_instance):
+def init_socket_events(socketio_instance, db_instance, config=None, metrics=None, profiler=None):
     """Initialize socket events with the socketio and db instances"""
-    global _socketio, _db
+    global _socketio, _db, _metrics, _typing, _presence, _presence_ttl
     _socketio = socketio_instance
     _db = db_instance
+    _metrics = metrics or Metrics()
     
-    # Register all event handlers
-    _socketio.on_event('connect', handle_connect)
-    _socketio.on_event('disconnect', handle_disconnect)
-    _socketio.on_event('join_channel', handle_join_channel)
-    _socketio.on_event('leave_channel', handle_leave_channel)
-    _socketio.on_event('send_message', handle_send_message)
-    _socketio.on_event('typing', handle_typing)
-
-def emit_online_status(channel_id):
-    """Emit online status for a channel to all users in that channel"""
-    if channel_id in _online_users:
-        online_count = len(_online_users[channel_id])
-        online_users = list(_online_users[channel_id].values())
-        
-        room = f'channel_{channel_id}'
-        emit('online_status', {
-            'channel_id': channel_id,
-            'online_count': online_count,
-            'online_users': online_users
-        }, room=room)
-        
-        print(f"Emitted online status for channel {channel_id}: {online_count} users online")
+    config = config or {}
+    _presence = create_presence_store(config.get("PRESENCE_STORE_URL"))
+    _presence_ttl = config.get("PRESENCE_TTL", 60.0)
+    _typing = TypingTracker(
+        socketio_instance,
+        timeout=config.get("TYPING_TIMEOUT", 5.0),
+        interval=config.get("TYPING_BROADCAST_INTERVAL_MS", 500) / 1000.0,
+        metrics=_metrics
+    )
+    
+    # Register all event handlers, timed per event (and SQL-profiled if enabled)
+    for event, handler in (('connect', handle_connect),
+                           ('disconnect', handle_disconnect),
+                           ('join_channel', handle_join_channel),
+                           ('leave_channel', handle_leave_channel),
+                           ('get_presence', handle_get_presence),
+                           ('send_message', handle_send_message),
+                           ('typing', handle_typing)):
+        if profiler is not None:
+            handler = profiler.socket_handler(event, handler)
+        _socketio.on_event(event, _metrics.socket_handler(event, handler))
+    
+    _metrics.gauge('socketio_connected_sockets', 'Sockets connected to this worker',
+                   lambda: len(_socketio.server.manager.rooms.get('/', {}).get(None, ())))
+    _metrics.gauge('socketio_authenticated_sockets', 'Authenticated sockets on this worker', lambda: len(_sessions))
+
+def presence_snapshot(channel_id):
+    """The full online list of a channel with its current sequence number"""
+    members, seq = _presence.snapshot(channel_id)
+    return {
+        'channel_id': channel_id,
+        'seq': seq,
+        'online_count': len(members),
+        'users': members
+    }
+
+def emit_presence_snapshot(channel_id, sid, snapshot=None):
+    """Send one socket a channel's presence snapshot"""
+    _socketio.emit('presence_snapshot', snapshot or presence_snapshot(channel_id), to=sid)
+
+def history_snapshot(channel_id, user_id, limit=None):
+    """The latest messages of a channel and the seq cursor live `new_message` events follow
+
+    Every message numbered up to `seq` is in (or older than) the returned
+    page, and every later one is broadcast with a higher `seq`, so a client
+    that joined the room first drops events with `seq <= cursor` and misses
+    nothing. Returns None if the channel doesn't exist or is being deleted.
+    """
+    from flask import current_app
+    app = current_app._get_current_object()
+    limit = min(limit or app.config['MESSAGES_PAGE_SIZE'], app.config['MESSAGES_MAX_PAGE_SIZE'])
+    
+    def load():
+        with app.app_context():
+            version = live_channel_version(_db.session, channel_id)
+            if version is None:
+                return None
+            page, has_more = latest_history(channel_id, version, limit)
+            return {
+                'messages': format_history(page, int(user_id)),
+                'next_cursor': row_message(page[0]).id if has_more else None,
+                'seq': sequence_cursor(page)
+            }
+    
+    return run_blocking(load)
+
+def emit_presence_delta(channel_id, seq, user_id, username, online, skip_sid=None):
+    """Broadcast one user coming online or going offline in a channel
+
+    Deltas are numbered per channel; a client that sees a gap asks for a new
+    snapshot with `get_presence`.
+    """
+    room = f'channel_{channel_id}'
+    _metrics.observe_fanout(_socketio, 'presence_delta', room)
+    _socketio.emit('presence_delta', {
+        'channel_id': channel_id,
+        'seq': seq,
+        'user_id': str(user_id),
+        'username': username,
+        'online': online
+    }, to=room, skip_sid=skip_sid)
+    
+    presence_log.debug('presence changed', extra={'channel_id': channel_id, 'user_id': user_id, 'online': online, 'seq': seq})
+
+def start_presence_loop():
+    """Start the lease renewal / expiry loop once"""
+    global _presence_started
+    with _lock:
+        if _presence_started:
+            return
+        _presence_started = True
+    _socketio.start_background_task(presence_loop)
+
+def presence_loop():
+    while True:
+        _socketio.sleep(_presence_ttl / 3)
+        try:
+            # Sockets still connected here are alive (Engine.IO pings drop dead ones)
+            with _lock:
+                leases = [(channel_id, session['user_id'], sid)
+                          for sid, session in _sessions.items() for channel_id in session['rooms']]
+            for channel_id, user_id, sid in leases:
+                _presence.touch(channel_id, user_id, sid, _presence_ttl)
+            for channel_id, user_id, username, seq in _presence.expire():
+                emit_presence_delta(int(channel_id), seq, user_id, username, False)
+        except Exception:
+            presence_log.exception('Error expiring presence')
+
+def authenticate(token):
+    """Verify a token and look up its user, returning a new session entry or None"""
+    from flask import current_app
+    app = current_app._get_current_object()
+    
+    def lookup():
+        with app.app_context():
+            decoded = decode_token(token)
+            user_id = decoded['sub']
+            user = app.User.query.get(user_id)
+            if not user:
+                return None
+            return {'user_id': user_id, 'username': user.username, 'rooms': set(),
+                    'token': token, 'expires': decoded.get('exp')}
+    
+    return run_blocking(lookup)
+
+def channel_id_of(data):
+    """The event's channel id as an int, or None; clients may send it as a number or a numeric string"""
+    try:
+        channel_id = int(data.get('channel_id'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return channel_id if channel_id > 0 else None
+
+def renew(session, token):
+    """Move a session onto a newer token for the same user; False if the token isn't one"""
+    if not token or token == session['token']:
+        return False
+    try:
+        decoded = decode_token(token)
+    except Exception:
+        return False
+    if decoded['sub'] != session['user_id']:
+        return False
+    session['token'], session['expires'] = token, decoded.get('exp')
+    return True
+
+def get_session(data=None):
+    """Return the session for the current socket, authenticating on first use
 
-def handle_connect():
+    A session lives only as long as its token: once that expires, the next event
+    must carry a newer token for the same user or the socket is disconnected.
+    """
+    session = _sessions.get(request.sid)
+    token = data.get('token') if data else None
+    if session is None:
+        if token:
+            session = authenticate(token)
+            if session:
+                with _lock:
+                    _sessions[request.sid] = session
+        return session
+    if session['expires'] is not None and session['expires'] <= time.time() and not renew(session, token):
+        log.info('socket token expired', extra={'sid': request.sid, 'user_id': session['user_id']})
+        disconnect()
+        return None
+    return session
+
+def add_presence(session, channel_id, sid):
+    """Mark a socket's user online in a channel; the presence sequence number if they just came online"""
+    with _lock:
+        if channel_id in session['rooms']:
+            return None
+        session['rooms'].add(channel_id)
+    start_presence_loop()
+    return _presence.add(channel_id, session['user_id'], session['username'], sid, _presence_ttl)
+
+def remove_presence(session, channel_id, sid):
+    """Drop a socket from a channel; the presence sequence number if its user has no socket left there"""
+    with _lock:
+        if channel_id not in session['rooms']:
+            return None
+        session['rooms'].discard(channel_id)
+    return _presence.remove(channel_id, session['user_id'], sid)
+
+def handle_connect(auth=None):
     """Handle client connection"""
-    print('Client connected')
+    log.debug('client connected', extra={'sid': request.sid})
+    
+    # Authenticate once per socket; later events are served from the registry
+    if auth and auth.get('token'):
+        try:
+            session = authenticate(auth['token'])
+            if session:
+                with _lock:
+                    _sessions[request.sid] = session
+        except Exception as e:
+            log.warning('Error authenticating socket: %s', e)
+    
     emit('status', {'msg': 'Connected to chat server'})
 
-def handle_disconnect():
+def handle_disconnect(reason=None):
     """Handle client disconnection"""
-    print('Client disconnected')
+    sid = request.sid
+    log.debug('client disconnected', extra={'sid': sid, 'reason': reason})
+    with _lock:
+        session = _sessions.pop(sid, None)
+    if not session:
+        return
     
-    # Note: We can't easily track which user disconnected without storing socket_id to user_id mapping
-    # For now, we'll rely on the leave_channel events to clean up online users
-    # In a production app, you'd want to store socket_id -> user_id mapping
+    # Clean up presence in every channel this socket had joined
+    for channel_id in list(session['rooms']):
+        _typing.stop(channel_id, session['user_id'])
+        seq = remove_presence(session, channel_id, sid)
+        if seq is not None:
+            log.debug('left channel', extra={'user_id': session['user_id'], 'channel_id': channel_id})
+            emit_presence_delta(channel_id, seq, session['user_id'], session['username'], False, skip_sid=sid)
 
 def handle_join_channel(data):
-    """Handle user joining a channel"""
+    """Handle user joining a channel
+
+    The acknowledgement carries a snapshot of the channel: its latest messages
+    (`limit`, default MESSAGES_PAGE_SIZE), the `seq` cursor live `new_message`
+    events continue from, and the presence list, so opening a channel takes a
+    single round-trip.
+    """
     try:
         # Get token from the data
         token = data.get('token')
-        if not token:
+        if not token and request.sid not in _sessions:
             emit('error', {'msg': 'No token provided'})
-            return
-        
-        # Decode token to get user info
-        decoded = decode_token(token)
-        user_id = decoded['sub']
+            return {'error': 'No token provided'}
         
-        # Get channel ID
-        channel_id = data.get('channel_id')
+        # Get channel ID (one int per channel, so presence and rooms can't split on "1" vs 1)
+        channel_id = channel_id_of(data)
         if not channel_id:
             emit('error', {'msg': 'No channel ID provided'})
-            return
+            return {'error': 'No channel ID provided'}
+        limit = data.get('limit')
+        if limit is not None and (not isinstance(limit, int) or limit < 1):
+            emit('error', {'msg': 'Limit must be a positive number'})
+            return {'error': 'Limit must be a positive number'}
         
-        # Get user info from database
-        from flask import current_app
-        User = current_app.User
-        user = User.query.get(user_id)
-        if not user:
+        # Get user info from the session registry
+        session = get_session(data)
+        if not session:
             emit('error', {'msg': 'User not found'})
-            return
+            return {'error': 'User not found'}
+        user_id = session['user_id']
+        username = session['username']
         
-        # Join the room for this channel
+        # Join the room for this channel before reading its history, so every message
+        # committed after the read is broadcast to this socket
         room = f'channel_{channel_id}'
         join_room(room)
+        history = history_snapshot(channel_id, user_id, limit)
+        if history is None:
+            leave_room(room)
+            emit('error', {'msg': 'Channel not found'})
+            return {'error': 'Channel not found'}
         
         # Track online user
-        if channel_id not in _online_users:
-            _online_users[channel_id] = {}
-        _online_users[channel_id][user_id] = user.username
+        seq = add_presence(session, channel_id, request.sid)
         
-        print(f'User {user.username} (ID: {user_id}) joined channel {channel_id}')
+        log.debug('joined channel', extra={'user_id': user_id, 'channel_id': channel_id})
         emit('status', {'msg': f'Joined channel {channel_id}'}, room=room)
         
-        # Emit updated online status
-        emit_online_status(channel_id)
+        # The joiner gets the full list once; everyone else only hears about the change
+        presence = presence_snapshot(channel_id)
+        emit_presence_snapshot(channel_id, request.sid, presence)
+        if seq is not None:
+            emit_presence_delta(channel_id, seq, user_id, username, True, skip_sid=request.sid)
+        
+        return {'channel_id': channel_id, **history, 'presence': presence}
         
-    except Exception as e:
-        print(f'Error joining channel: {e}')
+    except Exception:
+        log.exception('Error joining channel')
         emit('error', {'msg': 'Failed to join channel'})
+        return {'error': 'Failed to join channel'}
 
 def handle_leave_channel(data):
     """Handle user leaving a channel"""
     try:
-        # Get token from the data
-        token = data.get('token')
-        channel_id = data.get('channel_id')
+        channel_id = channel_id_of(data)
         
         if channel_id:
             room = f'channel_{channel_id}'
             leave_room(room)
             
-            # Remove user from online tracking if token provided
-            if token:
-                try:
-                    decoded = decode_token(token)
-                    user_id = decoded['sub']
-                    
-                    if channel_id in _online_users and user_id in _online_users[channel_id]:
-                        username = _online_users[channel_id][user_id]
-                        del _online_users[channel_id][user_id]
-                        print(f'User {username} (ID: {user_id}) left channel {channel_id}')
-                        
-                        # Emit updated online status
-                        emit_online_status(channel_id)
-                except:
-                    pass  # If token is invalid, just continue
+            # Remove user from online tracking
+            try:
+                session = get_session(data)
+            except Exception:
+                session = None  # If token is invalid, just continue
+            if session:
+                _typing.stop(channel_id, session['user_id'])
+            seq = remove_presence(session, channel_id, request.sid) if session else None
+            if seq is not None:
+                log.debug('left channel', extra={'user_id': session['user_id'], 'channel_id': channel_id})
+                
+                # Tell the rest of the channel
+                emit_presence_delta(channel_id, seq, session['user_id'], session['username'], False)
             
-            print(f'User left channel {channel_id}')
             emit('status', {'msg': f'Left channel {channel_id}'})
-    except Exception as e:
-        print(f'Error leaving channel: {e}')
+    except Exception:
+        log.exception('Error leaving channel')
         emit('error', {'msg': 'Failed to leave channel'})
 
+def handle_get_presence(data):
+    """Re-send a channel's presence snapshot, e.g. after a client spots a sequence gap"""
+    channel_id = channel_id_of(data)
+    if not channel_id:
+        emit('error', {'msg': 'No channel ID provided'})
+        return
+    if not get_session(data):
+        emit('error', {'msg': 'User not found'})
+        return
+    emit_presence_snapshot(channel_id, request.sid)
+
 def handle_send_message(data):
     """Handle sending a message to a channel"""
     try:
         # Get token from the data
         token = data.get('token')
-        if not token:
+        if not token and request.sid not in _sessions:
             emit('error', {'msg': 'No token provided'})
             return
         
-        # Decode token to get user info
-        decoded = decode_token(token)
-        user_id = decoded['sub']
-        
         # Get message data
-        channel_id = data.get('channel_id')
+        channel_id = channel_id_of(data)
         content = data.get('content')
         
         if not channel_id or not content:
             emit('error', {'msg': 'Missing channel ID or content'})
             return
         
-        # Get models from the app context
-        from flask import current_app
-        User = current_app.User
-        Channel = current_app.Channel
-        Message = current_app.Message
-        
-        # Get user info
-        user = User.query.get(user_id)
-        if not user:
+        # Get user info from the session registry
+        session = get_session(data)
+        if not session:
             emit('error', {'msg': 'User not found'})
             return
         
-        # Create and save message
-        new_message = Message(
-            content=content,
-            user_id=user_id,
-            channel_id=channel_id
-        )
-        current_app.db.session.add(new_message)
-        current_app.db.session.commit()
-        
-        # Emit message to all users in the channel
+        # Queue the message for the group-commit writer; it is broadcast
+        # only once its batch is durable and it has its real id
+        from flask import current_app
         room = f'channel_{channel_id}'
-        message_data = {
-            'id': new_message.id,
-            'content': content,
-            'user': user.username,
-            'time': new_message.timestamp.isoformat(),
-            'channel_id': channel_id
-        }
-        
-        emit('new_message', message_data, room=room)
-        
-    except Exception as e:
-        print(f'Error sending message: {e}')
-        import traceback
-        traceback.print_exc()
+        sid = request.sid
+        username = session['username']
+        
+        def broadcast(pending):
+            if isinstance(pending.error, ChannelNotFound):
+                _socketio.emit('error', {'msg': 'Channel not found'}, to=sid)
+                return
+            if pending.error is not None:
+                log.error('Error sending message: %s', pending.error, extra={'channel_id': channel_id})
+                _socketio.emit('error', {'msg': 'Failed to send message'}, to=sid)
+                return
+            
+            # Emit message to all users in the channel
+            message_data = {
+                'id': pending.id,
+                'content': content,
+                'user': username,
+                'time': pending.timestamp.isoformat(),
+                'channel_id': channel_id,
+                # Numbered per channel, after the cursor of the join snapshot
+                'seq': pending.seq
+            }
+            _metrics.observe_fanout(_socketio, 'new_message', room)
+            _socketio.emit('new_message', message_data, to=room)
+        
+        current_app.message_writer.submit(session['user_id'], channel_id, content, callback=broadcast,
+                                          username=username)
+        _typing.stop(channel_id, session['user_id'])
+        
+    except Exception:
+        log.exception('Error sending message')
         emit('error', {'msg': 'Failed to send message'})
 
 def handle_typing(data):
     """Handle typing indicator"""
     try:
-        token = data.get('token')
-        channel_id = data.get('channel_id')
+        channel_id = channel_id_of(data)
         is_typing = data.get('is_typing', False)
         
-        if token and channel_id:
-            decoded = decode_token(token)
-            user_id = decoded['sub']
-            User, Channel, Message = init_models(_db)
-            user = User.query.get(user_id)
+        if channel_id:
+            session = get_session(data)
             
-            if user:
-                room = f'channel_{channel_id}'
-                emit('user_typing', {
-                    'user': user.username,
-                    'is_typing': is_typing
-                }, room=room, include_self=False)
+            if session:
+                typing_log.debug('typing', extra={'user_id': session['user_id'], 'channel_id': channel_id,
+                                                  'is_typing': is_typing})
+                # Only state transitions are broadcast, batched per channel by the tracker
+                _typing.start()
+                _typing.update(channel_id, session['user_id'], session['username'], request.sid, is_typing)
                 
-    except Exception as e:
-        print(f'Error handling typing: {e}')
+    except Exception:
+        log.exception('Error handling typing')
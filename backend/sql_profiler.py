@@ -0,0 +1,166 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from flask import jsonify, request
+from sqlalchemy import event
+
+from log_pipeline import get_logger
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)", re.IGNORECASE)
+_PARAM = re.compile(r"(?:%\(\w+\)s|:\w+|\$\d+|%s)")
+_SPACE = re.compile(r"\s+")
+
+logger = get_logger("sql")
+
+# The log of the request or socket event being handled; a context variable rather
+# than `g`, so statements run under a nested app context are still charged to it
+_current = ContextVar("sql_profile", default=None)
+
+
+def fingerprint(statement):
+    """Normalize a SQL statement so that the same query with other values compares equal"""
+    statement = _STRING.sub("?", statement)
+    statement = _PARAM.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("IN (...)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+class QueryLog:
+    """SQL statements run by one request, socket event or test"""
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = []  # [(fingerprint, statement, seconds)]
+
+    def add(self, statement, seconds):
+        self.queries.append((fingerprint(statement), statement, seconds))
+
+    @property
+    def total_time(self):
+        return sum(seconds for _, _, seconds in self.queries)
+
+    def repeated(self, threshold):
+        """Fingerprints run at least `threshold` times: likely N+1 patterns"""
+        counts = Counter(fp for fp, _, _ in self.queries)
+        return {fp: n for fp, n in counts.items() if n >= threshold}
+
+    def describe(self, threshold=2):
+        lines = [f"{len(self.queries)} queries in {self.total_time * 1000:.1f} ms for {self.name}"]
+        for fp, n in sorted(self.repeated(threshold).items(), key=lambda item: -item[1]):
+            lines.append(f"  {n}x {fp}")
+        return "\n".join(lines)
+
+
+def listen(engine, on_query):
+    """Call `on_query(statement, seconds)` for every statement `engine` (an Engine or the Engine class) runs"""
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("sql_profile_started", []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        on_query(statement, time.perf_counter() - conn.info["sql_profile_started"].pop())
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+    return before, after
+
+
+class SQLProfiler:
+    """Opt-in per-request SQL profiling with N+1 detection
+
+    With `SQL_PROFILING` on, every statement run while handling a request or
+    Socket.IO event is recorded with its time and a normalized fingerprint. A
+    fingerprint repeated `SQL_N_PLUS_ONE_THRESHOLD` times within one handler is
+    reported as an N+1 suspect. Per-endpoint totals are served at
+    `/debug/sql-profile`; with `SQL_PROFILE_HEADERS` each response also carries
+    `X-SQL-Queries`, `X-SQL-Time-Ms` and `X-SQL-N-Plus-One`.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.enabled = False
+        self.headers = False
+        self.threshold = 3
+        self._reports = {}  # {handler: {...}}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.enabled = app.config.get("SQL_PROFILING", False)
+        self.headers = app.config.get("SQL_PROFILE_HEADERS", False)
+        self.threshold = app.config.get("SQL_N_PLUS_ONE_THRESHOLD", 3)
+        app.sql_profiler = self
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule("/debug/sql-profile", "sql_profile", self.report)
+        with app.app_context():
+            for engine in db.engines.values():
+                listen(engine, self._on_query)
+
+    def socket_handler(self, name, handler):
+        """Wrap a Socket.IO handler so its statements are profiled"""
+        if not self.enabled:
+            return handler
+
+        def profiled(*args):
+            log = QueryLog(f"socket:{name}")
+            token = _current.set(log)
+            try:
+                return handler(*args)
+            finally:
+                _current.reset(token)
+                self._finish(log)
+        profiled.__name__ = handler.__name__
+        return profiled
+
+    def report(self):
+        """Per-endpoint query counts and times, most expensive first, with N+1 suspects"""
+        with self._lock:
+            reports = [dict(entry, handler=handler, suspects=dict(entry["suspects"].most_common(10)))
+                       for handler, entry in self._reports.items()]
+        reports.sort(key=lambda entry: -entry["total_time_ms"])
+        return jsonify({"threshold": self.threshold, "handlers": reports})
+
+    def _on_query(self, statement, seconds):
+        # Background threads (writer, flushes) have no handler to charge
+        log = _current.get()
+        if log is not None:
+            log.add(statement, seconds)
+
+    def _before_request(self):
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        _current.set(QueryLog(f"{request.method} {route}"))
+
+    def _after_request(self, response):
+        log = _current.get()
+        if log is None:
+            return response
+        _current.set(None)
+        suspects = self._finish(log)
+        if self.headers:
+            response.headers["X-SQL-Queries"] = str(len(log.queries))
+            response.headers["X-SQL-Time-Ms"] = f"{log.total_time * 1000:.2f}"
+            response.headers["X-SQL-N-Plus-One"] = str(len(suspects))
+        return response
+
+    def _finish(self, log):
+        suspects = log.repeated(self.threshold)
+        if suspects:
+            logger.warning("Possible N+1: %s", log.describe(self.threshold))
+        with self._lock:
+            entry = self._reports.setdefault(log.name, {
+                "requests": 0, "queries": 0, "max_queries": 0, "total_time_ms": 0.0, "suspects": Counter()
+            })
+            entry["requests"] += 1
+            entry["queries"] += len(log.queries)
+            entry["max_queries"] = max(entry["max_queries"], len(log.queries))
+            entry["total_time_ms"] += log.total_time * 1000
+            entry["suspects"].update(suspects.keys())
+        return suspects
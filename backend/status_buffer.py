@@ -0,0 +1,98 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+
+from concurrency import run_blocking
+from log_pipeline import get_logger
+from sync import USERS, bump_versions
+
+log = get_logger('status')
+
+
+class StatusBuffer:
+    """Write-behind buffer for users' `is_online` / `last_seen`
+
+    Status pings only update an in-memory entry per user; a background thread
+    writes every changed user in one bulk UPDATE each `STATUS_FLUSH_INTERVAL`
+    seconds (and at shutdown), so these tiny writes stop competing with message
+    inserts for the write lock. Reads use the database, so every worker serves
+    the same status (and users ETag) and a change shows up once it is flushed.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 2.0
+        self._pending = {}  # {user_id: {'is_online': bool, 'last_seen': datetime or None}}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get("STATUS_FLUSH_INTERVAL", 2.0)
+        app.status_buffer = self
+        # Write out anything still buffered when the process exits
+        atexit.register(self.flush)
+
+    def record(self, user_id, is_online):
+        """Buffer a status change; going offline also stamps `last_seen`"""
+        self._ensure_started()
+        with self._lock:
+            entry = self._pending.setdefault(user_id, {'is_online': is_online, 'last_seen': None})
+            entry['is_online'] = is_online
+            if not is_online:
+                entry['last_seen'] = datetime.utcnow()
+
+    def flush(self):
+        """Write every buffered change in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                entries, self._pending = self._pending, {}
+            try:
+                run_blocking(self._commit, entries)
+            except Exception:
+                log.exception('Error flushing online status')
+                # Keep the failed entries unless a newer change replaced them meanwhile
+                with self._lock:
+                    for user_id, entry in entries.items():
+                        self._pending.setdefault(user_id, entry)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="status-buffer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def _commit(self, entries):
+        table = self.app.User.__table__
+        online_only = [{'b_id': user_id, 'is_online': entry['is_online']}
+                       for user_id, entry in entries.items() if entry['last_seen'] is None]
+        with_last_seen = [{'b_id': user_id, 'is_online': entry['is_online'], 'last_seen': entry['last_seen']}
+                          for user_id, entry in entries.items() if entry['last_seen'] is not None]
+        with self.app.app_context():
+            session = self.app.db.session
+            try:
+                if online_only:
+                    session.execute(update(table).where(table.c.id == bindparam('b_id'))
+                                    .values(is_online=bindparam('is_online')), online_only)
+                if with_last_seen:
+                    session.execute(update(table).where(table.c.id == bindparam('b_id'))
+                                    .values(is_online=bindparam('is_online'), last_seen=bindparam('last_seen')),
+                                    with_last_seen)
+                bump_versions(session, USERS)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
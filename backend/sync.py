@@ -0,0 +1,88 @@
+import hashlib
+
+from flask import request, make_response
+from sqlalchemy import text
+
+from compression import etag_variants
+
+# Resources clients re-sync after reconnecting; each has a row in change_version
+CHANNELS = "channels"
+USERS = "users"
+
+
+def channel_resource(channel_id):
+    """Version key for a channel's history (new messages and reaction changes)"""
+    return f"channel:{channel_id}"
+
+
+def channel_sequence(channel_id):
+    """Counter numbering a channel's messages, for the `seq` of live `new_message` events"""
+    return f"channel:{channel_id}:messages"
+
+
+def advance_sequence(session, resource, count):
+    """Reserve the next `count` numbers of a counter inside the caller's transaction; returns the last one
+
+    The counter's row stays locked until the caller commits, so numbers are
+    handed out in commit order.
+    """
+    session.execute(text(
+        "INSERT INTO change_version (resource, version) VALUES (:resource, :count) "
+        "ON CONFLICT (resource) DO UPDATE SET version = change_version.version + :count"
+    ), {"resource": resource, "count": count})
+    return get_version(session, resource)
+
+
+def bump_versions(session, *resources):
+    """Bump resource versions inside the caller's transaction (commit is up to the caller)"""
+    for resource in set(resources):
+        session.execute(text(
+            "INSERT INTO change_version (resource, version) VALUES (:resource, 1) "
+            "ON CONFLICT (resource) DO UPDATE SET version = change_version.version + 1"
+        ), {"resource": resource})
+
+
+def get_version(session, resource):
+    row = session.execute(text("SELECT version FROM change_version WHERE resource = :resource"),
+                          {"resource": resource}).first()
+    return row[0] if row else 0
+
+
+def live_channel_version(session, channel_id):
+    """A channel's history version, or None if the channel doesn't exist or is being deleted
+
+    One query, so checking the channel costs history reads nothing extra.
+    """
+    row = session.execute(text(
+        "SELECT coalesce(change_version.version, 0) FROM channel "
+        "LEFT JOIN change_version ON change_version.resource = :resource "
+        "WHERE channel.id = :channel_id AND channel.deleted_at IS NULL"
+    ), {"resource": channel_resource(channel_id), "channel_id": channel_id}).first()
+    return row[0] if row else None
+
+
+def conditional_response(session, resource, build, *vary, version=None):
+    """Serve `build()` with an ETag for the resource's current version, or 304 if the client has it
+
+    `vary` lists anything else the body depends on (current user, query string).
+    Pass `version` if the caller has already read it.
+    """
+    if version is None:
+        version = get_version(session, resource)
+    key = ":".join([resource, str(version)] + [str(v) for v in vary])
+    etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+
+    # Compressed bodies carry the coding in their ETag; any of them is the same version
+    matched = next((tag for tag in etag_variants(etag) if request.if_none_match.contains(tag)), None)
+    if matched is not None:
+        response = make_response("", 304)
+        response.set_etag(matched)
+        response.vary.add("Accept-Encoding")
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+        response.set_etag(etag)
+    # Let browsers cache but always revalidate, so unchanged resources cost a 304
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
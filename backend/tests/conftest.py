@@ -0,0 +1,63 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+from itertools import count
+
+import pytest
+
+# The app reads its configuration from the environment when it is imported and created
+WORKDIR = tempfile.mkdtemp(prefix="teamchat-tests-")
+os.environ.update(
+    DATABASE_URL="sqlite:///" + os.path.join(WORKDIR, "chat.db"),
+    ARCHIVE_DIR=os.path.join(WORKDIR, "archive"),
+    AUTO_MIGRATE="1",
+    SOCKETIO_ASYNC_MODE="threading",
+    PASSWORD_HASH_WORKERS="0",
+    PASSWORD_HASH_METHOD="pbkdf2:sha256:1000",
+    LOG_LEVEL="WARNING",
+    JWT_SECRET_KEY="test-secret-key-that-is-long-enough-for-hs256",
+)
+
+_names = count(1)
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope="session")
+def users(app):
+    """Two registered users as {username: (user_id, request headers)}"""
+    client = app.test_client()
+    found = {}
+    for username in ("alice", "bob"):
+        client.post("/auth/register", json={"username": username, "password": "password1"})
+        token = client.post("/auth/login", json={"username": username, "password": "password1"}).get_json()["token"]
+        with app.app_context():
+            user_id = app.User.query.filter_by(username=username).one().id
+        found[username] = (user_id, {"Authorization": "Bearer " + token})
+    return found
+
+
+@pytest.fixture
+def make_channel(app):
+    """Create a channel with `messages` messages `step` apart, oldest first; returns (channel_id, [message ids])"""
+    def make(messages=0, user_id=1, start=None, step=timedelta(minutes=1)):
+        start = start or datetime.utcnow() - step * messages
+        with app.app_context():
+            channel = app.Channel(name=f"test channel {next(_names)}")
+            app.db.session.add(channel)
+            app.db.session.flush()
+            rows = [app.Message(content=f"message {i}", user_id=user_id, channel_id=channel.id,
+                                timestamp=start + step * i) for i in range(messages)]
+            app.db.session.add_all(rows)
+            app.db.session.commit()
+            return channel.id, [row.id for row in rows]
+    return make
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from archive import ArchiveConflict, archive_channel, restore_channel
+
+PAGE_SIZE = 37
+
+
+def read_pages(client, headers, channel_id, params, cursor_name):
+    pages, cursor = [], None
+    while True:
+        query = dict(params)
+        if cursor is not None:
+            query[cursor_name] = cursor
+        body = client.get(f"/chat/channels/{channel_id}/messages", query_string=query, headers=headers).get_json()
+        pages.append(body["messages"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def read_history(client, headers, channel_id):
+    """Every way of reading a channel's history: all=true, and before=, after= and since= paging"""
+    full = client.get(f"/chat/channels/{channel_id}/messages?all=true", headers=headers).get_json()
+    backwards = [message for page in reversed(read_pages(client, headers, channel_id, {"limit": PAGE_SIZE}, "before"))
+                 for message in page]
+    forwards = [full[0]] + [message for page in read_pages(client, headers, channel_id,
+                                                           {"limit": PAGE_SIZE, "after": full[0]["id"]}, "after")
+                            for message in page]
+    since = [message for page in read_pages(client, headers, channel_id, {"limit": PAGE_SIZE, "since": 0}, "since")
+             for message in page]
+    return {"all": full, "before": backwards, "after": forwards, "since": since}
+
+
+@pytest.fixture
+def small_blocks(app, monkeypatch):
+    monkeypatch.setattr(app.message_archive, "block_size", 50)
+
+
+def test_history_reads_the_same_while_archived_and_after_restore(app, client, users, make_channel, small_blocks):
+    user_id, headers = users["alice"]
+    # A year of history, one message every ~18 hours, some with reactions
+    channel_id, ids = make_channel(500, user_id, step=timedelta(days=365) / 500)
+    for message_id in ids[::7]:
+        client.post(f"/chat/messages/{message_id}/reactions", json={"emoji": "👍"}, headers=users["bob"][1])
+
+    expected = read_history(client, headers, channel_id)
+    with app.app_context():
+        archived = archive_channel(app, channel_id, datetime.utcnow() - timedelta(days=90))
+    assert archived > 300
+    assert read_history(client, headers, channel_id) == expected
+
+    with app.app_context():
+        assert restore_channel(app, channel_id) == archived
+    assert read_history(client, headers, channel_id) == expected
+    assert not app.message_archive.index(channel_id)
+
+
+def test_archived_message_ids_are_never_reused(app, client, users, make_channel):
+    user_id, headers = users["alice"]
+    channel_id, archived_ids = make_channel(3, user_id, start=datetime.utcnow() - timedelta(days=200))
+    # The newest message overall lives in another channel, which is then deleted
+    other_channel_id, other_ids = make_channel(1, user_id)
+    assert other_ids[0] > max(archived_ids)
+    with app.app_context():
+        assert archive_channel(app, channel_id, datetime.utcnow() - timedelta(days=90)) == 3
+    assert client.delete(f"/chat/channels/{other_channel_id}", headers=headers).status_code == 200
+
+    response = client.post("/chat/messages", json={"channel_id": channel_id, "content": "after the purge"},
+                           headers=headers)
+    assert response.get_json()["message_id"] > other_ids[0]
+    history = client.get(f"/chat/channels/{channel_id}/messages?all=true", headers=headers).get_json()
+    assert [message["content"] for message in history] == ["message 0", "message 1", "message 2", "after the purge"]
+
+
+def test_restore_refuses_ids_taken_by_other_messages(app, users, make_channel):
+    user_id, headers = users["alice"]
+    channel_id, ids = make_channel(3, user_id, start=datetime.utcnow() - timedelta(days=200))
+    other_channel_id, _ = make_channel()
+    with app.app_context():
+        archive_channel(app, channel_id, datetime.utcnow() - timedelta(days=90))
+        # e.g. a database restored from a backup taken before the archive run
+        app.db.session.add(app.Message(id=ids[1], content="impostor", user_id=user_id, channel_id=other_channel_id))
+        app.db.session.commit()
+        with pytest.raises(ArchiveConflict):
+            restore_channel(app, channel_id)
+        assert [message.id for message in app.message_archive.all(channel_id)] == ids
+        assert app.Message.query.filter(app.Message.id.in_([ids[0], ids[2]])).count() == 0
@@ -0,0 +1,88 @@
+import time
+
+import routes
+from app import socketio
+from channel_deletion import hide_channel
+
+
+def hide(app, channel_id):
+    """Hide a channel the way DELETE does, without purging it"""
+    with app.app_context():
+        hide_channel(app.db, app.db.session.get(app.Channel, channel_id))
+        app.db.session.commit()
+
+
+def connect(app, headers):
+    return socketio.test_client(app, auth={"token": headers["Authorization"].split()[1]})
+
+
+def errors(socket):
+    return [event["args"][0]["msg"] for event in socket.get_received() if event["name"] == "error"]
+
+
+def test_history_of_deleted_channel_is_not_found(app, client, users, make_channel):
+    _, headers = users["alice"]
+    channel_id, _ = make_channel(messages=3)
+    assert client.get(f"/chat/channels/{channel_id}/messages", headers=headers).status_code == 200
+
+    hide(app, channel_id)
+    for query in ("", "?all=true", "?since=0"):
+        response = client.get(f"/chat/channels/{channel_id}/messages{query}", headers=headers)
+        assert response.status_code == 404
+    assert client.get("/chat/channels/999999/messages", headers=headers).status_code == 404
+
+
+def test_deletion_status(app, client, users, make_channel):
+    _, headers = users["alice"]
+    channel_id, _ = make_channel(messages=3)
+    assert client.get(f"/chat/channels/{channel_id}/deletion", headers=headers).status_code == 404
+
+    assert client.delete(f"/chat/channels/{channel_id}", headers=headers).status_code == 200
+    response = client.get(f"/chat/channels/{channel_id}/deletion", headers=headers)
+    assert response.status_code == 200 and response.get_json() == {"status": "deleted"}
+    # An id that never existed isn't reported as deleted
+    assert client.get("/chat/channels/999999/deletion", headers=headers).status_code == 404
+
+
+def test_sockets_cannot_join_or_post_to_deleted_channels(app, users, make_channel):
+    _, headers = users["alice"]
+    channel_id, _ = make_channel(messages=1)
+    socket = connect(app, headers)
+    try:
+        assert "messages" in socket.emit("join_channel", {"channel_id": channel_id}, callback=True)
+        socket.get_received()
+
+        hide(app, channel_id)
+        socket.emit("send_message", {"channel_id": channel_id, "content": "anyone here?"})
+        app.message_writer.flush(5)
+        assert errors(socket) == ["Channel not found"]
+        with app.app_context():
+            assert app.Message.query.filter_by(channel_id=channel_id).count() == 1
+
+        other = connect(app, headers)
+        try:
+            assert other.emit("join_channel", {"channel_id": channel_id}, callback=True) == \
+                {"error": "Channel not found"}
+            assert errors(other) == ["Channel not found"]
+        finally:
+            other.disconnect()
+    finally:
+        socket.disconnect()
+
+
+def test_failed_purge_finishes_in_the_background(app, client, users, make_channel, monkeypatch):
+    _, headers = users["alice"]
+    channel_id, _ = make_channel(messages=3)
+
+    def broken(app, channel_id):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(routes, "purge_channel", broken)
+    response = client.delete(f"/chat/channels/{channel_id}", headers=headers)
+    assert response.status_code == 202
+
+    for _ in range(100):
+        if client.get(f"/chat/channels/{channel_id}/deletion", headers=headers).get_json() == {"status": "deleted"}:
+            break
+        time.sleep(0.05)
+    else:
+        raise AssertionError("channel was never purged")
@@ -0,0 +1,45 @@
+import gzip
+import json
+
+import pytest
+
+
+def test_each_coding_gets_its_own_etag(client, users, make_channel):
+    _, headers = users["alice"]
+    channel_id, _ = make_channel(messages=60)
+    url = f"/chat/channels/{channel_id}/messages"
+
+    plain = client.get(url, headers={**headers, "Accept-Encoding": "identity"})
+    zipped = client.get(url, headers={**headers, "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in plain.headers
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(zipped.get_data())) == plain.get_json()
+
+    etag, weak = plain.get_etag()
+    assert not weak
+    assert zipped.get_etag() == (etag + "-gzip", False)
+
+    # Revalidating either representation answers 304 with the tag the client holds
+    for held, encoding in ((etag, "identity"), (etag + "-gzip", "gzip")):
+        response = client.get(url, headers={**headers, "Accept-Encoding": encoding, "If-None-Match": f'"{held}"'})
+        assert response.status_code == 304
+        assert response.get_etag() == (held, False)
+        assert "Accept-Encoding" in response.vary
+
+
+def test_brotli_gets_its_own_etag(client, users, make_channel):
+    brotli = pytest.importorskip("brotli")
+    _, headers = users["alice"]
+    channel_id, _ = make_channel(messages=60)
+    url = f"/chat/channels/{channel_id}/messages"
+
+    plain = client.get(url, headers={**headers, "Accept-Encoding": "identity"})
+    compressed = client.get(url, headers={**headers, "Accept-Encoding": "gzip, br"})
+    assert compressed.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(compressed.get_data())) == plain.get_json()
+
+    etag, _ = plain.get_etag()
+    assert compressed.get_etag() == (etag + "-br", False)
+    response = client.get(url, headers={**headers, "Accept-Encoding": "br", "If-None-Match": f'"{etag}-br"'})
+    assert response.status_code == 304
+    assert response.get_etag() == (etag + "-br", False)
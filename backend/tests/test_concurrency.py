@@ -0,0 +1,35 @@
+import threading
+from contextvars import ContextVar
+
+import pytest
+
+import concurrency
+
+request_id = ContextVar("request_id")
+
+
+@pytest.fixture
+def gevent_mode(monkeypatch):
+    pytest.importorskip("gevent")
+    monkeypatch.setattr(concurrency, "ASYNC_MODE", "gevent")
+
+
+def test_blocking_runs_on_the_thread_pool_in_the_callers_context(gevent_mode):
+    @concurrency.blocking
+    def handler():
+        return threading.get_ident(), request_id.get()
+
+    request_id.set("abc")
+    thread, seen = handler()
+    assert thread != threading.get_ident()
+    assert seen == "abc"
+
+
+def test_iterate_blocking_yields_every_item_and_stops(gevent_mode):
+    def chunks():
+        for i in range(3):
+            yield i, threading.get_ident()
+
+    items = list(concurrency.iterate_blocking(chunks()))
+    assert [i for i, _ in items] == [0, 1, 2]
+    assert all(thread != threading.get_ident() for _, thread in items)
@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy import event
+
+
+def react(client, headers, message_ids, emoji="👍"):
+    for message_id in message_ids:
+        assert client.post(f"/chat/messages/{message_id}/reactions", json={"emoji": emoji}, headers=headers).status_code == 201
+
+
+@pytest.fixture(params=["buffered", "unbuffered"])
+def recent_buffer(request, app, monkeypatch):
+    """Run a test with the in-memory recent history on (cold) and off"""
+    if request.param == "unbuffered":
+        monkeypatch.setattr(app.recent_messages, "capacity", 0)
+    return request.param
+
+
+@pytest.mark.parametrize("messages", [5, 60])
+def test_history_page_runs_a_fixed_number_of_queries(client, users, make_channel, query_budget, recent_buffer, messages):
+    user_id, headers = users["alice"]
+    channel_id, ids = make_channel(messages, user_id)
+    react(client, headers, ids[-3:])
+    react(client, users["bob"][1], ids[-2:], "🎉")
+
+    # The channel version and one query for messages with their authors and reaction summaries
+    with query_budget(2):
+        response = client.get(f"/chat/channels/{channel_id}/messages", headers=headers)
+    body = response.get_json()
+    assert len(body["messages"]) == min(messages, 50)
+    assert body["messages"][-1]["reactions"] == {"👍": ["You"], "🎉": ["bob"]}
+
+
+def test_older_page_runs_a_fixed_number_of_queries(client, users, make_channel, query_budget, recent_buffer):
+    user_id, headers = users["alice"]
+    channel_id, ids = make_channel(300, user_id)
+
+    # The version, the cursor message and the page (the buffer only holds the latest 200)
+    with query_budget(3):
+        body = client.get(f"/chat/channels/{channel_id}/messages?before={ids[50]}&limit=20", headers=headers).get_json()
+    assert [message["id"] for message in body["messages"]] == ids[30:50]
+    assert body["next_cursor"] == ids[30]
+
+
+def test_reaction_takes_the_username_from_the_token(client, users, make_channel, query_budget):
+    user_id, headers = users["alice"]
+    _, ids = make_channel(1, user_id)
+    with query_budget() as log:
+        react(client, headers, ids)
+    assert not any('FROM user' in statement for _, statement, _ in log.queries), log.describe()
+
+
+def test_reaction_to_missing_message_is_not_found_with_foreign_keys(app, client, users):
+    _, headers = users["alice"]
+    with app.app_context():
+        engine = app.db.engine
+
+    # As on PostgreSQL, where the insert itself fails the foreign key check
+    def enforce(dbapi_connection, record, proxy):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+    event.listen(engine, "checkout", enforce)
+    try:
+        response = client.post("/chat/messages/999999/reactions", json={"emoji": "👍"}, headers=headers)
+    finally:
+        event.remove(engine, "checkout", enforce)
+    assert response.status_code == 404
@@ -0,0 +1,11 @@
+from metrics import Metrics
+
+
+def test_registering_a_gauge_again_replaces_it():
+    metrics = Metrics()
+    metrics.gauge("cache_entries", "Entries in the cache", lambda: 1)
+    metrics.gauge("cache_entries", "Entries in the cache", lambda: 2)
+
+    lines = metrics.render().get_data(as_text=True).splitlines()
+    assert [line for line in lines if line.startswith("cache_entries")] == ["cache_entries 2"]
+    assert lines.count("# TYPE cache_entries gauge") == 1
@@ -0,0 +1,7 @@
+from flask_migrate import check
+
+
+def test_models_match_migrations(app):
+    """`flask db check` finds nothing to autogenerate once the database is upgraded"""
+    with app.app_context():
+        check()
@@ -0,0 +1,58 @@
+from message_writer import PendingMessage
+
+
+def test_post_message(app, client, users, make_channel):
+    _, headers = users["alice"]
+    channel_id, _ = make_channel()
+    response = client.post("/chat/messages", json={"channel_id": channel_id, "content": "hello"}, headers=headers)
+    assert response.status_code == 201
+    with app.app_context():
+        assert app.db.session.get(app.Message, response.get_json()["message_id"]).content == "hello"
+
+
+def test_slow_write_is_accepted_not_failed(app, client, users, make_channel, monkeypatch):
+    _, headers = users["alice"]
+    channel_id, _ = make_channel()
+    # The write outlives the request's wait, as behind a batch stuck on the database lock
+    monkeypatch.setattr(PendingMessage, "wait", lambda self, timeout=None: False)
+    monkeypatch.setattr(PendingMessage, "done", False)
+    response = client.post("/chat/messages", json={"channel_id": channel_id, "content": "slow"}, headers=headers)
+    assert response.status_code == 202
+    assert response.get_json()["status"] == "pending"
+
+    monkeypatch.undo()
+    app.message_writer.flush(5)
+    with app.app_context():
+        assert app.Message.query.filter_by(channel_id=channel_id, content="slow").count() == 1
+
+
+def test_cache_failure_after_commit_writes_each_row_once(app, users, make_channel, monkeypatch):
+    user_id, _ = users["alice"]
+    channel_id, _ = make_channel()
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("buffer broke")
+    monkeypatch.setattr(app.recent_messages, "append", broken)
+    # Queued together so they commit as one batch, which a failure would retry row by row
+    pending = [app.message_writer.submit(user_id, channel_id, f"batched {i}", username="alice") for i in range(3)]
+    app.message_writer.flush(5)
+
+    assert all(p.error is None and p.id is not None for p in pending)
+    with app.app_context():
+        assert app.Message.query.filter_by(channel_id=channel_id).count() == 3
+
+
+def test_post_returns_its_connection_before_waiting(app, client, users, make_channel, monkeypatch):
+    _, headers = users["alice"]
+    channel_id, _ = make_channel()
+    wait = PendingMessage.wait
+    holding = []
+
+    # Every waiting request holding a pooled connection would starve the writer of one
+    def recording_wait(self, timeout=None):
+        holding.append(app.db.session().in_transaction())
+        return wait(self, timeout)
+    monkeypatch.setattr(PendingMessage, "wait", recording_wait)
+    response = client.post("/chat/messages", json={"channel_id": channel_id, "content": "hello"}, headers=headers)
+    assert response.status_code == 201
+    assert holding == [False]
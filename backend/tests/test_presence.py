@@ -0,0 +1,36 @@
+from presence import MemoryPresenceStore
+
+
+def test_readding_a_socket_only_renews_its_lease():
+    store = MemoryPresenceStore()
+    assert store.add(1, 7, "alice", "sid-a", ttl=30) == 1
+    assert store.add(1, 7, "alice", "sid-a", ttl=30) is None
+    assert store.add(1, 7, "alice", "sid-b", ttl=30) is None
+    assert store.snapshot(1) == ({"7": "alice"}, 1)
+
+    assert store.remove(1, 7, "sid-a") is None
+    assert store.remove(1, 7, "sid-b") == 2
+    assert store.snapshot(1) == ({}, 2)
+
+
+def test_string_and_numeric_channel_ids_share_one_room(app, users, make_channel):
+    from app import socketio
+
+    channel_id, _ = make_channel()
+    _, alice_headers = users["alice"]
+    _, bob_headers = users["bob"]
+    alice = socketio.test_client(app, auth={"token": alice_headers["Authorization"].split()[1]})
+    bob = socketio.test_client(app, auth={"token": bob_headers["Authorization"].split()[1]})
+    try:
+        joined = alice.emit("join_channel", {"channel_id": channel_id}, callback=True)
+        assert joined["channel_id"] == channel_id
+        alice.get_received()
+
+        joined = bob.emit("join_channel", {"channel_id": str(channel_id)}, callback=True)
+        assert joined["channel_id"] == channel_id
+        assert set(joined["presence"]["users"]) == {str(users["alice"][0]), str(users["bob"][0])}
+        deltas = [event["args"][0] for event in alice.get_received() if event["name"] == "presence_delta"]
+        assert [(delta["channel_id"], delta["online"]) for delta in deltas] == [(channel_id, True)]
+    finally:
+        alice.disconnect()
+        bob.disconnect()
@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from routes import load_reactions
+
+
+@contextmanager
+def captured_statements(engine):
+    """Collect (statement, parameters) for every statement the engine runs inside the block"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def engine_of(app):
+    with app.app_context():
+        return app.db.engine
+
+
+def query_plan(engine, statement, parameters):
+    with engine.connect() as connection:
+        # Plan with statistics, as on a migrated database (0002 runs ANALYZE)
+        connection.exec_driver_sql("ANALYZE")
+        return [row[3] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+
+
+def test_history_pages_search_the_channel_timestamp_index(app, client, users, make_channel, monkeypatch):
+    user_id, headers = users["alice"]
+    channel_id, ids = make_channel(120, user_id)
+    monkeypatch.setattr(app.recent_messages, "capacity", 0)
+    engine = engine_of(app)
+
+    for query in ("", f"?before={ids[60]}", f"?after={ids[60]}"):
+        with captured_statements(engine) as statements:
+            assert client.get(f"/chat/channels/{channel_id}/messages{query}", headers=headers).status_code == 200
+        pages = [(statement, parameters) for statement, parameters in statements
+                 if "FROM message JOIN user" in statement and "ORDER BY message.timestamp" in statement]
+        assert len(pages) == 1, query
+        plan = query_plan(engine, *pages[0])
+        assert any(step.startswith("SEARCH message USING") and "ix_message_channel_timestamp_id (channel_id=?" in step
+                   for step in plan), plan
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_reaction_lookup_searches_by_message_id(app, client, users, make_channel):
+    user_id, headers = users["alice"]
+    channel_id, ids = make_channel(10, user_id)
+    for message_id in ids[:3]:
+        client.post(f"/chat/messages/{message_id}/reactions", json={"emoji": "👍"}, headers=headers)
+    engine = engine_of(app)
+
+    with app.test_request_context(), captured_statements(engine) as statements:
+        grouped = load_reactions(ids[:3], user_id)
+    assert grouped == {message_id: {"👍": ["You"]} for message_id in ids[:3]}
+    assert len(statements) == 1
+    plan = query_plan(engine, *statements[0])
+    # Either side may drive the join, but reactions are always found through message_id
+    assert any(step.startswith("SEARCH reaction USING") and "(message_id=?" in step for step in plan), plan
+    assert not any(step.startswith("SCAN reaction") for step in plan), plan
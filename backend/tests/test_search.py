@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from archive import archive_channel, restore_channel
+from channel_deletion import hide_channel
+from search import FTS5SearchIndex, LikeSearchIndex
+
+
+@pytest.fixture(params=["fts5", "like"])
+def search_backend(request, app, monkeypatch):
+    if request.param == "like":
+        monkeypatch.setattr(app, "search_index",
+                            LikeSearchIndex(app.db, app.Message, app.User, app.Channel, app.message_archive))
+    else:
+        assert isinstance(app.search_index, FTS5SearchIndex)
+    return request.param
+
+
+def post(app, channel_id, user_id, content, timestamp):
+    with app.app_context():
+        message = app.Message(content=content, user_id=user_id, channel_id=channel_id, timestamp=timestamp)
+        app.db.session.add(message)
+        app.db.session.commit()
+        return message.id
+
+
+def search(client, headers, query, channel_id=None):
+    url = f"/chat/channels/{channel_id}/search" if channel_id else "/chat/search"
+    return client.get(url, query_string={"q": query}, headers=headers).get_json()["results"]
+
+
+def test_search_covers_archived_messages(app, client, users, make_channel, search_backend):
+    user_id, headers = users["alice"]
+    channel_id, _ = make_channel()
+    old = post(app, channel_id, user_id, "the zeppelin launch is postponed", datetime.utcnow() - timedelta(days=200))
+    new = post(app, channel_id, user_id, "zeppelin launch rescheduled", datetime.utcnow())
+
+    with app.app_context():
+        assert archive_channel(app, channel_id, datetime.utcnow() - timedelta(days=90)) == 1
+    results = search(client, headers, "zeppelin launch", channel_id)
+    assert sorted(result["id"] for result in results) == [old, new]
+    archived = next(result for result in results if result["id"] == old)
+    assert archived["user"] == "alice" and archived["channel_id"] == channel_id
+    assert "zeppelin" in archived["snippet"]
+    assert old in [result["id"] for result in search(client, headers, "postponed")]
+    # `flask search rebuild` indexes archived messages from the segments
+    with app.app_context():
+        app.search_index.rebuild()
+    assert sorted(result["id"] for result in search(client, headers, "zeppelin launch", channel_id)) == [old, new]
+
+    # Restored messages are found once, through the hot index again
+    with app.app_context():
+        restore_channel(app, channel_id)
+    assert sorted(result["id"] for result in search(client, headers, "zeppelin", channel_id)) == [old, new]
+
+
+def test_deleted_channel_archive_leaves_search(app, client, users, make_channel, search_backend):
+    user_id, headers = users["alice"]
+    channel_id, _ = make_channel()
+    post(app, channel_id, user_id, "quokka sighting in the archive", datetime.utcnow() - timedelta(days=200))
+    with app.app_context():
+        archive_channel(app, channel_id, datetime.utcnow() - timedelta(days=90))
+    assert search(client, headers, "quokka")
+
+    assert client.delete(f"/chat/channels/{channel_id}", headers=headers).status_code == 200
+    assert search(client, headers, "quokka") == []
+
+
+def test_channels_being_deleted_leave_search(app, client, users, make_channel, search_backend):
+    user_id, headers = users["alice"]
+    channel_id, _ = make_channel()
+    post(app, channel_id, user_id, "wombat burrow spotted", datetime.utcnow() - timedelta(days=200))
+    post(app, channel_id, user_id, "wombat burrow again", datetime.utcnow())
+    with app.app_context():
+        archive_channel(app, channel_id, datetime.utcnow() - timedelta(days=90))
+    assert len(search(client, headers, "wombat")) == 2
+
+    # Hidden but not purged yet: neither tier may show up
+    with app.app_context():
+        hide_channel(app.db, app.db.session.get(app.Channel, channel_id))
+        app.db.session.commit()
+    assert search(client, headers, "wombat") == []
+    assert search(client, headers, "wombat", channel_id) == []
@@ -0,0 +1,57 @@
+import time
+
+from flask_jwt_extended import create_access_token
+
+import socket_events
+from app import socketio
+
+
+def expire(token):
+    """Backdate the expiry of every socket session opened with `token`"""
+    for session in socket_events._sessions.values():
+        if session["token"] == token:
+            session["expires"] = time.time() - 1
+
+
+def fresh_token(app, user_id):
+    with app.app_context():
+        return create_access_token(identity=str(user_id), additional_claims={"username": "alice"})
+
+
+def test_socket_is_disconnected_once_its_token_expires(app, users, make_channel):
+    user_id, _ = users["alice"]
+    channel_id, _ = make_channel()
+    token = fresh_token(app, user_id)
+    socket = socketio.test_client(app, auth={"token": token})
+    try:
+        assert "messages" in socket.emit("join_channel", {"channel_id": channel_id, "token": token}, callback=True)
+
+        expire(token)
+        socket.emit("leave_channel", {"channel_id": channel_id, "token": token})
+        assert not socket.is_connected()
+    finally:
+        if socket.is_connected():
+            socket.disconnect()
+
+
+def test_newer_token_renews_an_expired_socket_session(app, users, make_channel):
+    user_id, _ = users["alice"]
+    other_id, _ = users["bob"]
+    channel_id, _ = make_channel()
+    token = fresh_token(app, user_id)
+    socket = socketio.test_client(app, auth={"token": token})
+    try:
+        expire(token)
+        # Someone else's token doesn't keep the session alive
+        joined = socket.emit("join_channel", {"channel_id": channel_id, "token": fresh_token(app, other_id)},
+                             callback=True)
+        assert not socket.is_connected() and "error" in joined
+
+        socket = socketio.test_client(app, auth={"token": token})
+        expire(token)
+        joined = socket.emit("join_channel", {"channel_id": channel_id, "token": fresh_token(app, user_id)},
+                             callback=True)
+        assert socket.is_connected() and joined["channel_id"] == channel_id
+    finally:
+        if socket.is_connected():
+            socket.disconnect()
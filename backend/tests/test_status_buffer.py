@@ -0,0 +1,13 @@
+def test_users_etag_follows_the_flushed_status(app, client, users):
+    user_id, headers = users["alice"]
+    first = client.get("/auth/users", headers=headers)
+
+    # A buffered change is invisible to every worker until it is flushed
+    client.post("/auth/online", json={"is_online": True}, headers=headers)
+    assert client.get("/auth/users", headers={**headers, "If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    app.status_buffer.flush()
+    response = client.get("/auth/users", headers={**headers, "If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != first.headers["ETag"]
+    assert next(user for user in response.get_json() if user["id"] == user_id)["is_online"] is True
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask_jwt_extended import JWTManager
+
+
+class TokenCache:
+    """Bounded LRU cache of verified JWT claims, keyed by a digest of the token
+
+    Entries are only served until the token's `exp`; after that the token goes
+    through full verification again (and is rejected as expired).
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # {digest: (claims, expires_at)}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """Return the cached claims for a token, or None"""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, claims):
+        """Cache verified claims; tokens without `exp`, or not valid yet, are not cached"""
+        if self.max_size <= 0 or "exp" not in claims or claims.get("nbf", 0) > time.time():
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (dict(claims), claims["exp"])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager that skips signature verification for tokens it has already verified
+
+    Every decode goes through `_decode_jwt_from_config`, so both `jwt_required`
+    and `decode_token` (used by the socket handlers) are served from the cache.
+    """
+
+    def __init__(self, app=None, add_context_processor=False):
+        self.token_cache = TokenCache()
+        super().__init__(app, add_context_processor)
+
+    def init_app(self, app, add_context_processor=False):
+        super().init_app(app, add_context_processor)
+        self.token_cache = TokenCache(app.config.get("JWT_CACHE_SIZE", 10000))
+        app.token_cache = self.token_cache
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        # CSRF checks and expired-token decodes always take the full path
+        if csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        claims = self.token_cache.get(encoded_token)
+        if claims is None:
+            claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+            self.token_cache.put(encoded_token, claims)
+        return claims
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from log_pipeline import get_logger
+
+log = get_logger('socket.typing')
+
+
+class TypingTracker:
+    """In-memory typing state per channel with coalesced, throttled broadcasts
+
+    Keystroke events only move a user's "typing until" deadline. A background
+    loop expires stale typists and, at most once per interval, broadcasts each
+    changed channel: one aggregated `typing_status` list plus a `user_typing`
+    event for every user whose state actually flipped since the last broadcast.
+    """
+
+    def __init__(self, socketio, timeout=5.0, interval=0.5, metrics=None):
+        self.socketio = socketio
+        self.metrics = metrics
+        self.timeout = timeout
+        self.interval = interval
+        self._typing = {}     # {channel_id: {user_id: {'username': str, 'sid': str, 'until': float}}}
+        self._announced = {}  # {channel_id: {user_id: (username, sid)}} as of the last broadcast
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """Start the broadcast loop once"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.socketio.start_background_task(self._run)
+
+    def update(self, channel_id, user_id, username, sid, is_typing):
+        """Record a typing event; only start/stop transitions mark the channel for broadcast"""
+        now = time.monotonic()
+        with self._lock:
+            typists = self._typing.setdefault(channel_id, {})
+            if is_typing:
+                if user_id not in typists:
+                    self._dirty.add(channel_id)
+                typists[user_id] = {'username': username, 'sid': sid, 'until': now + self.timeout}
+            elif typists.pop(user_id, None) is not None:
+                self._dirty.add(channel_id)
+            if not typists:
+                del self._typing[channel_id]
+
+    def stop(self, channel_id, user_id):
+        """Clear a user's typing state, e.g. after they send a message or leave"""
+        self.update(channel_id, user_id, None, None, False)
+
+    def flush(self):
+        """Expire stale typists and broadcast every channel whose typing set changed"""
+        now = time.monotonic()
+        updates = []
+        with self._lock:
+            for channel_id, typists in list(self._typing.items()):
+                expired = [user_id for user_id, state in typists.items() if state['until'] <= now]
+                for user_id in expired:
+                    del typists[user_id]
+                if expired:
+                    self._dirty.add(channel_id)
+                if not typists:
+                    del self._typing[channel_id]
+
+            for channel_id in self._dirty:
+                current = {user_id: (state['username'], state['sid'])
+                           for user_id, state in self._typing.get(channel_id, {}).items()}
+                previous = self._announced.get(channel_id, {})
+                started = [current[user_id] for user_id in current if user_id not in previous]
+                stopped = [previous[user_id] for user_id in previous if user_id not in current]
+                if current:
+                    self._announced[channel_id] = current
+                else:
+                    self._announced.pop(channel_id, None)
+                if started or stopped:
+                    updates.append((channel_id, [username for username, sid in current.values()], started, stopped))
+            self._dirty.clear()
+
+        for channel_id, users, started, stopped in updates:
+            room = f'channel_{channel_id}'
+            if self.metrics is not None:
+                self.metrics.observe_fanout(self.socketio, 'typing_status', room)
+            for username, sid in started:
+                self.socketio.emit('user_typing', {'user': username, 'is_typing': True}, to=room, skip_sid=sid)
+            for username, sid in stopped:
+                self.socketio.emit('user_typing', {'user': username, 'is_typing': False}, to=room, skip_sid=sid)
+            self.socketio.emit('typing_status', {'channel_id': channel_id, 'users': users}, to=room)
+        return len(updates)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                log.exception('Error broadcasting typing status')
@@ -0,0 +1,8 @@
+# WSGI entry point, e.g. `gunicorn wsgi:app`
+# (or `gunicorn -k gevent -w 1 wsgi:app` with SOCKETIO_ASYNC_MODE=gevent)
+import concurrency
+concurrency.monkey_patch()
+
+from app import create_app
+
+app = create_app()
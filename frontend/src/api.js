@@ -61,7 +61,8 @@ export const authAPI = {
 
 export const chatAPI = {
   getChannels: () => api.get("/chat/channels"),
-  getMessages: (channelId) => api.get(`/chat/channels/${channelId}/messages`),
+  getMessages: (channelId, params) =>
+    api.get(`/chat/channels/${channelId}/messages`, { params }),
   sendMessage: (channelId, message) =>
     api.post(`/chat/channels/${channelId}/messages`, message),
   addReaction: (messageId, emoji) =>
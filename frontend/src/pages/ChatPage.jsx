@@ -59,6 +59,8 @@ const ChatPage = React.memo(function ChatPage() {
   const [showInputEmojiPicker, setShowInputEmojiPicker] = useState(false);
   const [isSidebarOpen, setIsSidebarOpen] = useState(false);
   const [messagesLoading, setMessagesLoading] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null); // id to page back from, null at the start of history
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [deleteConfirm, setDeleteConfirm] = useState({
     show: false,
     channelId: null,
@@ -77,6 +79,8 @@ const ChatPage = React.memo(function ChatPage() {
 
   // Refs
   const messagesContainerRef = useRef(null);
+  const currentChannelRef = useRef(null);
+  const keepScrollRef = useRef(null); // distance from the bottom to restore after older messages are prepended
 
   // Auto-scroll function
   const scrollToBottom = useCallback(() => {
@@ -86,6 +90,12 @@ const ChatPage = React.memo(function ChatPage() {
     }
   }, []);
 
+  // Show a channel's latest page of history (from REST or the join snapshot)
+  const showLatestPage = useCallback((page) => {
+    setMessages(page.messages);
+    setNextCursor(page.next_cursor ?? null);
+  }, []);
+
   // Memoized values for performance
   const currentChannelData = useMemo(() => {
     return Array.isArray(channels)
@@ -268,43 +278,101 @@ const ChatPage = React.memo(function ChatPage() {
 
   // Join channel when currentChannel changes
   useEffect(() => {
+    currentChannelRef.current = currentChannel;
+    setNextCursor(null); // The previous channel's cursor means nothing here
     if (!currentChannel) return;
 
     const token = getToken();
     if (!token) return;
 
-    // Join the channel via WebSocket
+    // Fetch existing messages
+    const fetchMessages = async () => {
+      try {
+        const data = await getMessages(currentChannel);
+        showLatestPage(data.data);
+        // Auto-scroll to bottom after loading messages
+        setTimeout(scrollToBottom, 200);
+      } catch (err) {
+        console.error("Failed to fetch messages:", err);
+        alert("Failed to fetch messages");
+      }
+    };
+
+    // Join the channel via WebSocket; the acknowledgement carries the latest
+    // messages, so the REST fetch is only a fallback
     const joinChannel = async () => {
       try {
         // Wait for WebSocket connection if not already connected
         if (!socketService.isConnected) {
           await socketService.waitForConnection();
         }
-        socketService.joinChannel(currentChannel, token);
+        // The snapshot is shown before messages that raced the join are replayed
+        const snapshot = await socketService.joinChannel(
+          currentChannel,
+          token,
+          showLatestPage
+        );
+        if (snapshot) {
+          setTimeout(scrollToBottom, 200);
+          return;
+        }
       } catch (error) {
         console.error("Failed to join channel:", error);
       }
+      fetchMessages();
     };
 
     joinChannel();
 
-    // Fetch existing messages
-    const fetchMessages = async () => {
-      try {
-        const data = await getMessages(currentChannel);
-        setMessages(data.data);
-        // Auto-scroll to bottom after loading messages
-        setTimeout(scrollToBottom, 200);
-      } catch (err) {
-        console.error("Failed to fetch messages:", err);
-        alert("Failed to fetch messages");
+    // A gap in the channel's message sequence means a message was missed
+    socketService.onMessageGap((channelId) => {
+      if (String(channelId) === String(currentChannel)) {
+        fetchMessages();
       }
-    };
-    fetchMessages();
-  }, [currentChannel, getToken, scrollToBottom]);
+    });
+  }, [currentChannel, getToken, scrollToBottom, showLatestPage]);
+
+  // Load the page of history before the oldest message shown
+  const loadOlderMessages = useCallback(async () => {
+    if (!currentChannel || !nextCursor || loadingOlder) return;
+    const channelId = currentChannel;
+
+    try {
+      setLoadingOlder(true);
+      const data = await getMessages(channelId, { before: nextCursor });
+      if (currentChannelRef.current !== channelId) return; // Switched channels meanwhile
+
+      const container = messagesContainerRef.current;
+      if (container) {
+        keepScrollRef.current = container.scrollHeight - container.scrollTop;
+      }
+      setMessages((prevMessages) => {
+        const shown = new Set(prevMessages.map((msg) => msg.id));
+        return [
+          ...data.data.messages.filter((msg) => !shown.has(msg.id)),
+          ...prevMessages,
+        ];
+      });
+      setNextCursor(data.data.next_cursor ?? null);
+    } catch (err) {
+      console.error("Failed to load older messages:", err);
+      showError(getErrorMessage(err));
+    } finally {
+      setLoadingOlder(false);
+    }
+  }, [currentChannel, nextCursor, loadingOlder, showError]);
 
   // Auto-scroll to bottom when messages change
   useEffect(() => {
+    // Older messages were prepended: keep the ones in view where they were
+    if (keepScrollRef.current !== null) {
+      const container = messagesContainerRef.current;
+      if (container) {
+        container.scrollTop = container.scrollHeight - keepScrollRef.current;
+      }
+      keepScrollRef.current = null;
+      return;
+    }
     if (filteredMessages.length > 0) {
       // Use setTimeout to ensure DOM has updated
       setTimeout(scrollToBottom, 100);
@@ -426,7 +494,7 @@ const ChatPage = React.memo(function ChatPage() {
       await addReaction(messageId, emoji);
       // Refresh messages to show updated reactions
       const data = await getMessages(currentChannel);
-      setMessages(data.data);
+      showLatestPage(data.data);
     } catch (err) {
       console.error("Failed to add reaction:", err);
       // Don't show error for duplicate reactions - this is expected behavior
@@ -445,7 +513,7 @@ const ChatPage = React.memo(function ChatPage() {
       await removeReaction(messageId, emoji);
       // Refresh messages to show updated reactions
       const data = await getMessages(currentChannel);
-      setMessages(data.data);
+      showLatestPage(data.data);
     } catch (err) {
       console.error("Failed to remove reaction:", err);
     }
@@ -479,6 +547,7 @@ const ChatPage = React.memo(function ChatPage() {
         } else {
           setCurrentChannel(null);
           setMessages([]);
+          setNextCursor(null);
         }
       }
 
@@ -783,7 +852,7 @@ const ChatPage = React.memo(function ChatPage() {
 
                   try {
                     const data = await getMessages(channelId);
-                    setMessages(data.data);
+                    showLatestPage(data.data);
                     // Auto-scroll to bottom after loading messages
                     setTimeout(scrollToBottom, 200);
                   } catch (err) {
@@ -913,6 +982,17 @@ const ChatPage = React.memo(function ChatPage() {
             <EmptyMessages />
           ) : (
             <div className="space-y-4">
+              {nextCursor && (
+                <div className="flex justify-center">
+                  <button
+                    onClick={loadOlderMessages}
+                    disabled={loadingOlder}
+                    className="flex items-center gap-2 px-3 py-2 text-sm text-gray-600 dark:text-gray-400 hover:text-gray-800 dark:hover:text-gray-200 hover:bg-gray-100 dark:hover:bg-gray-700 rounded-lg transition-colors disabled:opacity-50"
+                  >
+                    {loadingOlder ? <LoadingDots /> : "Load older messages"}
+                  </button>
+                </div>
+              )}
               {messages.map((m, index) => {
                 const isOptimistic = m.isOptimistic;
                 const showAvatar =
@@ -16,6 +16,11 @@ class SocketService {
     this.connectionListeners = [];
     this.disconnectionListeners = [];
     this.errorListeners = [];
+    this.presence = {}; // { channelId: { seq, users: { userId: username } } }
+    this.messageSeq = {}; // { channelId: seq of the last message seen }
+    this.joining = {}; // { channelId: new_message events that arrived before the join snapshot }
+    this.messageHandler = null;
+    this.messageGapHandler = null;
 
     // Set up online/offline detection
     this.setupOnlineDetection();
@@ -99,7 +104,14 @@ class SocketService {
 
       // Rejoin current channel if we have one
       if (this.currentChannel && this.token) {
-        this.joinChannel(this.currentChannel, this.token);
+        const channelId = this.currentChannel;
+        const lastSeen = this.messageSeq[channelId];
+        this.joinChannel(channelId, this.token).then((snapshot) => {
+          // Messages sent while disconnected are only in the new snapshot
+          if (snapshot && lastSeen !== undefined && snapshot.seq > lastSeen && this.messageGapHandler) {
+            this.messageGapHandler(channelId);
+          }
+        });
       }
 
       // Send any pending messages
@@ -225,11 +237,12 @@ class SocketService {
     }
   }
 
-  // Join a channel
-  joinChannel(channelId, token) {
+  // Join a channel. The snapshot is handed to onSnapshot (if given) before any
+  // message that arrived during the join is delivered, so none is overwritten
+  joinChannel(channelId, token, onSnapshot = null) {
     if (!this.socket || !this.isConnected) {
       console.error("Socket not connected");
-      return;
+      return Promise.resolve(null);
     }
 
     // Leave current channel if any
@@ -237,13 +250,38 @@ class SocketService {
       this.leaveChannel(this.currentChannel);
     }
 
-    this.socket.emit("join_channel", {
-      channel_id: channelId,
-      token: token,
-    });
-
     this.currentChannel = channelId;
-    console.log(`Joined channel ${channelId}`);
+    // The room is joined before the snapshot is read, so live messages can
+    // arrive ahead of the acknowledgement; hold them until it comes
+    const buffered = [];
+    this.joining[channelId] = buffered;
+
+    // The acknowledgement is a snapshot: the latest messages, the presence list
+    // and the sequence number live new_message events continue from
+    return new Promise((resolve) => {
+      this.socket.timeout(10000).emit(
+        "join_channel",
+        { channel_id: channelId, token: token },
+        (err, snapshot) => {
+          if (this.joining[channelId] === buffered) {
+            delete this.joining[channelId];
+          }
+          if (err || !snapshot || snapshot.error) {
+            buffered.forEach((data) => this.deliverMessage(data));
+            resolve(null);
+            return;
+          }
+          this.messageSeq[channelId] = snapshot.seq;
+          console.log(`Joined channel ${channelId}`);
+          if (onSnapshot) {
+            onSnapshot(snapshot);
+          }
+          // Only messages newer than the snapshot get through
+          buffered.forEach((data) => this.deliverMessage(data));
+          resolve(snapshot);
+        }
+      );
+    });
   }
 
   // Leave a channel
@@ -260,6 +298,7 @@ class SocketService {
     if (this.currentChannel === channelId) {
       this.currentChannel = null;
     }
+    delete this.joining[channelId];
     console.log(`Left channel ${channelId}`);
   }
 
@@ -289,13 +328,43 @@ class SocketService {
     });
   }
 
-  // Set up message listener
+  // Set up message listener; events already in the join snapshot are skipped
   onNewMessage(callback) {
+    this.messageHandler = callback;
     if (this.socket) {
-      this.socket.on("new_message", callback);
+      this.socket.on("new_message", (data) => {
+        const buffered = this.joining[data.channel_id];
+        if (buffered) {
+          buffered.push(data); // Delivered once the join snapshot is in
+          return;
+        }
+        this.deliverMessage(data);
+      });
+    }
+  }
+
+  // Hand a new_message event to the listener unless the join snapshot already has it
+  deliverMessage(data) {
+    const cursor = this.messageSeq[data.channel_id];
+    if (cursor !== undefined && data.seq != null) {
+      if (data.seq <= cursor) {
+        return; // Already in the join snapshot
+      }
+      this.messageSeq[data.channel_id] = data.seq;
+      if (data.seq !== cursor + 1 && this.messageGapHandler) {
+        this.messageGapHandler(data.channel_id);
+      }
+    }
+    if (this.messageHandler) {
+      this.messageHandler(data);
     }
   }
 
+  // Called when a channel's message sequence skips ahead (a message was missed)
+  onMessageGap(callback) {
+    this.messageGapHandler = callback;
+  }
+
   // Set up typing indicator listener
   onUserTyping(callback) {
     if (this.socket) {
@@ -319,10 +388,44 @@ class SocketService {
   }
 
   // Set up online status listener
+  // The server sends a presence snapshot on join and numbered deltas after that;
+  // a gap in the sequence means a delta was missed, so a fresh snapshot is requested
   onOnlineStatus(callback) {
-    if (this.socket) {
-      this.socket.on("online_status", callback);
+    if (!this.socket) {
+      return;
     }
+
+    const notify = (channelId) => {
+      const users = this.presence[channelId].users;
+      callback({
+        channel_id: channelId,
+        online_count: Object.keys(users).length,
+        online_users: Object.values(users),
+      });
+    };
+
+    this.socket.on("presence_snapshot", (data) => {
+      this.presence[data.channel_id] = { seq: data.seq, users: { ...data.users } };
+      notify(data.channel_id);
+    });
+
+    this.socket.on("presence_delta", (data) => {
+      const state = this.presence[data.channel_id];
+      if (!state || data.seq <= state.seq) {
+        return; // Already covered by the snapshot
+      }
+      if (data.seq !== state.seq + 1) {
+        this.socket.emit("get_presence", { channel_id: data.channel_id });
+        return;
+      }
+      state.seq = data.seq;
+      if (data.online) {
+        state.users[data.user_id] = data.username;
+      } else {
+        delete state.users[data.user_id];
+      }
+      notify(data.channel_id);
+    });
   }
 
   // Set up connection status listener